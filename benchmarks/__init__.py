@@ -0,0 +1,5 @@
+"""
+Benchmarks for the GatorLibrary command processor and its data structures.
+
+Run a benchmark from the repository root, e.g. python3 -m benchmarks.bench_dispatch
+"""
@@ -0,0 +1,71 @@
+"""
+Throughput of GatorLibrary.apply_batch versus running the same commands one by one.
+"""
+import argparse
+import io
+import random
+import time
+
+from gatorLibrary import GatorLibrary, process_commands
+
+
+def build_library(books):
+    library = GatorLibrary()
+    library.bulk_insert(((book_id, f'"Title {book_id}"', '"Author"', '"Yes"') for book_id in range(1, books + 1)),
+                        presorted=True)
+    return library
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--books", type=int, default=10 ** 6)
+    parser.add_argument("--batches", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--window", type=int, default=0,
+                        help="draw each batch's book ids from a random window of this many ids (0: whole catalog)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    batches = []
+    for _ in range(args.batches):
+        batch = []
+        window = args.window or args.books
+        first_id = rng.randint(1, args.books - window + 1)
+        for _ in range(args.batch_size):
+            book_id = rng.randint(first_id, first_id + window - 1)
+            patron_id = rng.randint(1, 1000)
+            roll = rng.random()
+            if roll < 0.4:
+                batch.append(f"BorrowBook({patron_id}, {book_id}, {rng.randint(1, 5)})")
+            elif roll < 0.8:
+                batch.append(f"ReturnBook({patron_id}, {book_id})")
+            else:
+                batch.append(f"PrintBook({book_id})")
+        batches.append(batch)
+    commands = args.batches * args.batch_size
+
+    library = build_library(args.books)
+    output_file = io.StringIO()
+    start = time.perf_counter()
+    for batch in batches:
+        process_commands(library, batch, output_file)
+    one_by_one = time.perf_counter() - start
+    expected = output_file.getvalue()
+
+    library = build_library(args.books)
+    results = []
+    start = time.perf_counter()
+    for batch in batches:
+        results.extend(library.apply_batch(batch))
+    batched = time.perf_counter() - start
+
+    assert "".join(results) == expected, "apply_batch results differ from sequential execution"
+    print(f"{commands} commands in batches of {args.batch_size} over {args.books} books"
+          f" (window {args.window or args.books})")
+    print(f"one by one   {commands / one_by_one:>12,.0f} commands/sec")
+    print(f"apply_batch  {commands / batched:>12,.0f} commands/sec   ({one_by_one / batched:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Cold-start catalog load time: repeated insert_book calls versus bulk_insert.
+"""
+import argparse
+import random
+import time
+
+from gatorLibrary import GatorLibrary
+
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--books", type=int, default=10 ** 6)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    records = [(book_id, f'"Title {book_id}"', f'"Author {book_id % 5000}"', '"Yes"')
+               for book_id in range(1, args.books + 1)]
+    shuffled = records[:]
+    rng.shuffle(shuffled)
+
+    def repeated_inserts():
+        library = GatorLibrary()
+        for book_id, title, author, availability in shuffled:
+            library.insert_book(book_id, title, author, availability, None)
+
+    def bulk_unsorted():
+        GatorLibrary().bulk_insert(shuffled)
+
+    def bulk_presorted():
+        GatorLibrary().bulk_insert(records, presorted=True)
+
+    baseline = timed(repeated_inserts)
+    print(f"{args.books} books")
+    print(f"repeated insert_book     {baseline:8.2f}s")
+    for name, function in (("bulk_insert, unsorted", bulk_unsorted), ("bulk_insert, presorted", bulk_presorted)):
+        seconds = timed(function)
+        print(f"{name:<24} {seconds:8.2f}s   ({baseline / seconds:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Columnar book metadata (BookCatalog) against the previous layout, where every node held
+its own title, author, availability and borrower: bytes per book and the speed of full
+catalog scans. Records are parsed from InsertBook lines, as a command file would give
+them, so every book starts with its own string objects. Each layout is built and measured
+in a fresh process with tracemalloc, so the figures are the bytes the layout keeps alive,
+then built again without tracing for the timings.
+
+tracemalloc needs memory of its own, about as much again as what it traces; --books 5e6
+needs about 5 GB.
+"""
+import argparse
+import gc
+import multiprocessing
+import time
+import tracemalloc
+
+from gatorLibrary import AVAILABLE, AVAILABLE_CODE, BLACK, BookCatalog, COMMAND_PATTERN, split_arguments
+
+
+class ObjectRBNode:
+    # The node layout before BookCatalog: metadata as attributes of every node
+    __slots__ = ("book_id", "book_name", "author_name", "availability_status", "borrowed_by",
+                 "reservation_heap", "color", "parent", "left", "right", "size", "available", "version")
+
+    def __init__(self, book_id, book_name, author_name, availability_status, borrowed_by, reservation_heap=None,
+                 color=BLACK):
+        self.book_id = book_id
+        self.book_name = book_name
+        self.author_name = author_name
+        self.availability_status = availability_status
+        self.borrowed_by = borrowed_by
+        self.reservation_heap = reservation_heap
+        self.color = color
+        self.parent = self.left = self.right = None
+        self.size = 1
+        self.available = 1 if availability_status == AVAILABLE else 0
+        self.version = 0
+
+    def print_book_details(self):
+        return (f"BookID = {self.book_id}\n"
+                f"Title = {self.book_name}\n"
+                f"Author = {self.author_name}\n"
+                f"Availability = {self.availability_status}\n"
+                f"BorrowedBy = {self.borrowed_by}\n"
+                f"Reservations = {[] if self.reservation_heap is None else self.reservation_heap.in_order()}\n")
+
+
+def parsed_records(num_books, num_authors):
+    for book_id in range(1, num_books + 1):
+        availability = "Yes" if book_id % 3 else "No"
+        line = f'InsertBook({book_id}, "Title {book_id}", "Author {book_id % num_authors}", "{availability}")'
+        arguments = split_arguments(COMMAND_PATTERN.match(line).group(2))
+        yield int(arguments[0]), arguments[1], arguments[2], arguments[3]
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def build(layout, records):
+    if layout == "object":
+        return None, [ObjectRBNode(*record, None) for record in records]
+    catalog = BookCatalog()
+    new_book = catalog.new_book
+    return catalog, [new_book(*record, None) for record in records]
+
+
+def run_layout(layout, num_books, num_authors):
+    """
+    Build num_books books in one layout and return bytes per book and scan timings.
+    """
+    author = f'"Author {num_authors // 2}"'
+    # Records are parsed as the books are built, as when reading a command file
+    tracemalloc.start()
+    built = build(layout, parsed_records(num_books, num_authors))
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del built
+    gc.collect()
+
+    records = list(parsed_records(num_books, num_authors))
+    (catalog, books), load = timed(lambda: build(layout, records))
+    del records
+
+    if layout == "object":
+        scans = {
+            "count available": lambda: sum(book.availability_status == AVAILABLE for book in books),
+            "books by author": lambda: [book for book in books if book.author_name == author],
+            "borrowed books": lambda: [book for book in books if book.borrowed_by is not None],
+        }
+    else:
+        scans = {
+            "count available": lambda: catalog.status_codes.count(AVAILABLE_CODE),
+            "books by author": lambda: catalog.author_rows(author),
+            "borrowed books": catalog.borrowed_rows,
+        }
+    scans["render details"] = lambda: [book.print_book_details() for book in books]
+    result = {"bytes_per_book": held / num_books, "load": load}
+    for name, scan in scans.items():
+        result[name] = timed(scan)[1]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=float, default=1e6)
+    parser.add_argument("--authors", type=int, default=20000)
+    args = parser.parse_args()
+    num_books = int(args.books)
+    # Every author must have a book, or the author scanned for may not exist
+    num_authors = max(1, min(args.authors, num_books))
+
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for layout in ("object", "columnar"):
+        with context.Pool(1) as pool:
+            results[layout] = pool.apply(run_layout, (layout, num_books, num_authors))
+
+    before, after = results["object"], results["columnar"]
+    print(f"{num_books:,} books, {num_authors:,} authors")
+    print(f"{'':<18}{'object':>12}{'columnar':>12}")
+    print(f"{'bytes/book':<18}{before['bytes_per_book']:>12.1f}{after['bytes_per_book']:>12.1f}"
+          f"   ({after['bytes_per_book'] / before['bytes_per_book']:.2f}x the object layout)")
+    # Speedups: below 1 the columnar layout is slower
+    for name in ("load", "count available", "books by author", "borrowed books", "render details"):
+        print(f"{name + ' s':<18}{before[name]:>12.3f}{after[name]:>12.3f}   ({before[name] / after[name]:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
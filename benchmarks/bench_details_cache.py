@@ -0,0 +1,69 @@
+"""
+PrintBook/PrintBooks/FindClosestBook throughput on a Zipf-distributed read workload, with
+the details cache off and at a few sizes, and the cache's hit/miss/eviction counts.
+"""
+import argparse
+import io
+import itertools
+import random
+import time
+
+from gatorLibrary import GatorLibrary, process_commands
+from benchmarks.workload import insert_commands
+
+
+def zipf_commands(num_books, num_ops, exponent, write_fraction, seed=0):
+    """
+    Yield num_ops commands whose book ids follow a Zipf distribution over the books, so a
+    few popular books get most of the requests. write_fraction of them borrow or return.
+    """
+    rng = random.Random(seed)
+    popularity = list(range(1, num_books + 1))
+    rng.shuffle(popularity)
+    cumulative_weights = list(itertools.accumulate(1 / rank ** exponent for rank in range(1, num_books + 1)))
+    book_ids = rng.choices(popularity, cum_weights=cumulative_weights, k=num_ops)
+
+    for book_id in book_ids:
+        roll = rng.random()
+        if roll < write_fraction / 2:
+            yield f"BorrowBook({rng.randint(1, 100)}, {book_id}, {rng.randint(1, 5)})"
+        elif roll < write_fraction:
+            yield f"ReturnBook({rng.randint(1, 100)}, {book_id})"
+        elif roll < 0.7:
+            yield f"PrintBook({book_id})"
+        elif roll < 0.9:
+            yield f"FindClosestBook({book_id})"
+        else:
+            yield f"PrintBooks({book_id}, {book_id + 3})"
+
+
+def run(catalog, lines, cache_size):
+    library = GatorLibrary(cache_size)
+    process_commands(library, catalog, io.StringIO())
+    start = time.perf_counter()
+    process_commands(library, lines, io.StringIO())
+    return time.perf_counter() - start, library.details_cache.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--books", type=int, default=100000)
+    parser.add_argument("--ops", type=int, default=300000)
+    parser.add_argument("--exponent", type=float, default=1.1, help="Zipf exponent")
+    parser.add_argument("--writes", type=float, default=0.05, help="fraction of borrows and returns")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    catalog = list(insert_commands(range(1, args.books + 1)))
+    lines = list(zipf_commands(args.books, args.ops, args.exponent, args.writes, args.seed))
+
+    print(f"{len(lines)} commands over {args.books} books, Zipf exponent {args.exponent}")
+    for cache_size in (0, 256, 4096, 65536):
+        seconds, stats = run(catalog, lines, cache_size)
+        lookups = stats["hits"] + stats["misses"]
+        print(f"cache {cache_size:>6} {len(lines) / seconds:>12,.0f} commands/sec"
+              f"  hit rate {stats['hits'] / lookups:6.1%}  evictions {stats['evictions']:>8,}")
+
+
+if __name__ == "__main__":
+    main()
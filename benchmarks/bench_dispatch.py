@@ -0,0 +1,109 @@
+"""
+Commands/sec of the command dispatcher, before and after compiling it into a dispatch table.
+
+"Before" is the original split/rstrip parser and if/elif ladder, kept here as a reference.
+"""
+import argparse
+import io
+import time
+
+from gatorLibrary import BinaryMinHeap, GatorLibrary, COMMAND_PATTERN, parse_command, process_commands
+from benchmarks.workload import mixed_commands
+
+
+def legacy_parse_command(line):
+    parts = line.strip().split("(")
+    if len(parts) < 2:
+        return None, None
+    command = parts[0]
+    args = "".join(parts[1:])
+    args = args.rstrip(";")
+    args = args.rstrip(")")
+    args_list = [arg.strip() for arg in args.split(",")]
+    return command, args_list
+
+
+def legacy_process_commands(library, lines, output_file):
+    for line in lines:
+        command, args = legacy_parse_command(line)
+        output_line = None
+        if command == "Quit":
+            output_line = "Program Terminated!!"
+            print(output_line, file=output_file)
+            break
+        elif command == "InsertBook":
+            book_id, title, author, availability = map(str.strip, args[:4])
+            library.insert_book(int(book_id), title, author, availability, None, BinaryMinHeap())
+            output_line = ""
+        elif command == "PrintBook":
+            output_line = library.print_book(int(args[0]))
+        elif command == "PrintBooks":
+            book_id1, book_id2 = map(int, args)
+            for book in library.print_books(book_id1, book_id2):
+                print(book.print_book_details(), file=output_file)
+            output_line = ""
+        elif command == "BorrowBook":
+            patron_id, book_id, priority = map(int, args)
+            output_line = library.borrow_book(patron_id, book_id, priority)
+        elif command == "ReturnBook":
+            patron_id, book_id = map(int, args)
+            output_line = library.return_book(patron_id, book_id)
+        elif command == "DeleteBook":
+            output_line = library.delete_book(int(args[0]))
+        elif command == "FindClosestBook":
+            output_line = library.find_closest_book(int(args[0]))
+        elif command == "ColorFlipCount":
+            output_line = f"Colour Flip Count: {library.red_black_tree.color_flips}"
+        if output_line is not None:
+            print(output_line, file=output_file)
+
+
+def time_parse(parse, lines, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            parse(line)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def time_run(run, lines, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        output_file = io.StringIO()
+        start = time.perf_counter()
+        run(GatorLibrary(), lines, output_file)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--books", type=int, default=20000)
+    parser.add_argument("--ops", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    lines = list(mixed_commands(args.books, args.ops, args.seed))
+    count = len(lines)
+
+    def compiled_parse(line):
+        return COMMAND_PATTERN.match(line)
+
+    rows = [
+        ("parse only, legacy", time_parse(legacy_parse_command, lines, args.repeat)),
+        ("parse only, parse_command", time_parse(parse_command, lines, args.repeat)),
+        ("parse only, compiled match", time_parse(compiled_parse, lines, args.repeat)),
+        ("end to end, legacy ladder", time_run(legacy_process_commands, lines, args.repeat)),
+        ("end to end, dispatch table", time_run(process_commands, lines, args.repeat)),
+    ]
+
+    print(f"{count} commands ({args.books} books, {args.ops} operations, seed {args.seed})")
+    for name, seconds in rows:
+        print(f"{name:<30} {count / seconds:>12,.0f} commands/sec")
+
+
+if __name__ == "__main__":
+    main()
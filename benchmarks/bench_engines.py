@@ -0,0 +1,78 @@
+"""
+Book index engines side by side: the red-black tree and the blocked sorted lists, first on
+the index operations alone (search, insert, delete, nearest, range count, range scan, rank
+and select), then on the suite's command workloads, each run in its own process.
+"""
+import argparse
+import random
+import time
+
+from gatorLibrary import BOOK_INDEX_ENGINES, GatorLibrary
+from benchmarks import suite
+
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def index_operations(engine, book_ids, probes, seed):
+    """
+    Return {operation: operations per second} for one engine.
+    """
+    rng = random.Random(seed)
+    library = GatorLibrary(engine=engine)
+    library.bulk_insert((book_id, '"Title"', '"Author"', '"Yes"') for book_id in book_ids)
+    index = library.book_index
+    num_books = len(book_ids)
+    last_id = max(book_ids)
+    keys = [rng.choice(book_ids) for _ in range(probes)]
+    ranges = [(low, low + 64) for low in (rng.randrange(last_id) for _ in range(probes))]
+    new_ids = rng.sample(range(last_id + 1, last_id * 2), probes)
+
+    rows = {
+        "search": timed(lambda: [index.search(key) for key in keys]),
+        "nearest, k=4": timed(lambda: [index.nearest(key + 1, 4) for key in keys]),
+        "count_in_range": timed(lambda: [index.count_in_range(low, high) for low, high in ranges]),
+        "scan 64 ids": timed(lambda: [sum(1 for _ in index.iter_books_in_range(low, high)) for low, high in ranges]),
+        "rank": timed(lambda: [index.rank(key) for key in keys]),
+        "select": timed(lambda: [index.select(rng.randrange(1, num_books + 1)) for _ in keys]),
+        "insert": timed(lambda: [library.insert_book(book_id, '"Title"', '"Author"', '"Yes"', None)
+                                 for book_id in new_ids]),
+        "delete": timed(lambda: [library.delete_book(book_id) for book_id in new_ids]),
+    }
+    return {name: probes / seconds for name, seconds in rows.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--books", type=int, default=200000)
+    parser.add_argument("--probes", type=int, default=50000, help="operations of each kind on the index")
+    parser.add_argument("--ops", type=int, default=50000, help="commands per workload scenario")
+    parser.add_argument("--scenarios", default=",".join(suite.SCENARIOS))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    engines = sorted(BOOK_INDEX_ENGINES, reverse=True)
+    rng = random.Random(args.seed)
+    book_ids = rng.sample(range(1, args.books * 4), args.books)
+
+    print(f"Index operations over {args.books:,} books, {args.probes:,} of each")
+    print(f"{'operation':<16}" + "".join(f"{engine + ' ops/sec':>20}" for engine in engines))
+    results = {engine: index_operations(engine, book_ids, args.probes, args.seed) for engine in engines}
+    for operation in results[engines[0]]:
+        print(f"{operation:<16}" + "".join(f"{results[engine][operation]:>20,.0f}" for engine in engines))
+
+    print(f"\nWorkloads over {args.books:,} books, {args.ops:,} commands each")
+    print(f"{'scenario':<18}" + "".join(f"{engine + ' cmds/sec':>20}{'p99 us':>9}{'RSS MB':>8}" for engine in engines))
+    for name in args.scenarios.split(","):
+        line = f"{name:<18}"
+        for engine in engines:
+            result = suite.run_isolated(name, args.books, args.ops, args.seed, engine)
+            line += f"{result['throughput']:>20,.0f}{result['p99_us']:>9.1f}{result['peak_rss_mb']:>8.1f}"
+        print(line, flush=True)
+
+
+if __name__ == "__main__":
+    main()
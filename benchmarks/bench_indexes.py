@@ -0,0 +1,69 @@
+"""
+Author and title-prefix lookups through the secondary indexes versus a full in-order walk.
+"""
+import argparse
+import random
+import time
+
+from gatorLibrary import GatorLibrary, unquote
+
+
+def best_of(repeat, function):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--books", type=int, default=10 ** 6)
+    parser.add_argument("--authors", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    words = ["Data", "Algorithms", "Systems", "Networks", "Theory", "Design", "Learning", "Introduction"]
+    records = [(book_id, f'"{rng.choice(words)} {rng.choice(words)} {book_id}"',
+                f'"Author {rng.randrange(args.authors)}"', '"Yes"')
+               for book_id in range(1, args.books + 1)]
+
+    start = time.perf_counter()
+    library = GatorLibrary()
+    library.bulk_insert(records, presorted=True)
+    print(f"loaded and indexed {args.books} books in {time.perf_counter() - start:.1f}s")
+
+    authors = [f'"Author {rng.randrange(args.authors)}"' for _ in range(args.queries)]
+    prefixes = [f'"{rng.choice(words)} {rng.choice(words)} 1{rng.randrange(100)}"' for _ in range(args.queries)]
+    tree = library.red_black_tree
+
+    def authors_indexed():
+        for author in authors:
+            library.find_by_author(author)
+
+    def authors_scanned():
+        for author in authors:
+            [book for book in tree.iter_books() if book.author_name == author]
+
+    def prefixes_indexed():
+        for prefix in prefixes:
+            list(library.find_by_title_prefix(prefix))
+
+    def prefixes_scanned():
+        for prefix in prefixes:
+            bare = unquote(prefix)
+            [book for book in tree.iter_books() if unquote(book.book_name).startswith(bare)]
+
+    for name, indexed, scanned in (("FindByAuthor", authors_indexed, authors_scanned),
+                                   ("FindByTitlePrefix", prefixes_indexed, prefixes_scanned)):
+        indexed_seconds = best_of(3, indexed) / args.queries
+        scanned_seconds = best_of(1, scanned) / args.queries
+        print(f"{name:<18} indexed {indexed_seconds * 1e6:10.1f} us/query   "
+              f"full walk {scanned_seconds * 1e3:10.1f} ms/query   ({scanned_seconds / indexed_seconds:,.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
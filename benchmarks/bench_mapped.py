@@ -0,0 +1,111 @@
+"""
+The memory-mapped catalog (MappedGatorLibrary) against the in-memory library: time to
+open, peak RSS, and the throughput of PrintBook, PrintBooks, FindClosestBook and
+BorrowBook/ReturnBook, for several page cache sizes. PrintBook is run twice, over ids
+drawn uniformly and over a hot set of 1% of the books that gets 90% of the lookups.
+
+The mapped file is built once with bulk_insert, then each library runs in a fresh
+process, so its peak RSS is its own. Mapped pages read through the page cache count
+towards RSS only while they are resident, and the kernel drops them under pressure.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+
+from gatorLibrary import GatorLibrary, MappedGatorLibrary
+
+
+def catalog_records(num_books):
+    for book_id in range(1, num_books + 1):
+        yield book_id, f'"Title {book_id}"', f'"Author {book_id % 1000}"', '"Yes"' if book_id % 3 else '"No"'
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def run_library(filename, page_cache_size, num_books, operations, seed):
+    """
+    Open the library (in memory if page_cache_size is None) and return its timings.
+    """
+    rng = random.Random(seed)
+    if page_cache_size is None:
+        library, opened = timed(lambda: GatorLibrary())
+        _, load = timed(lambda: library.bulk_insert(catalog_records(num_books), presorted=True))
+        opened += load
+    else:
+        library, opened = timed(lambda: MappedGatorLibrary(filename, page_cache_size))
+
+    uniform_ids = [rng.randint(1, num_books) for _ in range(operations)]
+    hot = rng.sample(range(1, num_books + 1), max(num_books // 100, 1))
+    hot_ids = [rng.choice(hot) if rng.random() < 0.9 else rng.randint(1, num_books) for _ in range(operations)]
+    range_starts = [rng.randint(1, num_books) for _ in range(operations // 10)]
+    targets = [rng.randint(0, num_books + 1) for _ in range(operations)]
+    loans = [rng.randint(1, num_books) for _ in range(operations // 4)]
+
+    def borrow_and_return():
+        for patron_id, book_id in enumerate(loans, 1):
+            library.borrow_book(patron_id, book_id, 1)
+            library.return_book(patron_id, book_id)
+        if page_cache_size is not None:
+            library.commit()
+
+    workloads = {
+        "PrintBook uniform": (len(uniform_ids), lambda: [library.print_book(book_id) for book_id in uniform_ids]),
+        "PrintBook hot": (len(hot_ids), lambda: [library.print_book(book_id) for book_id in hot_ids]),
+        "PrintBooks 50": (len(range_starts),
+                          lambda: [list(library.print_books(low, low + 49)) for low in range_starts]),
+        "FindClosestBook": (len(targets), lambda: [library.find_closest_book(target) for target in targets]),
+        "Borrow+Return": (2 * len(loans), borrow_and_return),
+    }
+    result = {"open": opened}
+    for name, (count, workload) in workloads.items():
+        result[name] = count / timed(workload)[1]
+    # ru_maxrss is in kilobytes on Linux
+    result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    if page_cache_size is not None:
+        library.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=float, default=2e6)
+    parser.add_argument("--operations", type=int, default=20000)
+    parser.add_argument("--page-cache", type=int, nargs="+", default=[64, 1024, 16384], metavar="PAGES")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    num_books = int(args.books)
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "catalog.pages")
+        library = MappedGatorLibrary(filename)
+        _, build = timed(lambda: library.bulk_insert(catalog_records(num_books), presorted=True))
+        library.close()
+        print(f"{num_books:,} books: mapped file built in {build:.1f} s, "
+              f"{os.path.getsize(filename) / 2 ** 20:.1f} MB")
+
+        context = multiprocessing.get_context("spawn")
+        configurations = [("in memory", None)] + [(f"mapped {pages}", pages) for pages in args.page_cache]
+        results = {}
+        for label, page_cache_size in configurations:
+            with context.Pool(1) as pool:
+                results[label] = pool.apply(run_library, (filename, page_cache_size, num_books,
+                                                          args.operations, args.seed))
+
+    names = ["PrintBook uniform", "PrintBook hot", "PrintBooks 50", "FindClosestBook", "Borrow+Return"]
+    print(f"{'ops/sec':<20}" + "".join(f"{label:>16}" for label, _ in configurations))
+    for name in names:
+        print(f"{name:<20}" + "".join(f"{results[label][name]:>16,.0f}" for label, _ in configurations))
+    print(f"{'open s':<20}" + "".join(f"{results[label]['open']:>16.3f}" for label, _ in configurations))
+    print(f"{'peak RSS MB':<20}" + "".join(f"{results[label]['peak_rss_mb']:>16.1f}" for label, _ in configurations))
+
+
+if __name__ == "__main__":
+    main()
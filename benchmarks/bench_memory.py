@@ -0,0 +1,89 @@
+"""
+Bytes per book held by the book nodes, original node layout versus the current one.
+
+The original layout is reproduced here: __dict__-based nodes, string colors and an eagerly
+created 21-slot reservation heap per book. The current layout is an RBNode per book plus
+its row in a BookCatalog. Both layouts are given the same title, author and availability
+string objects, which are not counted; the unquoted title copies the catalog keeps are
+counted, since only the current layout has them. The whole library, with its title and
+author indexes on top, is shown for reference.
+"""
+import argparse
+import gc
+import tracemalloc
+
+from gatorLibrary import RED, BookCatalog, GatorLibrary
+
+
+class LegacyBinaryMinHeap:
+    def __init__(self, max_size=20):
+        self.max_size = max_size
+        self.size = 0
+        self.heap = [None] * (max_size + 1)
+
+
+class LegacyRBNode:
+    def __init__(self, book_id, book_name, author_name, availability_status, borrowed_by, reservation_heap=None, color='B', parent=None, left=None, right=None):
+        self.book_id = book_id
+        self.book_name = book_name
+        self.author_name = author_name
+        self.availability_status = availability_status
+        self.borrowed_by = borrowed_by
+        self.reservation_heap = reservation_heap if reservation_heap is not None else LegacyBinaryMinHeap()
+        self.color = color
+        self.parent = parent
+        self.left = left
+        self.right = right
+
+
+def build_legacy(records):
+    # Node objects only; tree links are plain references and cost the same in both layouts
+    return [LegacyRBNode(book_id, title, author, availability, None, LegacyBinaryMinHeap(), 'R')
+            for book_id, title, author, availability in records]
+
+
+def build_compact(records):
+    # Tree links are left unset, as in build_legacy
+    catalog = BookCatalog()
+    new_book = catalog.new_book
+    return catalog, [new_book(book_id, title, author, availability, None, color=RED)
+                     for book_id, title, author, availability in records]
+
+
+def build_library(records):
+    library = GatorLibrary()
+    for book_id, title, author, availability in records:
+        library.insert_book(book_id, title, author, availability, None)
+    return library
+
+
+def measure(build, records):
+    gc.collect()
+    tracemalloc.start()
+    result = build(records)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--books", type=int, default=200000)
+    args = parser.parse_args()
+
+    # Titles and authors are created up front so both layouts share the same string objects
+    records = [(book_id, f'"Title {book_id}"', f'"Author {book_id % 5000}"', '"Yes"')
+               for book_id in range(1, args.books + 1)]
+
+    legacy = measure(build_legacy, records) / args.books
+    compact = measure(build_compact, records) / args.books
+    library = measure(build_library, records) / args.books
+    print(f"{args.books} books, shared metadata strings excluded")
+    print(f"original layout  {legacy:8.1f} bytes/book")
+    print(f"current layout   {compact:8.1f} bytes/book   ({legacy / compact:.2f}x smaller)")
+    print(f"whole library    {library:8.1f} bytes/book   (current layout with the title and author indexes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Overhead of Metrics: the mixed workload through process_commands with no metrics, with
+what --metrics installs (sampled command timing), and with the search and index wrappers
+of --search-metrics as well.
+"""
+import argparse
+import gc
+import io
+import statistics
+import time
+
+from gatorLibrary import GatorLibrary, Metrics, process_commands
+from benchmarks.workload import mixed_commands
+
+
+def run_once(lines, mode):
+    library = GatorLibrary()
+    metrics = None
+    if mode == "metrics":
+        metrics = Metrics().attach(library)
+    elif mode == "search":
+        metrics = Metrics().attach(library, lookups=True)
+    # Start every run from the same collector state, without the garbage of the last one
+    gc.collect()
+    start = time.process_time()
+    process_commands(library, lines, io.StringIO(), metrics=metrics)
+    return time.process_time() - start
+
+
+def run(lines, modes, repeats):
+    # Interleave the modes so drift in machine speed affects them all alike. Keep the best
+    # time of each, and the ratio to the disabled run of the same round, whose median is a
+    # steadier overhead estimate than a ratio of best times on a noisy machine
+    best = dict.fromkeys(modes, float("inf"))
+    ratios = {mode: [] for mode in modes}
+    for round_number in range(repeats):
+        # Rotate the order so no mode always runs right after another
+        shift = round_number % len(modes)
+        seconds = {mode: run_once(lines, mode) for mode in modes[shift:] + modes[:shift]}
+        for mode in modes:
+            best[mode] = min(best[mode], seconds[mode])
+            ratios[mode].append(seconds[mode] / seconds[modes[0]])
+    return best, {mode: statistics.median(ratios[mode]) for mode in modes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--books", type=int, default=20000)
+    parser.add_argument("--ops", type=int, default=50000)
+    parser.add_argument("--repeats", type=int, default=21)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    lines = list(mixed_commands(args.books, args.ops, args.seed))
+    best, ratio = run(lines, (None, "metrics", "search"), args.repeats)
+    baseline = best[None]
+    print(f"{len(lines)} commands, best of {args.repeats}, overhead is the median of per-round ratios")
+    print(f"{'disabled':<24} {len(lines) / baseline:>12,.0f} commands/sec")
+    for mode, name in (("metrics", "--metrics"), ("search", "--search-metrics")):
+        seconds = best[mode]
+        print(f"{name:<24} {len(lines) / seconds:>12,.0f} commands/sec  overhead {ratio[mode] - 1:+.1%}")
+
+if __name__ == "__main__":
+    main()
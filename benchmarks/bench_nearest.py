@@ -0,0 +1,44 @@
+"""
+Nearest-book lookups: one FindClosestBook search per target, RedBlackTree.nearest, and a
+sorted batch with nearest_sorted, for k = 1 and k = 10.
+"""
+import argparse
+import random
+import time
+
+from gatorLibrary import GatorLibrary
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--books", type=int, default=200000)
+    parser.add_argument("--targets", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    library = GatorLibrary()
+    book_ids = rng.sample(range(1, args.books * 4), args.books)
+    library.bulk_insert((book_id, '"Title"', '"Author"', '"Yes"') for book_id in book_ids)
+    tree = library.red_black_tree
+    targets = [rng.randrange(args.books * 4) for _ in range(args.targets)]
+    sorted_targets = sorted(targets)
+
+    rows = [("find_closest_book", timed(lambda: [tree.find_closest_book(target) for target in targets]))]
+    for k in (1, 10):
+        rows.append((f"nearest, k={k}", timed(lambda: [tree.nearest(target, k) for target in targets])))
+        rows.append((f"nearest_sorted, k={k}", timed(lambda: (sorted(targets), tree.nearest_sorted(sorted_targets, k)))))
+
+    print(f"{args.targets} targets over {args.books} books")
+    for name, seconds in rows:
+        print(f"{name:<22} {args.targets / seconds:>12,.0f} lookups/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Peak memory and time of a full-catalog PrintBooks, materialized (original) versus streamed.
+"""
+import argparse
+import os
+import time
+import tracemalloc
+
+from gatorLibrary import GatorLibrary
+
+
+def materialized_scan(library, output_file, low, high):
+    # The original path: collect the books, then every rendered string, then write them out
+    books = library.red_black_tree.get_books_in_range(low, high)
+    output_lines = [f"{book.print_book_details()}" for book in books]
+    for output_line in output_lines:
+        print(output_line, file=output_file)
+
+
+def streamed_scan(library, output_file, low, high):
+    library.write_books(output_file, low, high)
+
+
+def measure(scan, library, low, high):
+    with open(os.devnull, "w") as output_file:
+        tracemalloc.start()
+        start = time.perf_counter()
+        scan(library, output_file, low, high)
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--books", type=int, default=500000)
+    args = parser.parse_args()
+
+    library = GatorLibrary()
+    library.bulk_insert(((book_id, f'"Title {book_id}"', '"Author"', '"Yes"') for book_id in range(1, args.books + 1)),
+                        presorted=True)
+
+    print(f"PrintBooks(1, {args.books})")
+    for name, scan in (("materialized", materialized_scan), ("streamed", streamed_scan)):
+        seconds, peak = measure(scan, library, 1, args.books)
+        print(f"{name:<14} {seconds:8.2f}s   peak {peak / 2 ** 20:10.2f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Replay time of a long BorrowBook/ReturnBook/PrintBook log, sequentially with
+process_commands and in parallel with replay_commands on 1, 2 and 4 worker processes.
+"""
+import argparse
+import io
+import random
+import time
+
+from gatorLibrary import GatorLibrary, process_commands, replay_commands
+from benchmarks.workload import insert_commands
+
+
+def point_commands(num_books, num_ops, seed=0):
+    rng = random.Random(seed)
+    yield from insert_commands(range(1, num_books + 1), rng)
+    for _ in range(num_ops):
+        book_id = rng.randint(1, num_books)
+        patron_id = rng.randint(1, 500)
+        roll = rng.random()
+        if roll < 0.4:
+            yield f"BorrowBook({patron_id}, {book_id}, {rng.randint(1, 5)})"
+        elif roll < 0.75:
+            yield f"ReturnBook({patron_id}, {book_id})"
+        else:
+            yield f"PrintBook({book_id})"
+
+
+def timed(replay, lines):
+    start = time.perf_counter()
+    replay(GatorLibrary(), lines, io.StringIO())
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--books", type=int, default=10000)
+    parser.add_argument("--ops", type=int, default=300000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    lines = list(point_commands(args.books, args.ops, args.seed))
+    rows = [("sequential", timed(process_commands, lines))]
+    for workers in (1, 2, 4):
+        rows.append((f"parallel, {workers} workers",
+                     timed(lambda library, lines, output: replay_commands(library, lines, output, workers), lines)))
+
+    print(f"{len(lines)} commands")
+    for name, seconds in rows:
+        print(f"{name:<22} {len(lines) / seconds:>12,.0f} commands/sec")
+
+
+if __name__ == "__main__":
+    main()
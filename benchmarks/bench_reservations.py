@@ -0,0 +1,68 @@
+"""
+Reservation heap operations on a single hot book with many reservations.
+"""
+import argparse
+import random
+import time
+
+from gatorLibrary import GatorLibrary
+
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--reservations", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    count = args.reservations
+    patrons = list(range(1, count + 1))
+    rng.shuffle(patrons)
+
+    library = GatorLibrary()
+    library.insert_book(1, '"Hot Book"', '"Author"', '"Yes"', None)
+    library.borrow_book(0, 1, 1)
+    book = library.red_black_tree.search(1)
+
+    def reserve():
+        for patron_id in patrons:
+            library.borrow_book(patron_id, 1, rng.randint(1, 10))
+
+    def reprioritize():
+        for patron_id in patrons:
+            library.borrow_book(patron_id, 1, rng.randint(1, 10))
+
+    def membership():
+        heap = book.reservation_heap
+        for patron_id in patrons:
+            patron_id in heap
+
+    def cancel_half():
+        for patron_id in patrons[:count // 2]:
+            book.cancel_reservation(patron_id)
+
+    def allot_rest():
+        while book.has_reservations():
+            library.return_book(book.borrowed_by, 1)
+
+    rows = [
+        ("reserve (BorrowBook)", reserve, count),
+        ("re-prioritize (BorrowBook)", reprioritize, count),
+        ("membership", membership, count),
+        ("cancel", cancel_half, count // 2),
+        ("allot on return (ReturnBook)", allot_rest, count - count // 2),
+    ]
+    print(f"{count} reservations on one book")
+    for name, function, operations in rows:
+        seconds = timed(function)
+        print(f"{name:<30} {operations / seconds:>12,.0f} ops/sec")
+
+
+if __name__ == "__main__":
+    main()
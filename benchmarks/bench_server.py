@@ -0,0 +1,106 @@
+"""
+Load generator for the network server: opens several connections that each keep a window
+of pipelined requests in flight, and reports throughput and p50/p99 latency. Starts its
+own server on a Unix socket unless --address points at a running one.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+
+from benchmarks.workload import mixed_commands
+
+END_OF_RESPONSE = b".\n"
+
+
+async def open_connection(address):
+    if address.startswith("unix:"):
+        return await asyncio.open_unix_connection(address[len("unix:"):])
+    host, _, port = address.rpartition(":")
+    return await asyncio.open_connection(host, int(port))
+
+
+async def run_connection(address, lines, window, latencies):
+    reader, writer = await open_connection(address)
+    sent_at = deque()
+    slots = asyncio.Semaphore(window)
+
+    async def send():
+        for line in lines:
+            await slots.acquire()
+            sent_at.append(time.perf_counter())
+            writer.write(line.encode() + b"\n")
+            await writer.drain()
+
+    async def receive():
+        for _ in lines:
+            while await reader.readline() != END_OF_RESPONSE:
+                pass
+            latencies.append(time.perf_counter() - sent_at.popleft())
+            slots.release()
+
+    await asyncio.gather(send(), receive())
+    writer.close()
+    await writer.wait_closed()
+
+
+async def run_load(address, setup, connection_lines, window):
+    # Load the catalog over one connection first so every later request finds its book
+    await run_connection(address, setup, window, [])
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(run_connection(address, lines, window, latencies) for lines in connection_lines))
+    return time.perf_counter() - start, sorted(latencies)
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def start_server(address):
+    server = subprocess.Popen([sys.executable, "gatorLibrary.py", "--serve", address],
+                              stderr=subprocess.PIPE, text=True)
+    # The server announces itself on stderr once it is listening
+    server.stderr.readline()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--address", default=None, help='"HOST:PORT" or "unix:PATH" of a running server')
+    parser.add_argument("--books", type=int, default=5000)
+    parser.add_argument("--ops", type=int, default=100000)
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--window", type=int, default=32, help="pipelined requests in flight per connection")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    lines = list(mixed_commands(args.books, args.ops, args.seed))
+    setup, workload = lines[:args.books], lines[args.books:]
+    connection_lines = [workload[i::args.connections] for i in range(args.connections)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        server = None
+        address = args.address
+        if address is None:
+            address = f"unix:{os.path.join(directory, 'library.sock')}"
+            server = start_server(address)
+        try:
+            seconds, latencies = asyncio.run(run_load(address, setup, connection_lines, args.window))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    print(f"{len(workload)} requests over {args.connections} connections, window {args.window}")
+    print(f"throughput {len(workload) / seconds:>12,.0f} requests/sec")
+    print(f"p50        {percentile(latencies, 0.50) * 1000:>12.3f} ms")
+    print(f"p99        {percentile(latencies, 0.99) * 1000:>12.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Command throughput of ShardedGatorLibrary at 1, 2, 4 and 8 shards, against a single
+in-process GatorLibrary.
+"""
+import argparse
+import io
+import time
+
+from gatorLibrary import GatorLibrary, ShardedGatorLibrary, process_commands
+from benchmarks.workload import mixed_commands
+
+
+def run_single(lines):
+    start = time.perf_counter()
+    process_commands(GatorLibrary(), lines, io.StringIO())
+    return time.perf_counter() - start
+
+
+def run_sharded(lines, num_shards, num_books):
+    with ShardedGatorLibrary.for_range(num_shards, 1, num_books) as library:
+        start = time.perf_counter()
+        library.process(lines, io.StringIO())
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--books", type=int, default=50000)
+    parser.add_argument("--ops", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    lines = list(mixed_commands(args.books, args.ops, args.seed))
+    rows = [("single process", run_single(lines))]
+    for num_shards in (1, 2, 4, 8):
+        rows.append((f"{num_shards} shards", run_sharded(lines, num_shards, args.books)))
+
+    print(f"{len(lines)} commands")
+    for name, seconds in rows:
+        print(f"{name:<16} {len(lines) / seconds:>12,.0f} commands/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Lookup and range-scan speed of RedBlackTree, recursive (original) versus iterative traversal.
+"""
+import argparse
+import random
+import sys
+import time
+
+from gatorLibrary import GatorLibrary
+
+
+def recursive_search(tree, x, key):
+    if x is tree.NIL or key == x.book_id:
+        return x
+    if key < x.book_id:
+        return recursive_search(tree, x.left, key)
+    return recursive_search(tree, x.right, key)
+
+
+def recursive_range(tree, node, low, high, book_list):
+    if node is not tree.NIL:
+        if low <= node.book_id <= high:
+            recursive_range(tree, node.left, low, high, book_list)
+            book_list.append(node)
+            recursive_range(tree, node.right, low, high, book_list)
+        elif node.book_id < low:
+            recursive_range(tree, node.right, low, high, book_list)
+        else:
+            recursive_range(tree, node.left, low, high, book_list)
+
+
+def best_of(repeat, function):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--books", type=int, default=10 ** 6)
+    parser.add_argument("--lookups", type=int, default=200000)
+    parser.add_argument("--scans", type=int, default=200)
+    parser.add_argument("--scan-width", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    sys.setrecursionlimit(10000)
+
+    rng = random.Random(args.seed)
+    book_ids = list(range(1, args.books + 1))
+    rng.shuffle(book_ids)
+
+    start = time.perf_counter()
+    library = GatorLibrary()
+    for book_id in book_ids:
+        library.insert_book(book_id, f'"Title {book_id}"', '"Author"', '"Yes"', None)
+    print(f"built tree of {args.books} books in {time.perf_counter() - start:.1f}s")
+
+    tree = library.red_black_tree
+    keys = [rng.randint(1, args.books) for _ in range(args.lookups)]
+    lows = [rng.randint(1, max(1, args.books - args.scan_width)) for _ in range(args.scans)]
+    width = args.scan_width
+
+    def lookups_recursive():
+        for key in keys:
+            recursive_search(tree, tree.root, key)
+
+    def lookups_iterative():
+        search = tree.search
+        for key in keys:
+            search(key)
+
+    def scans_recursive():
+        for low in lows:
+            recursive_range(tree, tree.root, low, low + width, [])
+
+    def scans_iterative():
+        for low in lows:
+            for _ in tree.iter_books_in_range(low, low + width):
+                pass
+
+    recursive = best_of(args.repeat, lookups_recursive)
+    iterative = best_of(args.repeat, lookups_iterative)
+    print(f"lookup     recursive {args.lookups / recursive:>12,.0f}/s   "
+          f"iterative {args.lookups / iterative:>12,.0f}/s   speedup {recursive / iterative:.2f}x")
+
+    recursive = best_of(args.repeat, scans_recursive)
+    iterative = best_of(args.repeat, scans_iterative)
+    print(f"range scan recursive {args.scans / recursive:>12,.0f}/s   "
+          f"iterative {args.scans / iterative:>12,.0f}/s   speedup {recursive / iterative:.2f}x"
+          f"   ({width} ids per scan)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Command throughput with the write-ahead log off, and on with different group-commit sizes.
+"""
+import argparse
+import io
+import os
+import tempfile
+import time
+
+from gatorLibrary import GatorLibrary, WriteAheadLog, process_commands
+from benchmarks.workload import mixed_commands
+
+
+def run(lines, wal_filename=None, group_size=64, fsync=True):
+    library = GatorLibrary()
+    write_ahead_log = None
+    if wal_filename is not None:
+        if os.path.exists(wal_filename):
+            os.remove(wal_filename)
+        write_ahead_log = WriteAheadLog(wal_filename, group_size, fsync=fsync)
+        write_ahead_log.recover(library)
+    start = time.perf_counter()
+    process_commands(library, lines, io.StringIO(), write_ahead_log=write_ahead_log)
+    if write_ahead_log is not None:
+        write_ahead_log.close()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--books", type=int, default=5000)
+    parser.add_argument("--ops", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    lines = list(mixed_commands(args.books, args.ops, args.seed))
+    with tempfile.TemporaryDirectory() as directory:
+        wal_filename = os.path.join(directory, "library.wal")
+        rows = [("no log", run(lines))]
+        for group_size in (1, 16, 256):
+            rows.append((f"group commit {group_size}, fsync", run(lines, wal_filename, group_size)))
+        rows.append(("group commit 256, no fsync", run(lines, wal_filename, 256, fsync=False)))
+
+    print(f"{len(lines)} commands")
+    for name, seconds in rows:
+        print(f"{name:<28} {len(lines) / seconds:>12,.0f} commands/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Stress check for ConcurrentGatorLibrary: run a contended mixed workload from many threads,
+then verify the results are linearizable by replaying the recorded history in its
+linearization order on a plain GatorLibrary. Exits non-zero on any mismatch.
+"""
+import argparse
+import random
+import sys
+import time
+
+from gatorLibrary import COMMAND_PATTERN, ConcurrentGatorLibrary, GatorLibrary
+
+
+def contended_commands(books, operations, seed):
+    rng = random.Random(seed)
+    lines = [f'InsertBook({book_id}, "Title {book_id}", "Author {book_id % 7}", "Yes")'
+             for book_id in range(1, books + 1)]
+    for _ in range(operations):
+        book_id = rng.randint(1, books + books // 4)
+        patron_id = rng.randint(1, 40)
+        roll = rng.random()
+        if roll < 0.25:
+            lines.append(f"BorrowBook({patron_id}, {book_id}, {rng.randint(1, 4)})")
+        elif roll < 0.45:
+            lines.append(f"ReturnBook({patron_id}, {book_id})")
+        elif roll < 0.65:
+            lines.append(f"PrintBook({book_id})")
+        elif roll < 0.72:
+            lines.append(f"FindClosestBook({book_id})")
+        elif roll < 0.77:
+            lines.append(f"PrintBooks({book_id}, {book_id + 5})")
+        elif roll < 0.81:
+            lines.append(f"CountAvailableBooks(1, {book_id})")
+        elif roll < 0.84:
+            lines.append(f"PatronLoans({patron_id})")
+        elif roll < 0.86:
+            lines.append(f"CancelAllReservations({patron_id})")
+        elif roll < 0.91:
+            lines.append(f'InsertBook({book_id}, "Title {book_id}", "Author {book_id % 7}", "Yes")')
+        elif roll < 0.95:
+            lines.append(f"DeleteBook({book_id})")
+        else:
+            lines.append("ColorFlipCount()")
+    return lines
+
+
+def state_dump(library):
+    return library.run_command("PrintBooks", "0, 1000000000") + library.run_command("ColorFlipCount", "")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--books", type=int, default=200)
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    failures = 0
+    for round_number in range(args.rounds):
+        lines = contended_commands(args.books, args.ops, args.seed + round_number)
+        setup, workload = lines[:args.books], lines[args.books:]
+
+        concurrent_library = ConcurrentGatorLibrary(max_workers=args.threads, record_history=True)
+        with concurrent_library:
+            concurrent_library.execute_batch(setup)
+            start = time.perf_counter()
+            results = concurrent_library.execute_batch(workload)
+            seconds = time.perf_counter() - start
+
+        # Replay in linearization order; every result must match
+        history = sorted(concurrent_library.history)
+        replay = GatorLibrary()
+        mismatches = 0
+        for _, line, result in history:
+            if replay.run_command(*COMMAND_PATTERN.match(line).groups()) != result:
+                mismatches += 1
+        if state_dump(replay) != state_dump(concurrent_library.library):
+            mismatches += 1
+
+        failures += mismatches
+        status = "ok" if mismatches == 0 else f"FAILED ({mismatches} mismatches)"
+        print(f"round {round_number}: {len(workload)} commands on {args.threads} threads, "
+              f"{len(workload) / seconds:,.0f} commands/sec, {len(results)} results, linearizable: {status}")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
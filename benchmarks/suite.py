@@ -0,0 +1,186 @@
+"""
+Reproducible benchmark suite. Runs seeded synthetic workloads in the command language
+against GatorLibrary at several catalog sizes, and reports throughput, latency percentiles
+and peak RSS for each. Each scenario runs in its own process, so peak RSS is its own.
+
+    python -m benchmarks.suite --sizes 1000,100000 --save-baseline baseline.json
+    python -m benchmarks.suite --sizes 1000,100000 --baseline baseline.json
+
+With --baseline, a scenario whose throughput drops, or whose p99 latency or peak RSS
+grows, by more than --tolerance exits with status 1.
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import resource
+import sys
+import time
+
+from gatorLibrary import BOOK_INDEX_ENGINES, COMMAND_HANDLERS, COMMAND_PATTERN, GatorLibrary
+from benchmarks import workload
+
+# Latency histogram resolution: buckets per power of two (about 4% wide at 16)
+SUB_BUCKETS = 16
+
+
+def scenario_commands(name, num_books, num_ops, seed, engine="redblack"):
+    """
+    Return (library, commands) for a scenario: the library, using the given book index
+    engine, already holds the catalog the scenario starts from, loaded with bulk_insert
+    outside the measurement.
+    """
+    library = GatorLibrary(engine=engine)
+    if name == "cold_start":
+        return library, workload.cold_start_commands(num_books, seed)
+    if name == "closest_sweep":
+        library.bulk_insert(workload.catalog_records(num_books, spacing=2), presorted=True)
+        return library, workload.closest_sweep_commands(num_books, num_ops, seed=seed)
+
+    library.bulk_insert(workload.catalog_records(num_books), presorted=True)
+    if name == "zipf_churn":
+        return library, workload.zipf_churn_commands(num_books, num_ops, seed=seed)
+    if name == "reservation_storm":
+        return library, workload.reservation_storm_commands(num_books, num_ops, seed=seed)
+    if name == "wide_scans":
+        # Scans are long, so fewer of them
+        return library, workload.wide_scan_commands(num_books, max(1, num_ops // 100), seed=seed)
+    raise ValueError(f"unknown scenario {name}")
+
+
+SCENARIOS = ("cold_start", "zipf_churn", "reservation_storm", "wide_scans", "closest_sweep")
+
+
+class NullOutput:
+    # Discards command output without the cost of growing a buffer
+    def write(self, text):
+        return len(text)
+
+
+def percentile(buckets, total, fraction):
+    # Upper bound of the histogram bucket holding the given fraction of the samples
+    threshold = fraction * total
+    seen = 0
+    for bucket in sorted(buckets):
+        seen += buckets[bucket]
+        if seen >= threshold:
+            exponent, sub_bucket = divmod(bucket, SUB_BUCKETS)
+            return 2.0 ** exponent * (0.5 + (sub_bucket + 1) / (2 * SUB_BUCKETS))
+    return 0.0
+
+
+def run_scenario(name, num_books, num_ops, seed, engine="redblack"):
+    """
+    Run one scenario in this process and return its result dict. Commands are generated
+    lazily and only the handlers are timed, so neither generation nor output is measured.
+    """
+    library, commands = scenario_commands(name, num_books, num_ops, seed, engine)
+    handlers = COMMAND_HANDLERS
+    match_command = COMMAND_PATTERN.match
+    output_file = NullOutput()
+    clock = time.perf_counter
+    frexp = math.frexp
+    buckets = {}
+    busy = 0.0
+    count = 0
+
+    for line in commands:
+        command, arg_text = match_command(line).groups()
+        handler = handlers[command]
+        start = clock()
+        handler(library, arg_text, output_file)
+        elapsed = clock() - start
+        busy += elapsed
+        count += 1
+        mantissa, exponent = frexp(elapsed)
+        bucket = exponent * SUB_BUCKETS + int((mantissa - 0.5) * 2 * SUB_BUCKETS)
+        buckets[bucket] = buckets.get(bucket, 0) + 1
+
+    return {
+        "scenario": name,
+        "engine": engine,
+        "books": num_books,
+        "commands": count,
+        "throughput": count / busy if busy else 0.0,
+        "p50_us": percentile(buckets, count, 0.50) * 1e6,
+        "p99_us": percentile(buckets, count, 0.99) * 1e6,
+        "p999_us": percentile(buckets, count, 0.999) * 1e6,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def run_isolated(name, num_books, num_ops, seed, engine="redblack"):
+    # A fresh process per scenario, so its peak RSS is not inherited from the last one
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1) as pool:
+        return pool.apply(run_scenario, (name, num_books, num_ops, seed, engine))
+
+
+def compare(results, baseline, tolerance):
+    """
+    Return the regressions of results against baseline as printable lines.
+    """
+    previous = {(entry["scenario"], entry.get("engine", "redblack"), entry["books"]): entry
+                for entry in baseline["results"]}
+    regressions = []
+    for result in results:
+        entry = previous.get((result["scenario"], result["engine"], result["books"]))
+        if entry is None:
+            continue
+        key = f"{result['scenario']} ({result['engine']}) @ {result['books']} books"
+        if result["throughput"] < entry["throughput"] * (1 - tolerance):
+            regressions.append(f"{key}: throughput {result['throughput']:,.0f}/s, baseline {entry['throughput']:,.0f}/s")
+        if result["p99_us"] > entry["p99_us"] * (1 + tolerance):
+            regressions.append(f"{key}: p99 {result['p99_us']:.1f} us, baseline {entry['p99_us']:.1f} us")
+        if result["peak_rss_mb"] > entry["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{key}: peak RSS {result['peak_rss_mb']:.1f} MB, baseline {entry['peak_rss_mb']:.1f} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="comma-separated catalog sizes, e.g. 1000,1e6,1e7 (default: 1000,10000,100000)")
+    parser.add_argument("--ops", type=int, default=100000, help="commands per scenario (cold_start inserts every book)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of " + ", ".join(SCENARIOS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--engine", choices=sorted(BOOK_INDEX_ENGINES), default="redblack",
+                        help="book index engine (default: redblack)")
+    parser.add_argument("--baseline", default=None, metavar="FILE", help="fail on regressions against this baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression (default: 0.25)")
+    parser.add_argument("--save-baseline", default=None, metavar="FILE", help="save these results as a baseline")
+    args = parser.parse_args()
+
+    sizes = [int(float(size)) for size in args.sizes.split(",")]
+    scenarios = args.scenarios.split(",")
+    results = []
+    print(f"{'scenario':<18} {'books':>10} {'commands':>10} {'cmds/sec':>12} {'p50 us':>9} {'p99 us':>9} {'p99.9 us':>9} {'RSS MB':>8}")
+    for num_books in sizes:
+        for name in scenarios:
+            result = run_isolated(name, num_books, args.ops, args.seed, args.engine)
+            results.append(result)
+            print(f"{name:<18} {num_books:>10,} {result['commands']:>10,} {result['throughput']:>12,.0f} "
+                  f"{result['p50_us']:>9.1f} {result['p99_us']:>9.1f} {result['p999_us']:>9.1f} {result['peak_rss_mb']:>8.1f}",
+                  flush=True)
+
+    run_info = {"python": sys.version.split()[0], "ops": args.ops, "seed": args.seed, "engine": args.engine,
+                "results": results}
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as baseline_file:
+            json.dump(run_info, baseline_file, indent=1)
+        print(f"Saved baseline to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print(f"REGRESSIONS against {args.baseline} (tolerance {args.tolerance:.0%}):")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
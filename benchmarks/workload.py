@@ -0,0 +1,148 @@
+"""
+Seeded synthetic workloads written in the GatorLibrary command syntax.
+"""
+import heapq
+import math
+import random
+
+
+def insert_commands(book_ids, rng=None):
+    """Yield one InsertBook line per book id, with a title that exercises quoting."""
+    rng = rng or random.Random(0)
+    for book_id in book_ids:
+        author = f"Author {rng.randrange(1000)}"
+        yield f'InsertBook({book_id}, "Title {book_id}, Volume ({book_id % 7})", "{author}", "Yes")'
+
+
+def mixed_commands(num_books, num_ops, seed=0):
+    """
+    Yield a mixed workload: num_books inserts in random order followed by num_ops
+    borrow/return/print/find/delete commands on random existing ids.
+    """
+    rng = random.Random(seed)
+    book_ids = list(range(1, num_books + 1))
+    rng.shuffle(book_ids)
+    yield from insert_commands(book_ids, rng)
+
+    for _ in range(num_ops):
+        book_id = rng.randint(1, num_books)
+        patron_id = rng.randint(1, 500)
+        roll = rng.random()
+        if roll < 0.35:
+            yield f"BorrowBook({patron_id}, {book_id}, {rng.randint(1, 5)})"
+        elif roll < 0.65:
+            yield f"ReturnBook({patron_id}, {book_id})"
+        elif roll < 0.85:
+            yield f"PrintBook({book_id})"
+        elif roll < 0.95:
+            yield f"FindClosestBook({book_id})"
+        elif roll < 0.98:
+            yield f"PrintBooks({book_id}, {book_id + 5})"
+        else:
+            yield "ColorFlipCount()"
+
+
+def scattered_ids(num_books, seed=0):
+    """
+    Yield 1..num_books in a seeded pseudo-random order without holding them all in memory:
+    i -> (i * step + offset) mod num_books is a permutation when step is coprime to num_books.
+    """
+    rng = random.Random(seed)
+    step = rng.randrange(1, num_books) | 1 if num_books > 2 else 1
+    while math.gcd(step, num_books) != 1:
+        step += 2
+    offset = rng.randrange(num_books)
+    for i in range(num_books):
+        yield (i * step + offset) % num_books + 1
+
+
+def catalog_records(num_books, spacing=1):
+    """Yield (book_id, title, author, availability) records in book_id order, for bulk loading."""
+    for book_id in range(spacing, num_books * spacing + 1, spacing):
+        yield book_id, f'"Title {book_id}"', f'"Author {book_id % 1000}"', '"Yes"'
+
+
+def zipf_ranks(num_books, num_ops, exponent=1.1, seed=0):
+    """
+    Yield num_ops ranks in 1..num_books from an approximate Zipf distribution, by inverting
+    the continuous power-law CDF, so no table of num_books weights is needed.
+    """
+    rng = random.Random(seed)
+    if exponent == 1:
+        log_n = math.log(num_books)
+        for _ in range(num_ops):
+            yield min(num_books, int(math.exp(rng.random() * log_n)))
+        return
+    power = 1 - exponent
+    top = num_books ** power - 1
+    for _ in range(num_ops):
+        yield min(num_books, int((top * rng.random() + 1) ** (1 / power)))
+
+
+def cold_start_commands(num_books, seed=0):
+    """InsertBook for every book into an empty library, in scattered order."""
+    yield from insert_commands(scattered_ids(num_books, seed), random.Random(seed))
+
+
+def zipf_churn_commands(num_books, num_ops, exponent=1.1, seed=0):
+    """BorrowBook/ReturnBook churn where a few popular books get most of the traffic."""
+    rng = random.Random(seed)
+    # Spread the popular ranks over the id space instead of packing them at the low ids
+    multiplier = 7919
+    while math.gcd(multiplier, num_books) != 1:
+        multiplier += 2
+    for rank in zipf_ranks(num_books, num_ops, exponent, seed):
+        book_id = rank * multiplier % num_books + 1
+        patron_id = rng.randint(1, 10000)
+        if rng.random() < 0.5:
+            yield f"BorrowBook({patron_id}, {book_id}, {rng.randint(1, 5)})"
+        else:
+            yield f"ReturnBook({patron_id}, {book_id})"
+
+
+def reservation_storm_commands(num_books, num_ops, hot_books=8, seed=0):
+    """
+    Many patrons reserving a handful of borrowed books, so their reservation heaps grow
+    large, with the occasional return by the holder handing the book to the next patron in
+    line. The generator follows each hot book's holder and queue so the returns succeed.
+    """
+    rng = random.Random(seed)
+    hot_ids = rng.sample(range(1, num_books + 1), min(hot_books, num_books))
+    holders = {}
+    queues = {book_id: [] for book_id in hot_ids}
+    sequence = 0
+    for book_id in hot_ids:
+        holders[book_id] = 1
+        yield f"BorrowBook(1, {book_id}, 1)"
+    for _ in range(num_ops - len(hot_ids)):
+        book_id = rng.choice(hot_ids)
+        queue = queues[book_id]
+        if queue and rng.random() < 0.05:
+            yield f"ReturnBook({holders[book_id]}, {book_id})"
+            holders[book_id] = heapq.heappop(queue)[2]
+        else:
+            # Fresh patron ids, so every request is a new reservation
+            sequence += 1
+            priority = rng.randint(1, 20)
+            heapq.heappush(queue, (priority, sequence, sequence + 1))
+            yield f"BorrowBook({sequence + 1}, {book_id}, {priority})"
+
+
+def wide_scan_commands(num_books, num_ops, width=1000, seed=0):
+    """PrintBooks over ranges of width books starting at random ids."""
+    rng = random.Random(seed)
+    for _ in range(num_ops):
+        low = rng.randint(1, max(1, num_books - width))
+        yield f"PrintBooks({low}, {low + width - 1})"
+
+
+def closest_sweep_commands(num_books, num_ops, spacing=2, seed=0):
+    """
+    FindClosestBook for targets sweeping upward over a catalog of ids spaced apart, so
+    about half of the targets fall between two books and hit the tie case.
+    """
+    rng = random.Random(seed)
+    span = num_books * spacing
+    targets = sorted(rng.randint(0, span + spacing) for _ in range(num_ops))
+    for target_id in targets:
+        yield f"FindClosestBook({target_id})"
@@ -1,62 +1,232 @@
-from datetime import datetime
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import accumulate, compress, count, islice
+from operator import itemgetter
+from time import perf_counter
+import argparse
+import asyncio
+import heapq
+import io
+import json
+import math
+import mmap
+import multiprocessing
+import os
+import re
+import signal
+import struct
 import sys
+import tempfile
+import threading
+import time
+
+
+# Size of the write buffer used for the output file
+OUTPUT_BUFFER_SIZE = 1 << 16
+# Books whose rendered details are kept for PrintBook, PrintBooks and FindClosestBook
+DETAILS_CACHE_SIZE = 4096
+
+# Snapshot file layout (little-endian). A header, then one record per book in pre-order so the
+# exact tree shape and colors can be rebuilt:
+#   book:        book_id, flags, borrowed_by, byte lengths of the title, author and availability,
+#                reservation count, then the three UTF-8 strings
+#   reservation: patron_id, priority_number, time_of_reservation
+SNAPSHOT_MAGIC = b"GLIB"
+SNAPSHOT_VERSION = 3
+# magic, version, color flips, log generation, reservation sequence, book count
+SNAPSHOT_HEADER = struct.Struct("<4sHQQQQ")
+SNAPSHOT_BOOK = struct.Struct("<qBqIIII")
+SNAPSHOT_RESERVATION = struct.Struct("<qqq")
+# Book flags
+SNAPSHOT_RED = 1
+SNAPSHOT_HAS_LEFT = 2
+SNAPSHOT_HAS_RIGHT = 4
+SNAPSHOT_BORROWED = 8
+
+# Mapped catalog file layout, in fixed-size pages. Page 0 is the little-endian header; arrays
+# are in the machine's byte order. A leaf page holds a book count, the book ids in order,
+# the offset of each book's record and of the end of the last one (two bytes each, so pages
+# are at most MAPPED_MAX_PAGE_SIZE), then the records, which are snapshot book records followed by their reservations.
+# The directory takes whole pages of its own: the first book_id, page number, book count and
+# available count of every leaf, then the numbers of the free pages. A record too large to
+# share a leaf is kept in a chain of overflow pages, each starting with the number of the
+# next one (0 for the last), and its leaf holds a stub in its place.
+MAPPED_MAGIC = b"GLPG"
+MAPPED_VERSION = 2
+# magic, version, page size, leaf count, free page count, directory page, directory page count,
+# page count, book count, reservation sequence
+MAPPED_HEADER = struct.Struct("<4sHIQQQQQQQ")
+MAPPED_LEAF = struct.Struct("<I")
+# Book flags of leaf records, which have no tree shape to record
+MAPPED_AVAILABLE = 16
+MAPPED_OVERFLOW = 32
+# book_id, flags, first overflow page, record length
+MAPPED_OVERFLOW_STUB = struct.Struct("<qBqI")
+MAPPED_OVERFLOW_PAGE = struct.Struct("<q")
+PAGE_SIZE = 4096
+# Largest page whose end offset still fits the two bytes a leaf gives it
+MAPPED_MAX_PAGE_SIZE = 0xFFFF
+# Decoded leaf pages kept in memory by a mapped catalog
+PAGE_CACHE_SIZE = 1024
+# Changed pages a mapped catalog holds in memory before committing them
+DIRTY_PAGE_LIMIT = 4096
+
+
+# Node colors for the Red-Black tree, stored as small ints rather than strings
+BLACK = 0
+RED = 1
+
+# Availability status of a book that can be borrowed
+AVAILABLE = '"Yes"'
+# Borrower column value of a book nobody holds
+NO_BORROWER = -(1 << 63)
 
 
 class HeapNode:
-    def __init__(self, book_id, patron_id, priority_number, time_of_reservation=None):
+    # time_of_reservation is a sequence number from a monotonic counter, so reservations
+    # with equal priority are ordered by when they were made. key caches the ordering tuple.
+    __slots__ = ("book_id", "patron_id", "priority_number", "time_of_reservation", "key")
+
+    def __init__(self, book_id, patron_id, priority_number, time_of_reservation=0):
         self.book_id = book_id
         self.patron_id = patron_id
         self.priority_number = priority_number
         self.time_of_reservation = time_of_reservation
+        self.key = (priority_number, time_of_reservation)
+
+    def set_priority(self, priority_number):
+        self.priority_number = priority_number
+        self.key = (priority_number, self.time_of_reservation)
 
     def __lt__(self, other):
-        return self.priority_number < other.priority_number
+        return self.key < other.key
     
     def __str__(self):
         return f"({self.patron_id},{self.priority_number},{self.time_of_reservation})"
 
 
-
-       
-# self.color = 'RED'  # New nodes are always red
-
-
 class RBNode:
-    def __init__(self, book_id, book_name, author_name, availability_status, borrowed_by, reservation_heap=None, color='B', parent=None, left=None, right=None):
+    # Slotted to keep per-book memory small; the reservation heap is only created on the
+    # first reservation, since most books never get one. size and available count the books,
+    # and the available books, in the subtree rooted here (order-statistic augmentation).
+    # version goes up on every change to what print_book_details shows, so cached details
+    # can tell when they are stale. The title, author, availability and borrower live in
+    # row of a BookCatalog; only book_id, the tree key, is kept on the node itself. Books
+    # are created with BookCatalog.new_book.
+    __slots__ = ("book_id", "catalog", "row", "reservation_heap", "color", "parent", "left", "right",
+                 "size", "available", "version")
+
+    def __init__(self, book_id, catalog, row, reservation_heap=None, color=BLACK, parent=None, left=None, right=None):
         self.book_id = book_id
-        self.book_name = book_name
-        self.author_name = author_name
-        self.availability_status = availability_status
-        self.borrowed_by = borrowed_by
-        self.reservation_heap = reservation_heap if reservation_heap is not None else BinaryMinHeap()
-        self.color = color  # 'R' for red, 'B' for black
+        self.catalog = catalog
+        self.row = row
+        self.reservation_heap = reservation_heap  # None until the first reservation
+        self.color = color  # RED or BLACK
         self.parent = parent
         self.left = left
         self.right = right
+        self.size = 1
+        self.available = 0 if catalog is None else int(catalog.status_codes[row] == AVAILABLE_CODE)
+        self.version = 0
+
+    @property
+    def book_name(self):
+        catalog = self.catalog
+        title = catalog.titles[self.row]
+        return f'"{title}"' if catalog.title_quoted[self.row] else title
+
+    @property
+    def title(self):
+        # The title without its quotes, as the title index sorts it
+        return self.catalog.titles[self.row]
+
+    @property
+    def author_name(self):
+        catalog = self.catalog
+        return catalog.authors.strings[catalog.author_codes[self.row]]
+
+    @property
+    def availability_status(self):
+        catalog = self.catalog
+        return catalog.statuses.strings[catalog.status_codes[self.row]]
+
+    @availability_status.setter
+    def availability_status(self, availability_status):
+        catalog = self.catalog
+        catalog.status_codes[self.row] = catalog.statuses.encode(availability_status)
+
+    @property
+    def borrowed_by(self):
+        borrowed_by = self.catalog.borrowers[self.row]
+        return None if borrowed_by == NO_BORROWER else borrowed_by
+
+    @borrowed_by.setter
+    def borrowed_by(self, borrowed_by):
+        self.catalog.borrowers[self.row] = NO_BORROWER if borrowed_by is None else borrowed_by
 
 
     def insert_reservation(self, patron_id, priority_number, time_of_reservation):
+        if self.reservation_heap is None:
+            self.reservation_heap = BinaryMinHeap()
         reservation_node = HeapNode(self.book_id, patron_id, priority_number, time_of_reservation)
         self.reservation_heap.insert(reservation_node)
+        self.version += 1
 
     def extract_min_reservation(self):
+        if self.reservation_heap is None:
+            return None
+        self.version += 1
         return self.reservation_heap.extract_min()
+
+    def has_reservations(self):
+        return self.reservation_heap is not None and not self.reservation_heap.is_empty()
+
+    def find_reservation(self, patron_id):
+        if self.reservation_heap is None:
+            return None
+        return self.reservation_heap.find_existing_reservation(patron_id)
+
+    def update_reservation_priority(self, patron_id, priority_number):
+        self.version += 1
+        return self.reservation_heap.update_priority(patron_id, priority_number)
+
+    def cancel_reservation(self, patron_id):
+        if self.reservation_heap is None:
+            return None
+        self.version += 1
+        return self.reservation_heap.remove(patron_id)
+
+    def reservations(self):
+        """
+        Return the book's reservations in heap order.
+        """
+        if self.reservation_heap is None:
+            return []
+        return self.reservation_heap.heap[1:]
     
     def print_book_details(self):
+        # Read the columns directly rather than through the properties
+        catalog = self.catalog
+        row = self.row
+        borrowed_by = catalog.borrowers[row]
+        title = catalog.titles[row]
+        if catalog.title_quoted[row]:
+            title = f'"{title}"'
         details = (
             f"BookID = {self.book_id}\n"
-            f"Title = {self.book_name}\n"
-            f"Author = {self.author_name}\n"
-            f"Availability = {self.availability_status}\n"
-            f"BorrowedBy = {self.borrowed_by}\n"
+            f"Title = {title}\n"
+            f"Author = {catalog.authors.strings[catalog.author_codes[row]]}\n"
+            f"Availability = {catalog.statuses.strings[catalog.status_codes[row]]}\n"
+            f"BorrowedBy = {None if borrowed_by == NO_BORROWER else borrowed_by}\n"
         )
 
-        reservations = self.reservation_heap.heap
-        reservations = [reservation for reservation in reservations if reservation is not None]
-        reservations = sorted(reservations, key=lambda reservation: (reservation.priority_number, reservation.time_of_reservation) )
-        if any(reservations):
+        heap = self.reservation_heap
+        if heap is not None and heap.size:
             details += "Reservations = ["
-            details += ", ".join(str(reservation.patron_id) for reservation in reservations if reservation is not None)
+            details += ", ".join(str(reservation.patron_id) for reservation in heap.iter_in_order())
             details += "]\n"
         else:
             details += "Reservations = []\n"
@@ -67,18 +237,178 @@ class RBNode:
         """
         Print information about reservations for the book.
         """
-        if not self.reservation_heap.is_empty():
+        if self.has_reservations():
             print("Reservations:")
-            for reservation in self.reservation_heap.heap:
+            for reservation in self.reservations():
                 print(f"Patron ID: {reservation.patron_id}, Priority: {reservation.priority_number}, Reservation Time: {reservation.time_of_reservation}")
         else:
             print("No reservations for this book.")
 
+
+class StringTable:
+    """
+    Dictionary encoding of strings: each distinct string is stored once and referred to by
+    its code, its position in strings. Codes are never reused.
+    """
+    __slots__ = ("strings", "codes")
+
+    def __init__(self, strings=()):
+        self.strings = list(strings)
+        self.codes = {string: code for code, string in enumerate(self.strings)}
+
+    def __len__(self):
+        return len(self.strings)
+
+    def encode(self, string):
+        code = self.codes.get(string)
+        if code is None:
+            code = self.codes[string] = len(self.strings)
+            self.strings.append(string)
+        return code
+
+
+# Code of AVAILABLE in every BookCatalog's status table
+AVAILABLE_CODE = 1
+
+
+class BookCatalog:
+    """
+    Book metadata stored by column, one row per book, instead of as strings on every node:
+
+        book_ids      array of 64-bit ids
+        titles        title of each row without its quotes, the same string object the
+                      title index sorts by; title_quoted has a byte per row set if the
+                      title was given in quotes
+        author_codes  array of codes into authors, a StringTable, so each author is stored once
+        status_codes  array of codes into statuses, a StringTable; AVAILABLE_CODE marks
+                      an available book
+        borrowers     array of 64-bit patron ids, NO_BORROWER when nobody holds the book
+
+    Titles are a plain column rather than a StringTable: nearly every title is distinct,
+    and a table would add a dict entry per title. Rows of deleted books are reused by the
+    next books added. Status codes take a full array item per book rather than a bit, so
+    that two threads changing different books never write to the same byte, and a file may
+    use any number of distinct statuses.
+
+    author_rows() and borrowed_rows() scan a whole column in its raw bytes, so that only the
+    rows they return cost Python work; reading each item would build an int per row.
+    """
+    # Rows of borrowers compared at once by borrowed_rows()
+    BORROWER_BLOCK = 512
+
+    def __init__(self):
+        self.book_ids = array("q")
+        self.titles = []
+        self.title_quoted = bytearray()
+        self.author_codes = array("I")
+        self.status_codes = array("I")
+        self.borrowers = array("q")
+        self.authors = StringTable()
+        self.statuses = StringTable(('"No"', AVAILABLE))
+        self.free_rows = []
+
+    def __len__(self):
+        return len(self.book_ids) - len(self.free_rows)
+
+    def new_book(self, book_id, book_name, author_name, availability_status, borrowed_by, reservation_heap=None,
+                 color=BLACK):
+        """
+        Store a book's metadata in a free row and return a new RBNode for it.
+        """
+        author_code = self.authors.codes.get(author_name)
+        if author_code is None:
+            author_code = self.authors.encode(author_name)
+        status_code = self.statuses.codes.get(availability_status)
+        if status_code is None:
+            status_code = self.statuses.encode(availability_status)
+        borrower = NO_BORROWER if borrowed_by is None else borrowed_by
+        title = unquote(book_name)
+        # unquote returns book_name itself when there are no quotes to strip
+        quoted = title is not book_name
+        if self.free_rows:
+            row = self.free_rows.pop()
+            self.book_ids[row] = book_id
+            self.titles[row] = title
+            self.title_quoted[row] = quoted
+            self.author_codes[row] = author_code
+            self.status_codes[row] = status_code
+            self.borrowers[row] = borrower
+        else:
+            row = len(self.book_ids)
+            self.book_ids.append(book_id)
+            self.titles.append(title)
+            self.title_quoted.append(quoted)
+            self.author_codes.append(author_code)
+            self.status_codes.append(status_code)
+            self.borrowers.append(borrower)
+        return RBNode(book_id, self, row, reservation_heap, color)
+
+    def remove(self, book):
+        """
+        Free the row of a book that has left the library. The node must not be read after.
+        """
+        self.titles[book.row] = None
+        self.borrowers[book.row] = NO_BORROWER
+        self.free_rows.append(book.row)
+
+    def author_rows(self, author_name):
+        """
+        Return the rows of the books by author_name, in row order. The author's code is
+        searched for in the bytes of author_codes, skipping matches that straddle two codes.
+        """
+        code = self.authors.codes.get(author_name)
+        if code is None:
+            return []
+        width = self.author_codes.itemsize
+        find = self.author_codes.tobytes().find
+        needle = array("I", (code,)).tobytes()
+        titles = self.titles
+        rows = []
+        position = find(needle)
+        while position >= 0:
+            misaligned = position % width
+            if misaligned:
+                position = find(needle, position + width - misaligned)
+                continue
+            row = position // width
+            # Freed rows keep the code of the book that left
+            if titles[row] is not None:
+                rows.append(row)
+            position = find(needle, position + width)
+        return rows
+
+    def borrowed_rows(self):
+        """
+        Return the rows of the books someone holds, in row order. Blocks of BORROWER_BLOCK
+        rows that hold only NO_BORROWER are recognised by one byte comparison and skipped.
+        """
+        borrowers = self.borrowers
+        block_rows = self.BORROWER_BLOCK
+        block_bytes = block_rows * borrowers.itemsize
+        nobody = array("q", (NO_BORROWER,)).tobytes() * block_rows
+        starts_with = borrowers.tobytes().startswith
+        rows = []
+        for first in range(0, len(borrowers), block_rows):
+            # A short last block never matches and is checked row by row
+            if not starts_with(nobody, first * borrowers.itemsize):
+                block = borrowers[first:first + block_rows]
+                rows.extend(compress(range(first, first + len(block)), map(NO_BORROWER.__ne__, block)))
+        return rows
+
+
 class BinaryMinHeap:
-    def __init__(self, max_size=20):
-        self.max_size = max_size
+    """
+    Growable binary min-heap of reservations, indexed by patron. positions maps each
+    patron_id to its slot in heap, which gives O(1) membership and lets a reservation be
+    re-prioritized or cancelled in O(log n). Nodes are ordered by (priority_number,
+    time_of_reservation), so equal priorities are served first come, first served.
+    """
+    __slots__ = ("size", "heap", "positions")
+
+    def __init__(self):
         self.size = 0
-        self.heap = [None] * (max_size + 1)  # 1-indexed heap for easier calculations
+        self.heap = [None]  # 1-indexed heap for easier calculations
+        self.positions = {}
 
     def is_empty(self):
         return self.size == 0
@@ -91,18 +421,48 @@ class BinaryMinHeap:
     def get_size(self):
         return self.size
 
-    def insert(self, node):
-        if self.size == self.max_size:
-            print("Heap is full. Cannot insert more reservations.")
+    def __contains__(self, patron_id):
+        return patron_id in self.positions
+
+    def in_order(self):
+        """
+        Return the reservations in the order they would be served.
+        """
+        return list(self.iter_in_order())
+
+    def iter_in_order(self):
+        """
+        Yield the reservations in the order they would be served, without sorting the heap.
+        A small frontier heap holds the slots whose parents have been yielded, so the first
+        m reservations cost O(m log m) and the heap itself is left untouched.
+        """
+        heap = self.heap
+        size = self.size
+        if not size:
             return
+        frontier = [(heap[1].key, 1)]
+        while frontier:
+            _, i = heapq.heappop(frontier)
+            yield heap[i]
+            child = i * 2
+            if child <= size:
+                heapq.heappush(frontier, (heap[child].key, child))
+                if child + 1 <= size:
+                    heapq.heappush(frontier, (heap[child + 1].key, child + 1))
 
+    def insert(self, node):
+        self.heap.append(node)
         self.size += 1
-        i = self.size
-        self.heap[i] = node
-        
-        self.heapify_up(i)
-       
+        self.heapify_up(self.size)
 
+    def restore(self, nodes):
+        """
+        Fill an empty heap with nodes that are already in heap order.
+        """
+        for node in nodes:
+            self.heap.append(node)
+            self.size += 1
+            self.positions[node.patron_id] = self.size
 
     def extract_min(self):
 
@@ -110,35 +470,88 @@ class BinaryMinHeap:
             return None
 
         min_node = self.heap[1]
-        last_node = self.heap[self.size]
+        del self.positions[min_node.patron_id]
+        last_node = self.heap.pop()
         self.size -= 1
-        self.heap[1] = last_node
-        self.heap[self.size+1]=None
-        self.heapify_down(1)
+        if self.size:
+            self.heap[1] = last_node
+            self.heapify_down(1)
 
+        return min_node
 
+    def remove(self, patron_id):
+        """
+        Cancel the patron's reservation and return it, or None if there is none.
+        """
+        i = self.positions.pop(patron_id, None)
+        if i is None:
+            return None
 
-        return min_node
+        node = self.heap[i]
+        last_node = self.heap.pop()
+        self.size -= 1
+        if i <= self.size:
+            # Move the last node into the hole and restore the heap order around it
+            self.heap[i] = last_node
+            self.positions[last_node.patron_id] = i
+            if i > 1 and last_node.key < self.heap[i // 2].key:
+                self.heapify_up(i)
+            else:
+                self.heapify_down(i)
+        return node
+
+    def update_priority(self, patron_id, priority_number):
+        """
+        Change the priority of the patron's reservation and move it to its new place.
+        """
+        i = self.positions[patron_id]
+        node = self.heap[i]
+        old_priority = node.priority_number
+        node.set_priority(priority_number)
+        if priority_number < old_priority:
+            self.heapify_up(i)
+        elif priority_number > old_priority:
+            self.heapify_down(i)
+        return node
+
+    # Both sifts move the node through a hole instead of swapping at every level, updating
+    # positions for each node they shift
 
     def heapify_up(self, i):
-        while i > 1 and self.heap[i // 2].priority_number > self.heap[i].priority_number:
-            self.heap[i], self.heap[i // 2] = self.heap[i // 2], self.heap[i]
+        heap = self.heap
+        positions = self.positions
+        node = heap[i]
+        key = node.key
+        while i > 1:
+            parent = heap[i // 2]
+            if parent.key <= key:
+                break
+            heap[i] = parent
+            positions[parent.patron_id] = i
             i //= 2
+        heap[i] = node
+        positions[node.patron_id] = i
 
     def heapify_down(self, i):
-        while i * 2 <= self.size:
+        heap = self.heap
+        positions = self.positions
+        size = self.size
+        node = heap[i]
+        key = node.key
+        while i * 2 <= size:
             child = i * 2
-            if child + 1 <= self.size and self.heap[child + 1].priority_number < self.heap[child].priority_number:
+            if child + 1 <= size and heap[child + 1].key < heap[child].key:
                 child += 1
 
-            if self.heap[i].priority_number > self.heap[child].priority_number:
-                self.heap[i], self.heap[child] = self.heap[child], self.heap[i]
+            if key > heap[child].key:
+                heap[i] = heap[child]
+                positions[heap[i].patron_id] = i
             else:
                 break
 
             i = child
-
-        
+        heap[i] = node
+        positions[node.patron_id] = i
 
     def print_heap(self):
         print("Reservation Heap:")
@@ -147,30 +560,175 @@ class BinaryMinHeap:
             print(f"Patron ID: {node.patron_id}, Priority: {node.priority_number}, Reservation Time: {node.time_of_reservation}")
 
     def find_existing_reservation(self, patron_id):
-        for node in self.heap[1:]:
-            if node and node.patron_id == patron_id:
-                return node
-        return None
+        i = self.positions.get(patron_id)
+        return self.heap[i] if i is not None else None
+
+
+
+class SortedIndex:
+    """
+    Sorted collection of unique, comparable entries stored as a list of sorted blocks.
+    maxes holds the last entry of each block, so a lookup is two binary searches and an
+    insert or delete only shifts one block of at most 2 * BLOCK_SIZE entries.
+    """
+    __slots__ = ("blocks", "maxes", "size")
+    BLOCK_SIZE = 512
+
+    def __init__(self, entries=()):
+        """
+        entries, if given, must already be sorted.
+        """
+        entries = list(entries)
+        block_size = self.BLOCK_SIZE
+        self.blocks = [entries[i:i + block_size] for i in range(0, len(entries), block_size)]
+        self.maxes = [block[-1] for block in self.blocks]
+        self.size = len(entries)
+
+    def __len__(self):
+        return self.size
+
+    def add(self, entry):
+        if not self.blocks:
+            self.blocks.append([entry])
+            self.maxes.append(entry)
+        else:
+            i = bisect_left(self.maxes, entry)
+            if i == len(self.maxes):
+                # Larger than everything: goes at the end of the last block
+                i -= 1
+                self.blocks[i].append(entry)
+            else:
+                insort(self.blocks[i], entry)
+            block = self.blocks[i]
+            self.maxes[i] = block[-1]
+            if len(block) > 2 * self.BLOCK_SIZE:
+                half = len(block) // 2
+                self.blocks[i:i + 1] = [block[:half], block[half:]]
+                self.maxes[i:i + 1] = [block[half - 1], block[-1]]
+        self.size += 1
+
+    def remove(self, entry):
+        i = bisect_left(self.maxes, entry)
+        if i == len(self.maxes):
+            return False
+        block = self.blocks[i]
+        j = bisect_left(block, entry)
+        if block[j] != entry:
+            return False
+        del block[j]
+        if block:
+            self.maxes[i] = block[-1]
+        else:
+            del self.blocks[i]
+            del self.maxes[i]
+        self.size -= 1
+        return True
+
+    def iter_from(self, start):
+        """
+        Yield the entries >= start in sorted order.
+        """
+        i = bisect_left(self.maxes, start)
+        if i == len(self.maxes):
+            return
+        j = bisect_left(self.blocks[i], start)
+        for block in islice(self.blocks, i, None):
+            yield from islice(block, j, None)
+            j = 0
+
+    def __iter__(self):
+        for block in self.blocks:
+            yield from block
+
+
+class BookDetailsCache:
+    """
+    Bounded LRU cache of rendered book details, keyed by book_id. Each entry remembers the
+    book's version when it was rendered, so a book that has changed since is a miss and is
+    rendered again; a deleted book must be dropped with invalidate, since a new book with
+    the same id starts again at version 0. Range scans go through scan_details, which never
+    adds entries, so one wide PrintBooks cannot flush the books that point lookups keep hot.
+    """
+    __slots__ = ("capacity", "entries", "hits", "misses", "evictions")
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def details(self, book):
+        entry = self.entries.get(book.book_id)
+        if entry is not None and entry[0] == book.version:
+            self.hits += 1
+            try:
+                self.entries.move_to_end(book.book_id)
+            except KeyError:
+                # Evicted by another thread since the lookup above
+                pass
+            return entry[1]
+
+        self.misses += 1
+        details = book.print_book_details()
+        if self.capacity > 0:
+            self.entries[book.book_id] = (book.version, details)
+            while len(self.entries) > self.capacity:
+                try:
+                    self.entries.popitem(last=False)
+                except KeyError:
+                    break
+                self.evictions += 1
+        return details
+
+    def scan_details(self, book):
+        """
+        Return the book's details for a range scan: from the cache if they are there and
+        current, else rendered without being cached. Neither the LRU order nor the counts
+        change.
+        """
+        entry = self.entries.get(book.book_id)
+        if entry is not None and entry[0] == book.version:
+            return entry[1]
+        return book.print_book_details()
+
+    def invalidate(self, book_id):
+        self.entries.pop(book_id, None)
+
+    def clear(self):
+        self.entries.clear()
 
+    def stats(self):
+        return {"size": len(self.entries), "capacity": self.capacity, "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions}
 
 
 class RedBlackTree:
     def __init__(self):
-        self.NIL = RBNode(None, None, None, None, None, None, 'B')  # NIL node for leaves
+        self.NIL = RBNode(None, None, None, color=BLACK)  # NIL node for leaves
+        self.NIL.size = 0
         self.root = self.NIL
         self.color_flips = 0  # Initialize color flip count
+        # Rotations, and fixup steps that only recolor, counted apart from color_flips
+        self.rotations = 0
+        self.recolorings = 0
 
+    def __len__(self):
+        return self.root.size
+
+    def available_books(self):
+        return self.root.available
 
     def left_rotate(self, x):
         y = x.right
         x.right = y.left
 
-        if y.left != self.NIL:
+        if y.left is not self.NIL:
             y.left.parent = x
 
         y.parent = x.parent
 
-        if x.parent == self.NIL:
+        if x.parent is self.NIL:
             self.root = y
         elif x == x.parent.left:
             x.parent.left = y
@@ -179,6 +737,11 @@ class RedBlackTree:
 
         y.left = x
         x.parent = y
+        # y takes over x's subtree; x now roots what is left of it
+        y.size = x.size
+        y.available = x.available
+        self.update_counts(x)
+        self.rotations += 1
         # Increment color flip count after rotation
         self.color_flip_count()
 
@@ -186,12 +749,12 @@ class RedBlackTree:
         x = y.left
         y.left = x.right
 
-        if x.right != self.NIL:
+        if x.right is not self.NIL:
             x.right.parent = y
 
         x.parent = y.parent
 
-        if y.parent == self.NIL:
+        if y.parent is self.NIL:
             self.root = x
         elif y == y.parent.left:
             y.parent.left = x
@@ -200,17 +763,45 @@ class RedBlackTree:
 
         x.right = y
         y.parent = x
+        x.size = y.size
+        x.available = y.available
+        self.update_counts(y)
+        self.rotations += 1
         # Implementing color_flip_count for rotation methods
         self.color_flip_count()  
 
 
 
+    def update_counts(self, x):
+        x.size = x.left.size + x.right.size + 1
+        x.available = x.left.available + x.right.available + (x.availability_status == AVAILABLE)
+
+    def update_counts_to_root(self, x):
+        nil = self.NIL
+        while x is not nil:
+            self.update_counts(x)
+            x = x.parent
+
+    def adjust_available(self, x, delta):
+        """
+        Add delta to the available count of x and all of its ancestors, after x's
+        availability_status has changed.
+        """
+        nil = self.NIL
+        while x is not nil:
+            x.available += delta
+            x = x.parent
+
     def insert(self, z):
         y = self.NIL
         x = self.root
+        z_available = 1 if z.availability_status == AVAILABLE else 0
 
-        while x != self.NIL:
+        while x is not self.NIL:
             y = x
+            # z ends up below x, so x's subtree grows by one
+            x.size += 1
+            x.available += z_available
             if z.book_id < x.book_id:
                 x = x.left
             else:
@@ -218,7 +809,7 @@ class RedBlackTree:
 
         z.parent = y
 
-        if y == self.NIL:
+        if y is self.NIL:
             self.root = z
         elif z.book_id < y.book_id:
             y.left = z
@@ -227,18 +818,21 @@ class RedBlackTree:
 
         z.left = self.NIL
         z.right = self.NIL
-        z.color = 'R'  # New nodes are always colored red
+        z.size = 1
+        z.available = z_available
+        z.color = RED  # New nodes are always colored red
         self.insert_fixup(z)
 
     def insert_fixup(self, z):
-        while z.parent.color == 'R':
+        while z.parent.color == RED:
             if z.parent == z.parent.parent.left:
                 y = z.parent.parent.right
-                if y.color == 'R':
-                    z.parent.color = 'B'
-                    y.color = 'B'
-                    z.parent.parent.color = 'R'
+                if y.color == RED:
+                    z.parent.color = BLACK
+                    y.color = BLACK
+                    z.parent.parent.color = RED
                     z = z.parent.parent
+                    self.recolorings += 1
                     self.color_flip_count()  # Increment color flip count
                 else:
                     if z == z.parent.right:
@@ -246,17 +840,18 @@ class RedBlackTree:
                         self.left_rotate(z)
                         self.color_flip_count()  # Increment color flip count
 
-                    z.parent.color = 'B'
-                    z.parent.parent.color = 'R'
+                    z.parent.color = BLACK
+                    z.parent.parent.color = RED
                     self.right_rotate(z.parent.parent)
                     self.color_flip_count()  # Increment color flip count
             else:
                 y = z.parent.parent.left
-                if y.color == 'R':
-                    z.parent.color = 'B'
-                    y.color = 'B'
-                    z.parent.parent.color = 'R'
+                if y.color == RED:
+                    z.parent.color = BLACK
+                    y.color = BLACK
+                    z.parent.parent.color = RED
                     z = z.parent.parent
+                    self.recolorings += 1
                     self.color_flip_count()  # Increment color flip count
                 else:
                     if z == z.parent.left:
@@ -264,18 +859,90 @@ class RedBlackTree:
                         self.right_rotate(z)
                         self.color_flip_count()  # Increment color flip count
 
-                    z.parent.color = 'B'
-                    z.parent.parent.color = 'R'
+                    z.parent.color = BLACK
+                    z.parent.parent.color = RED
                     self.left_rotate(z.parent.parent)
                     self.color_flip_count()  # Increment color flip count
 
-        self.root.color = 'B'
+        self.root.color = BLACK
         
 
 
 
+    def build_from_sorted(self, nodes):
+        """
+        Replace the contents of the tree with nodes, which must be in strictly increasing
+        book_id order. The tree is built balanced in O(n) without rotations: the deepest,
+        possibly incomplete level is colored red and every other node black, which keeps the
+        black height equal on all paths. The color flip count is not changed.
+        """
+        nil = self.NIL
+        red_depth = len(nodes).bit_length() - 1
+
+        def build(low, high, depth, parent):
+            if low > high:
+                return nil
+            mid = (low + high) // 2
+            node = nodes[mid]
+            node.parent = parent
+            node.color = RED if depth == red_depth and depth > 0 else BLACK
+            node.left = build(low, mid - 1, depth + 1, node)
+            node.right = build(mid + 1, high, depth + 1, node)
+            self.update_counts(node)
+            return node
+
+        self.root = build(0, len(nodes) - 1, 0, nil)
+
+    def iter_preorder(self):
+        """
+        Yield every node in pre-order (node, left subtree, right subtree).
+        """
+        nil = self.NIL
+        stack = [self.root] if self.root is not nil else []
+        while stack:
+            x = stack.pop()
+            yield x
+            if x.right is not nil:
+                stack.append(x.right)
+            if x.left is not nil:
+                stack.append(x.left)
+
+    def build_from_preorder(self, entries):
+        """
+        Replace the contents of the tree from (node, has_left, has_right) entries in pre-order,
+        keeping each node's color. This reproduces a saved tree exactly in O(n), so later
+        operations rotate and recolor just as they would have on the original tree.
+        """
+        nil = self.NIL
+        self.root = nil
+        pending = []  # (parent, is_left) slots still waiting for a child, innermost last
+        nodes = []
+
+        for node, has_left, has_right in entries:
+            nodes.append(node)
+            node.left = nil
+            node.right = nil
+            if pending:
+                parent, is_left = pending.pop()
+                node.parent = parent
+                if is_left:
+                    parent.left = node
+                else:
+                    parent.right = node
+            else:
+                node.parent = nil
+                self.root = node
+            if has_right:
+                pending.append((node, False))
+            if has_left:
+                pending.append((node, True))
+
+        # Children follow their parent in pre-order, so reversed order counts them first
+        for node in reversed(nodes):
+            self.update_counts(node)
+
     def transplant(self, u, v):
-        if u.parent == self.NIL:
+        if u.parent is self.NIL:
             self.root = v
         elif u == u.parent.left:
             u.parent.left = v
@@ -287,10 +954,10 @@ class RedBlackTree:
     def delete(self, z):
         y = z
         y_original_color = y.color
-        if z.left == self.NIL:
+        if z.left is self.NIL:
             x = z.right
             self.transplant(z, z.right)
-        elif z.right == self.NIL:
+        elif z.right is self.NIL:
             x = z.left
             self.transplant(z, z.left)
         else:
@@ -309,93 +976,99 @@ class RedBlackTree:
             y.left.parent = y
             y.color = z.color
 
-        if y_original_color == 'B':
+        # Every node whose subtree lost a book is x's parent or one of its ancestors
+        self.update_counts_to_root(x.parent)
+
+        if y_original_color == BLACK:
             self.delete_fixup(x)
 
     
     def delete_fixup(self, x):
-        while x != self.root and x.color == 'B':
+        while x != self.root and x.color == BLACK:
             if x == x.parent.left:
                 w = x.parent.right
-                if w.color == 'R':
-                    w.color = 'B'
-                    x.parent.color = 'R'
+                if w.color == RED:
+                    w.color = BLACK
+                    x.parent.color = RED
                     self.left_rotate(x.parent)
                     w = x.parent.right
                     self.color_flip_count()  # Increment color flip count
 
-                if w.left.color == 'B' and w.right.color == 'B':
-                    w.color = 'R'
+                if w.left.color == BLACK and w.right.color == BLACK:
+                    w.color = RED
                     x = x.parent
+                    self.recolorings += 1
                 else:
-                    if w.right.color == 'B':
-                        w.left.color = 'B'
-                        w.color = 'R'
+                    if w.right.color == BLACK:
+                        w.left.color = BLACK
+                        w.color = RED
                         self.right_rotate(w)
                         w = x.parent.right
                         self.color_flip_count()  # Increment color flip count
 
                     w.color = x.parent.color
-                    x.parent.color = 'B'
-                    w.right.color = 'B'
+                    x.parent.color = BLACK
+                    w.right.color = BLACK
                     self.left_rotate(x.parent)
                     x = self.root
                     self.color_flip_count()  # Increment color flip count
             else:
                 w = x.parent.left
-                if w.color == 'R':
-                    w.color = 'B'
-                    x.parent.color = 'R'
+                if w.color == RED:
+                    w.color = BLACK
+                    x.parent.color = RED
                     self.right_rotate(x.parent)
                     w = x.parent.left
                     self.color_flip_count()  # Increment color flip count
 
-                if w.right.color == 'B' and w.left.color == 'B':
-                    w.color = 'R'
+                if w.right.color == BLACK and w.left.color == BLACK:
+                    w.color = RED
                     x = x.parent
+                    self.recolorings += 1
                 else:
-                    if w.left.color == 'B':
-                        w.right.color = 'B'
-                        w.color = 'R'
+                    if w.left.color == BLACK:
+                        w.right.color = BLACK
+                        w.color = RED
                         self.left_rotate(w)
                         w = x.parent.left
                         self.color_flip_count()  # Increment color flip count
 
                     w.color = x.parent.color
-                    x.parent.color = 'B'
-                    w.left.color = 'B'
+                    x.parent.color = BLACK
+                    w.left.color = BLACK
                     self.right_rotate(x.parent)
                     x = self.root
                     self.color_flip_count()  # Increment color flip count
 
-        x.color = 'B'
+        x.color = BLACK
         
 
 
     def search(self, key):
-        return self._search(self.root, key)
-
-    def _search(self, x, key):
-        if x == self.NIL or key == x.book_id:
-            return x
-        if key < x.book_id:
-            return self._search(x.left, key)
-        return self._search(x.right, key)
+        # Iterative descent; returns the NIL sentinel when the key is absent
+        nil = self.NIL
+        x = self.root
+        while x is not nil:
+            book_id = x.book_id
+            if key == book_id:
+                return x
+            x = x.left if key < book_id else x.right
+        return x
 
     def minimum(self, x):
-        while x.left != self.NIL:
+        while x.left is not self.NIL:
             x = x.left
         return x
 
     def print_tree(self, x, indent=0, title="Root"):
-        if x != self.NIL:
-            print("  " * indent + title + f" ({x.color}): {x.book_id}")
+        if x is not self.NIL:
+            print("  " * indent + title + f" ({'R' if x.color == RED else 'B'}): {x.book_id}")
             print("  " * (indent + 1) + f"Title: {x.book_name}")
             print("  " * (indent + 1) + f"Author: {x.author_name}")
             print("  " * (indent + 1) + f"Availability: {x.availability_status}")
             print("  " * (indent + 1) + f"Borrowed By: {x.borrowed_by}")
             print("  " * (indent + 1) + "Reservations: ", end="")
-            for reservation in x.reservation_heap.heap:
+            for reservation in x.reservations():
                 print(reservation.patron_id, end=" ")
             print()
             self.print_tree(x.left, indent + 1, "Left")
@@ -405,28 +1078,69 @@ class RedBlackTree:
 
     def delete_node(self, book_id):
         z = self.search(book_id)
-        if z != self.NIL:
+        if z is not self.NIL:
             self.delete(z)
             print(f"Book {book_id} is no longer available.")
         else:
             print(f"Book {book_id} not found in the Library.")
 
     def successor(self, x):
-        if x.right != self.NIL:
+        if x.right is not self.NIL:
             return self.minimum(x.right)
 
         y = x.parent
-        while y != self.NIL and x == y.right:
+        while y is not self.NIL and x is y.right:
             x = y
             y = y.parent
         return y
 
+    def maximum(self, x):
+        while x.right is not self.NIL:
+            x = x.right
+        return x
+
+    def predecessor(self, x):
+        if x.left is not self.NIL:
+            return self.maximum(x.left)
+
+        y = x.parent
+        while y is not self.NIL and x is y.left:
+            x = y
+            y = y.parent
+        return y
+
+    def search_sorted(self, keys, sweep_ratio=4):
+        """
+        Look up many keys given in increasing order, returning the matching nodes (NIL where
+        a key is absent) in the same order. When the keys are dense, i.e. the tree holds at
+        most sweep_ratio books per key between the first and last key, they are matched in
+        one in-order sweep that moves from each book to its successor. Sparse keys are
+        searched from the root one at a time, which is cheaper than walking every book
+        between them.
+        """
+        nil = self.NIL
+        if not keys:
+            return []
+        books_in_span, _ = self.count_in_range(keys[0], keys[-1])
+        if books_in_span > len(keys) * sweep_ratio:
+            search = self.search
+            return [search(key) for key in keys]
+
+        results = []
+        books = self.iter_books_in_range(keys[0], keys[-1])
+        book = next(books, nil)
+        for key in keys:
+            while book is not nil and book.book_id < key:
+                book = next(books, nil)
+            results.append(book if book is not nil and book.book_id == key else nil)
+        return results
+
     def find_closest_book(self, target_id):
         x = self.root
         closest_left = None
         closest_right = None
 
-        while x != self.NIL:
+        while x is not self.NIL:
             if x.book_id == target_id:
                 return x
 
@@ -453,107 +1167,1453 @@ class RedBlackTree:
 
         return None  # No closest node found
 
+    def bracket(self, target_id):
+        """
+        Return (lower, upper): the book with the largest book_id <= target_id and the book
+        with the smallest book_id > target_id, either of which may be NIL.
+        """
+        nil = self.NIL
+        x = self.root
+        lower = upper = nil
+        while x is not nil:
+            if target_id < x.book_id:
+                upper = x
+                x = x.left
+            else:
+                lower = x
+                x = x.right
+        return lower, upper
+
+    def nearest(self, target_id, k=1):
+        """
+        Return the k books closest to target_id, nearest first, in O(log n + k). Of two
+        books at the same distance the lower book_id comes first, and if the k-th book ties
+        with the next one on the other side both are returned, so nearest(target_id, 1) is
+        the book, or the tied pair of books, that find_closest_book reports.
+        """
+        if k == 1:
+            return self.closest(target_id)
+        lower, upper = self.bracket(target_id)
+        return self._walk_outward(target_id, k, lower, upper)
+
+    def closest(self, target_id):
+        """
+        nearest(target_id, 1) in one descent: the book with book_id target_id if there is
+        one, else the closer of the two books that bracket it, or both if they tie.
+        """
+        nil = self.NIL
+        x = self.root
+        lower = upper = nil
+        while x is not nil:
+            book_id = x.book_id
+            if target_id < book_id:
+                upper = x
+                x = x.left
+            elif target_id > book_id:
+                lower = x
+                x = x.right
+            else:
+                return [x]
+        if lower is nil:
+            return [] if upper is nil else [upper]
+        if upper is nil:
+            return [lower]
+        below = target_id - lower.book_id
+        above = upper.book_id - target_id
+        if below < above:
+            return [lower]
+        if above < below:
+            return [upper]
+        return [lower, upper]
+
+    def nearest_sorted(self, targets, k=1, sweep_ratio=4):
+        """
+        nearest() for many targets given in increasing order, returning one list of books
+        per target. As in search_sorted, dense targets share one in-order sweep that moves
+        the starting bracket forward by successor steps instead of searching from the root.
+        """
+        nil = self.NIL
+        if not targets:
+            return []
+        books_in_span, _ = self.count_in_range(targets[0], targets[-1])
+        if books_in_span > len(targets) * sweep_ratio:
+            nearest = self.nearest
+            return [nearest(target_id, k) for target_id in targets]
+
+        results = []
+        lower, upper = self.bracket(targets[0])
+        for target_id in targets:
+            while upper is not nil and upper.book_id <= target_id:
+                lower = upper
+                upper = self.successor(upper)
+            results.append(self._walk_outward(target_id, k, lower, upper))
+        return results
+
+    def _walk_outward(self, target_id, k, lower, upper):
+        # Merge the books below and above target_id by distance, starting from its bracket
+        nil = self.NIL
+        found = []
+        while len(found) < k and (lower is not nil or upper is not nil):
+            if upper is nil or (lower is not nil and target_id - lower.book_id <= upper.book_id - target_id):
+                found.append(lower)
+                lower = self.predecessor(lower)
+            else:
+                found.append(upper)
+                upper = self.successor(upper)
+        # A lower book taken last may tie with the next book above
+        if found and upper is not nil and found[-1].book_id <= target_id:
+            if upper.book_id - target_id == target_id - found[-1].book_id:
+                found.append(upper)
+        return found
+
 
     def color_flip_count(self):
         self.color_flips += 1
 
     
+    def iter_books(self):
+        """
+        Yield every book in book_id order, using an explicit stack instead of recursion.
+        """
+        nil = self.NIL
+        stack = []
+        x = self.root
+        while stack or x is not nil:
+            if x is not nil:
+                stack.append(x)
+                x = x.left
+            else:
+                x = stack.pop()
+                yield x
+                x = x.right
+
+    def iter_books_in_range(self, low, high):
+        """
+        Yield the books with low <= book_id <= high in book_id order. Subtrees entirely below
+        low are skipped and iteration stops at the first book above high.
+        """
+        nil = self.NIL
+        stack = []
+        x = self.root
+        while stack or x is not nil:
+            if x is not nil:
+                if x.book_id < low:
+                    # x and its left subtree are all below the range
+                    x = x.right
+                else:
+                    stack.append(x)
+                    x = x.left
+            else:
+                x = stack.pop()
+                if x.book_id > high:
+                    return
+                yield x
+                x = x.right
+
+    def count_below(self, key, inclusive=False):
+        """
+        Return (books, available books) with book_id < key, or <= key if inclusive, in
+        O(log n) using the subtree counts.
+        """
+        nil = self.NIL
+        books = 0
+        available = 0
+        x = self.root
+        while x is not nil:
+            if x.book_id < key or (inclusive and x.book_id == key):
+                # x and its whole left subtree are below the key
+                books += x.left.size + 1
+                available += x.left.available + (x.availability_status == AVAILABLE)
+                x = x.right
+            else:
+                x = x.left
+        return books, available
+
+    def count_in_range(self, low, high):
+        """
+        Return (books, available books) with low <= book_id <= high.
+        """
+        if low > high:
+            return 0, 0
+        books_high, available_high = self.count_below(high, inclusive=True)
+        books_low, available_low = self.count_below(low)
+        return books_high - books_low, available_high - available_low
+
+    def rank(self, key):
+        """
+        Return the 1-based position of the book with this id in book_id order, or None if
+        there is no such book.
+        """
+        if self.search(key) is self.NIL:
+            return None
+        return self.count_below(key)[0] + 1
+
+    def select(self, k):
+        """
+        Return the book with the k-th smallest book_id (1-based), or None if k is out of range.
+        """
+        nil = self.NIL
+        x = self.root
+        if not 1 <= k <= x.size:
+            return None
+        while x is not nil:
+            left_size = x.left.size
+            if k == left_size + 1:
+                return x
+            if k <= left_size:
+                x = x.left
+            else:
+                k -= left_size + 1
+                x = x.right
+        return None
+
     def get_all_books(self):
-        books = []
-        self._get_all_books(self.root, books)
-        return books
+        return list(self.iter_books())
+
+    def get_books_in_range(self, low, high):
+        return list(self.iter_books_in_range(low, high))
+
+
+
+class BlockedBookIndex:
+    """
+    Ordered index over book_id with the same interface as RedBlackTree, kept as a list of
+    sorted blocks instead of a tree. Each block holds up to 2 * BLOCK_SIZE books next to a
+    list of their ids, and maxes holds the largest id of every block, so a search is one
+    bisect over maxes and one inside a block. Inserts and deletes shift at most one block,
+    a block is split in two when it grows past 2 * BLOCK_SIZE and dropped when it empties.
+
+    Books are the same RBNode objects, with their tree links unused. Nothing is rotated or
+    recolored, so color_flips stays 0. Each block also has a bytearray marking its available
+    books and a count of them. Running totals of both over the blocks are rebuilt on the
+    first count_in_range, rank or select after a change, so reads in between cost two
+    bisects and one bytearray count.
+    """
+
+    BLOCK_SIZE = 512
+
+    def __init__(self):
+        self.NIL = RBNode(None, None, None, color=BLACK)  # returned for absent keys
+        self.NIL.size = 0
+        self.color_flips = 0
+        self.rotations = 0
+        self.recolorings = 0
+        self.blocks = []     # books of each block in book_id order
+        self.keys = []       # book ids of each block, parallel to blocks
+        self.maxes = []      # largest book id of each block
+        self.flags = []      # per block, 1 for each available book, parallel to blocks
+        self.available = []  # available books in each block
+        self.size = 0
+        # Books and available books before each block, or None until next needed
+        self.offsets = None
+
+    def __len__(self):
+        return self.size
+
+    def available_books(self):
+        return sum(self.available)
 
-    def _get_all_books(self, node, book_list):
-        if node != self.NIL:
-            self._get_all_books(node.left, book_list)
-            book_list.append(node)
-            self._get_all_books(node.right, book_list)
+    def search(self, key):
+        i = bisect_left(self.maxes, key)
+        if i < len(self.maxes):
+            keys = self.keys[i]
+            j = bisect_left(keys, key)
+            if keys[j] == key:
+                return self.blocks[i][j]
+        return self.NIL
+
+    def insert(self, z):
+        key = z.book_id
+        maxes = self.maxes
+        is_available = z.availability_status == AVAILABLE
+        self.size += 1
+        self.offsets = None
+        if not maxes:
+            self.blocks.append([z])
+            self.keys.append([key])
+            maxes.append(key)
+            self.flags.append(bytearray((is_available,)))
+            self.available.append(int(is_available))
+            return
+
+        i = bisect_left(maxes, key)
+        if i == len(maxes):
+            # Above every book: goes at the end of the last block
+            i -= 1
+            maxes[i] = key
+        keys = self.keys[i]
+        block = self.blocks[i]
+        flags = self.flags[i]
+        j = bisect_left(keys, key)
+        keys.insert(j, key)
+        block.insert(j, z)
+        flags.insert(j, is_available)
+        self.available[i] += is_available
+
+        if len(keys) > 2 * self.BLOCK_SIZE:
+            half = len(keys) // 2
+            upper_flags = flags[half:]
+            upper_available = upper_flags.count(1)
+            self.blocks.insert(i + 1, block[half:])
+            self.keys.insert(i + 1, keys[half:])
+            self.flags.insert(i + 1, upper_flags)
+            maxes.insert(i + 1, keys[-1])
+            self.available.insert(i + 1, upper_available)
+            del block[half:]
+            del keys[half:]
+            del flags[half:]
+            maxes[i] = keys[-1]
+            self.available[i] -= upper_available
+
+    def delete(self, z):
+        key = z.book_id
+        i = bisect_left(self.maxes, key)
+        keys = self.keys[i]
+        j = bisect_left(keys, key)
+        del keys[j]
+        del self.blocks[i][j]
+        self.available[i] -= self.flags[i].pop(j)
+        self.size -= 1
+        self.offsets = None
+        if keys:
+            self.maxes[i] = keys[-1]
+        else:
+            del self.blocks[i], self.keys[i], self.flags[i], self.maxes[i], self.available[i]
+
+    def adjust_available(self, x, delta):
+        """
+        Add delta, +1 or -1, to x's flag and to the available count of its block when x's
+        availability changes.
+        """
+        i, j = self._position(x.book_id)
+        self.flags[i][j] += delta
+        self.available[i] += delta
+        self.offsets = None
+
+    def build_from_sorted(self, nodes):
+        """
+        Replace the contents of the index with nodes, which must be in strictly increasing
+        book_id order, packed into full blocks. The color flip count is not changed.
+        """
+        size = self.BLOCK_SIZE
+        self.blocks = [nodes[start:start + size] for start in range(0, len(nodes), size)]
+        self.keys = [[book.book_id for book in block] for block in self.blocks]
+        self.maxes = [keys[-1] for keys in self.keys]
+        self.flags = [bytearray(book.availability_status == AVAILABLE for book in block) for block in self.blocks]
+        self.available = [flags.count(1) for flags in self.flags]
+        self.size = len(nodes)
+        self.offsets = None
+
+    def iter_preorder(self):
+        """
+        Yield the books in the pre-order of a balanced red-black tree holding them, so that
+        snapshots have the same layout whichever engine saved them.
+        """
+        tree = RedBlackTree()
+        # Share the sentinel, so callers can test the links against this index's NIL
+        tree.NIL = tree.root = self.NIL
+        tree.build_from_sorted(list(self.iter_books()))
+        return tree.iter_preorder()
+
+    def build_from_preorder(self, entries):
+        """
+        Replace the contents of the index from (node, has_left, has_right) entries in the
+        pre-order of a saved red-black tree.
+        """
+        tree = RedBlackTree()
+        tree.build_from_preorder(entries)
+        self.build_from_sorted(list(tree.iter_books()))
+
+    def iter_books(self):
+        for block in self.blocks:
+            yield from block
+
+    def iter_books_in_range(self, low, high):
+        """
+        Yield the books with low <= book_id <= high in book_id order.
+        """
+        i = bisect_left(self.maxes, low)
+        if i == len(self.maxes):
+            return
+        j = bisect_left(self.keys[i], low)
+        for block in islice(self.blocks, i, None):
+            for book in islice(block, j, None):
+                if book.book_id > high:
+                    return
+                yield book
+            j = 0
+
+    def get_all_books(self):
+        return list(self.iter_books())
 
     def get_books_in_range(self, low, high):
-        books = []
-        self._get_books_in_range(self.root, low, high, books)
-        return books
-
-    def _get_books_in_range(self, node, low, high, book_list):
-        if node != self.NIL:
-            if low <= node.book_id <= high:
-                self._get_books_in_range(node.left, low, high, book_list)
-                book_list.append(node)
-                self._get_books_in_range(node.right, low, high, book_list)
-            elif node.book_id < low:
-                self._get_books_in_range(node.right, low, high, book_list)
+        return list(self.iter_books_in_range(low, high))
+
+    def count_below(self, key, inclusive=False):
+        """
+        Return (books, available books) with book_id < key, or <= key if inclusive.
+        """
+        find = bisect_right if inclusive else bisect_left
+        i = find(self.maxes, key)
+        book_offsets, available_offsets = self._offsets()
+        books = book_offsets[i]
+        available = available_offsets[i]
+        if i < len(self.maxes):
+            j = find(self.keys[i], key)
+            books += j
+            available += self.flags[i].count(1, 0, j)
+        return books, available
+
+    def count_in_range(self, low, high):
+        """
+        Return (books, available books) with low <= book_id <= high.
+        """
+        if low > high:
+            return 0, 0
+        books_high, available_high = self.count_below(high, inclusive=True)
+        books_low, available_low = self.count_below(low)
+        return books_high - books_low, available_high - available_low
+
+    def rank(self, key):
+        """
+        Return the 1-based position of the book with this id in book_id order, or None if
+        there is no such book.
+        """
+        i = bisect_left(self.maxes, key)
+        if i == len(self.maxes):
+            return None
+        keys = self.keys[i]
+        j = bisect_left(keys, key)
+        if keys[j] != key:
+            return None
+        return self._offsets()[0][i] + j + 1
+
+    def select(self, k):
+        """
+        Return the book with the k-th smallest book_id (1-based), or None if k is out of range.
+        """
+        if not 1 <= k <= self.size:
+            return None
+        book_offsets = self._offsets()[0]
+        i = bisect_right(book_offsets, k - 1) - 1
+        return self.blocks[i][k - 1 - book_offsets[i]]
+
+    def _offsets(self):
+        if self.offsets is None:
+            self.offsets = (list(accumulate(map(len, self.keys), initial=0)),
+                            list(accumulate(self.available, initial=0)))
+        return self.offsets
+
+    def successor(self, x):
+        i, j = self._position(x.book_id)
+        return self._book_at(*self._step_up(i, j))
+
+    def predecessor(self, x):
+        i, j = self._position(x.book_id)
+        return self._book_at(*self._step_down(i, j))
+
+    def search_sorted(self, keys, sweep_ratio=4):
+        """
+        Look up many keys given in increasing order, returning the matching books (NIL where
+        a key is absent). Every search is already two bisects, so the keys are simply
+        searched one at a time; sweep_ratio is accepted for RedBlackTree compatibility.
+        """
+        search = self.search
+        return [search(key) for key in keys]
+
+    def nearest(self, target_id, k=1):
+        """
+        Return the k books closest to target_id, nearest first, with the same tie rules as
+        RedBlackTree.nearest: the lower book_id first, and the book on the other side too if
+        it ties with the k-th.
+        """
+        # Positions of the last book <= target_id and the first book > target_id
+        upper = self._position(target_id, bisect_right)
+        lower = self._step_down(*upper)
+        book_at = self._book_at
+        if k == 1:
+            return self._closer(target_id, book_at(*lower), book_at(*upper))
+        step_down = self._step_down
+        step_up = self._step_up
+        found = []
+        lower_book = book_at(*lower)
+        upper_book = book_at(*upper)
+        nil = self.NIL
+        while len(found) < k and (lower_book is not nil or upper_book is not nil):
+            if upper_book is nil or (lower_book is not nil and
+                                     target_id - lower_book.book_id <= upper_book.book_id - target_id):
+                found.append(lower_book)
+                lower = step_down(*lower)
+                lower_book = book_at(*lower)
+            else:
+                found.append(upper_book)
+                upper = step_up(*upper)
+                upper_book = book_at(*upper)
+        # A lower book taken last may tie with the next book above
+        if found and upper_book is not nil and found[-1].book_id <= target_id:
+            if upper_book.book_id - target_id == target_id - found[-1].book_id:
+                found.append(upper_book)
+        return found
+
+    def _closer(self, target_id, lower_book, upper_book):
+        # nearest(target_id, 1) from the two books that bracket target_id
+        nil = self.NIL
+        if lower_book is nil:
+            return [] if upper_book is nil else [upper_book]
+        below = target_id - lower_book.book_id
+        if upper_book is nil or below == 0:
+            return [lower_book]
+        above = upper_book.book_id - target_id
+        if below < above:
+            return [lower_book]
+        if above < below:
+            return [upper_book]
+        return [lower_book, upper_book]
+
+    def nearest_sorted(self, targets, k=1, sweep_ratio=4):
+        """
+        nearest() for many targets, one list of books per target. Each target is located
+        with two bisects, so there is no sweep; sweep_ratio is accepted for compatibility.
+        """
+        nearest = self.nearest
+        return [nearest(target_id, k) for target_id in targets]
+
+    def _position(self, key, find=bisect_left):
+        # (block, offset) of the first book with book_id >= key (> key for bisect_right),
+        # or one past the last book
+        i = find(self.maxes, key)
+        if i == len(self.maxes):
+            return i, 0
+        return i, find(self.keys[i], key)
+
+    def _step_up(self, i, j):
+        if i < len(self.blocks) and j + 1 < len(self.blocks[i]):
+            return i, j + 1
+        return i + 1, 0
+
+    def _step_down(self, i, j):
+        if j > 0:
+            return i, j - 1
+        if i > 0:
+            return i - 1, len(self.blocks[i - 1]) - 1
+        return -1, 0
+
+    def _book_at(self, i, j):
+        if 0 <= i < len(self.blocks):
+            return self.blocks[i][j]
+        return self.NIL
+
+
+BOOK_INDEX_ENGINES = {"redblack": RedBlackTree, "blocked": BlockedBookIndex}
+
+
+class MappedPage:
+    # A leaf page as read from the file: its ids and record offsets are read at once, and a
+    # book is decoded the first time it is needed. The books share a small BookCatalog of
+    # their own, so evicting the page from the cache frees them with it.
+    __slots__ = ("data", "keys", "offsets", "books", "catalog", "index")
+
+    def __init__(self, data, catalog, index, books=None):
+        count = MAPPED_LEAF.unpack_from(data, 0)[0]
+        keys_end = MAPPED_LEAF.size + 8 * count
+        self.data = data
+        self.keys = array("q")
+        self.keys.frombytes(data[MAPPED_LEAF.size:keys_end])
+        self.offsets = array("H")
+        self.offsets.frombytes(data[keys_end:keys_end + 2 * (count + 1)])
+        self.books = [None] * count if books is None else books
+        self.catalog = catalog
+        self.index = index
+
+    def book(self, j):
+        book = self.books[j]
+        if book is None:
+            record = self.record(j)
+            book, _, _ = next(GatorLibrary._read_snapshot_books(self.catalog, record, 0, 1))
+            self.books[j] = book
+        return book
+
+    def record(self, j):
+        # Book j's whole record, read from its overflow pages if it has them
+        record = self.data[self.offsets[j]:self.offsets[j + 1]]
+        if record[8] & MAPPED_OVERFLOW:
+            return self.index._read_overflow(record)
+        return record
+
+    def entries(self):
+        # [book_id, book or None if not decoded, record] for each book
+        data = self.data
+        offsets = self.offsets
+        return [[key, book, data[offsets[j]:offsets[j + 1]]]
+                for j, (key, book) in enumerate(zip(self.keys, self.books))]
+
+
+class MappedBookIndex:
+    """
+    Ordered index over book_id kept in a memory-mapped file of fixed-size pages, for catalogs
+    larger than memory, with the interface of the BOOK_INDEX_ENGINES. Books live in leaf
+    pages in book_id order; only the directory, 24 bytes per leaf, is read into memory when
+    the file is opened. Leaves read from the mapping are kept in an LRU cache of
+    page_cache_size pages, and within a leaf only the books asked for are decoded into
+    RBNodes, so a search reads one page and decodes one book, and a range scan reads only
+    the pages it covers.
+
+    Changes are copy-on-write. A changed leaf is written to a page the last commit does not
+    use, and a leaf that outgrows its page is split in two. Changed pages stay in memory
+    until commit(), which writes them, then a new directory, and only then the header that
+    points to it, so a crash at any moment leaves the last commit intact. Pages the last
+    commit stopped using are reused by later changes. Nothing is rotated, so color_flips
+    stays 0. A book whose record, reservations included, takes more than a quarter of a
+    page is moved to a chain of overflow pages, so a book may have any number of
+    reservations and a leaf always holds at least four books.
+    """
+
+    def __init__(self, filename, page_cache_size=PAGE_CACHE_SIZE, page_size=PAGE_SIZE,
+                 dirty_page_limit=DIRTY_PAGE_LIMIT):
+        self.NIL = RBNode(None, None, None, color=BLACK)  # returned for absent keys
+        self.NIL.size = 0
+        self.color_flips = 0
+        self.rotations = 0
+        self.recolorings = 0
+        self.filename = filename
+        self.page_cache_size = page_cache_size
+        self.dirty_page_limit = dirty_page_limit
+        self.pages = OrderedDict()  # page number to MappedPage, least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.dirty = {}              # page number to the page's bytes, for pages changed since the last commit
+        self.fresh_pages = set()     # pages first used since the last commit, free to overwrite
+        self.released_pages = []     # pages the last commit uses and the next one will not
+        # Books and available books before each leaf, or None until next needed
+        self.offsets = None
+        self.data = None
+        self.file = open(filename, "r+b" if os.path.exists(filename) else "w+b")
+        if os.fstat(self.file.fileno()).st_size == 0:
+            if not MAPPED_HEADER.size <= page_size <= MAPPED_MAX_PAGE_SIZE:
+                raise ValueError(f"Page size must be between {MAPPED_HEADER.size} and {MAPPED_MAX_PAGE_SIZE} bytes")
+            self.page_size = page_size
+            self.leaf_keys = array("q")       # first book id of each leaf
+            self.leaf_pages = array("q")      # page number of each leaf
+            self.leaf_counts = array("I")     # books in each leaf
+            self.leaf_available = array("I")  # available books in each leaf
+            self.free_pages = []
+            self.directory_page = 0
+            self.directory_page_count = 0
+            self.page_count = 1
+            self.book_count = 0
+            self.reservation_sequence = 0
+            self.commit()
+        else:
+            self._open()
+
+    def _open(self):
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.page_size, leaf_count, free_count, self.directory_page, self.directory_page_count,
+         self.page_count, self.book_count, self.reservation_sequence) = MAPPED_HEADER.unpack_from(self.data, 0)
+        # Version 1 files are the same without overflow pages
+        if magic != MAPPED_MAGIC or version not in (1, MAPPED_VERSION):
+            raise ValueError(f"{self.filename} is not a mapped catalog")
+        offset = self.directory_page * self.page_size
+
+        def read_column(typecode, length):
+            nonlocal offset
+            column = array(typecode)
+            end = offset + length * column.itemsize
+            column.frombytes(self.data[offset:end])
+            offset = end
+            return column
+
+        self.leaf_keys = read_column("q", leaf_count)
+        self.leaf_pages = read_column("q", leaf_count)
+        self.leaf_counts = read_column("I", leaf_count)
+        self.leaf_available = read_column("I", leaf_count)
+        self.free_pages = read_column("q", free_count).tolist()
+
+    def commit(self):
+        """
+        Make every change since the last commit durable: write the changed pages and a new
+        directory to pages the last commit does not use, sync them, then write and sync the
+        header.
+        """
+        page_size = self.page_size
+        fileno = self.file.fileno()
+        for page_number, data in sorted(self.dirty.items()):
+            os.pwrite(fileno, data, page_number * page_size)
+
+        # The directory needs consecutive pages, taken from the free pages if they have a long
+        # enough run. Its size is worked out with every free page listed, so it still fits
+        # once the run is taken out.
+        free_pages = sorted(self.free_pages)
+        released_pages = self.released_pages + list(range(self.directory_page,
+                                                          self.directory_page + self.directory_page_count))
+        leaf_bytes = len(self.leaf_keys) * (self.leaf_keys.itemsize + self.leaf_pages.itemsize +
+                                            self.leaf_counts.itemsize + self.leaf_available.itemsize)
+        directory_page_count = -(-(leaf_bytes + 8 * (len(free_pages) + len(released_pages))) // page_size)
+        directory_page = self._take_run(free_pages, directory_page_count) if directory_page_count else self.page_count
+        # Once the new header is written, the old directory and the pages released since
+        # the last commit are free too, and free pages at the end of the file are cut off
+        free_pages.extend(released_pages)
+        free_pages.sort()
+        page_count = max(self.page_count, directory_page + directory_page_count)
+        while free_pages and free_pages[-1] == page_count - 1:
+            free_pages.pop()
+            page_count -= 1
+        directory = b"".join((self.leaf_keys.tobytes(), self.leaf_pages.tobytes(), self.leaf_counts.tobytes(),
+                              self.leaf_available.tobytes(), array("q", free_pages).tobytes()))
+        if directory_page_count:
+            os.pwrite(fileno, directory.ljust(directory_page_count * page_size, b"\0"), directory_page * page_size)
+        os.fsync(fileno)
+        header = MAPPED_HEADER.pack(MAPPED_MAGIC, MAPPED_VERSION, page_size, len(self.leaf_keys), len(free_pages),
+                                    directory_page, directory_page_count, page_count, self.book_count,
+                                    self.reservation_sequence)
+        os.pwrite(fileno, header.ljust(page_size, b"\0"), 0)
+        os.fsync(fileno)
+        os.ftruncate(fileno, max(page_count, 1) * page_size)
+
+        self.free_pages = free_pages
+        self.released_pages = []
+        self.fresh_pages = set()
+        self.dirty = {}
+        self.directory_page = directory_page
+        self.directory_page_count = directory_page_count
+        self.page_count = page_count
+        if self.data is not None:
+            self.data.close()
+        self.data = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+
+    def _take_run(self, free_pages, length):
+        # Remove the first run of length consecutive pages from the sorted free_pages and
+        # return where it starts, or the end of the file if there is no such run
+        start = 0
+        for i in range(1, len(free_pages) + 1):
+            if i == len(free_pages) or free_pages[i] != free_pages[i - 1] + 1:
+                if i - start >= length:
+                    first = free_pages[start]
+                    del free_pages[start:start + length]
+                    return first
+                start = i
+        return self.page_count
+
+    def close(self):
+        self.commit()
+        self.data.close()
+        self.file.close()
+
+    def __len__(self):
+        return self.book_count
+
+    def available_books(self):
+        return sum(self.leaf_available)
+
+    def page_cache_stats(self):
+        return {"pages": self.page_count, "leaves": len(self.leaf_keys), "size": len(self.pages),
+                "capacity": self.page_cache_size, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "dirty": len(self.dirty)}
+
+    def _leaf(self, key):
+        # Index of the leaf that holds key, if any leaf does
+        return max(bisect_right(self.leaf_keys, key) - 1, 0)
+
+    def _page(self, i):
+        # Leaf i, decoded from the cache, the changed pages or the mapping
+        page_number = self.leaf_pages[i]
+        page = self.pages.get(page_number)
+        if page is not None:
+            self.hits += 1
+            self.pages.move_to_end(page_number)
+            return page
+
+        self.misses += 1
+        page = MappedPage(self._page_data(page_number), BookCatalog(), self)
+        self._cache(page_number, page)
+        return page
+
+    def _page_data(self, page_number):
+        # A page's bytes, from the changed pages or the mapping
+        data = self.dirty.get(page_number)
+        if data is None:
+            start = page_number * self.page_size
+            data = self.data[start:start + self.page_size]
+        return data
+
+    def _cache(self, page_number, page):
+        self.pages[page_number] = page
+        while len(self.pages) > self.page_cache_size:
+            self.pages.popitem(last=False)
+            self.evictions += 1
+
+    def _allocate(self):
+        page_number = self.free_pages.pop() if self.free_pages else self._extend()
+        self.fresh_pages.add(page_number)
+        return page_number
+
+    def _extend(self):
+        self.page_count += 1
+        return self.page_count - 1
+
+    def _release(self, page_number):
+        self.pages.pop(page_number, None)
+        if page_number in self.fresh_pages:
+            # Never committed, so it can be reused at once
+            self.fresh_pages.discard(page_number)
+            self.dirty.pop(page_number, None)
+            self.free_pages.append(page_number)
+        else:
+            self.released_pages.append(page_number)
+
+    @staticmethod
+    def _pack_book(book_id, book_name, author_name, availability_status, borrowed_by, reservations):
+        # One book as a snapshot book record, followed by its reservations in heap order
+        title = book_name.encode("utf-8")
+        author = author_name.encode("utf-8")
+        availability = availability_status.encode("utf-8")
+        flags = 0 if borrowed_by is None else SNAPSHOT_BORROWED
+        if availability_status == AVAILABLE:
+            flags |= MAPPED_AVAILABLE
+        parts = [SNAPSHOT_BOOK.pack(book_id, flags, borrowed_by or 0, len(title), len(author),
+                                    len(availability), len(reservations)),
+                 title, author, availability]
+        parts.extend(SNAPSHOT_RESERVATION.pack(reservation.patron_id, reservation.priority_number,
+                                               reservation.time_of_reservation) for reservation in reservations)
+        return b"".join(parts)
+
+    def _packed(self, book):
+        return self._pack_book(book.book_id, book.book_name, book.author_name, book.availability_status,
+                               book.borrowed_by, book.reservations())
+
+    def _pack_page(self, keys, records):
+        offsets = array("H")
+        offset = MAPPED_LEAF.size + 10 * len(keys) + 2
+        for record in records:
+            offsets.append(offset)
+            offset += len(record)
+        offsets.append(offset)
+        data = b"".join((MAPPED_LEAF.pack(len(keys)), array("q", keys).tobytes(), offsets.tobytes(), *records))
+        return data.ljust(self.page_size, b"\0")
+
+    def _page_capacity(self):
+        # Bytes of records a page can hold, less 10 bytes for each record's id and offset
+        return self.page_size - MAPPED_LEAF.size - 2
+
+    def _leaf_record(self, record):
+        # The record as its leaf holds it: the record itself, or if it takes more than a
+        # quarter of a page, a stub pointing to new overflow pages that hold it
+        if 10 + len(record) <= self._page_capacity() // 4:
+            return record
+        chunk_size = self.page_size - MAPPED_OVERFLOW_PAGE.size
+        pages = [self._allocate() for _ in range(-(-len(record) // chunk_size))]
+        for n, page_number in enumerate(pages):
+            next_page = pages[n + 1] if n + 1 < len(pages) else 0
+            chunk = record[n * chunk_size:(n + 1) * chunk_size]
+            self.dirty[page_number] = (MAPPED_OVERFLOW_PAGE.pack(next_page) + chunk).ljust(self.page_size, b"\0")
+        flags = (record[8] & MAPPED_AVAILABLE) | MAPPED_OVERFLOW
+        return MAPPED_OVERFLOW_STUB.pack(SNAPSHOT_BOOK.unpack_from(record)[0], flags, pages[0], len(record))
+
+    def _overflow_pages(self, stub):
+        # Page numbers of a stub's overflow pages, in order
+        _, _, page_number, _ = MAPPED_OVERFLOW_STUB.unpack_from(stub)
+        while page_number:
+            yield page_number
+            page_number = MAPPED_OVERFLOW_PAGE.unpack_from(self._page_data(page_number))[0]
+
+    def _read_overflow(self, stub):
+        length = MAPPED_OVERFLOW_STUB.unpack_from(stub)[3]
+        header_size = MAPPED_OVERFLOW_PAGE.size
+        record = b"".join(self._page_data(page_number)[header_size:] for page_number in self._overflow_pages(stub))
+        return record[:length]
+
+    def _release_record(self, record):
+        # Free the overflow pages of a record that is being replaced or deleted
+        if record[8] & MAPPED_OVERFLOW:
+            for page_number in list(self._overflow_pages(record)):
+                self._release(page_number)
+
+    def _split(self, entries):
+        # Cut entries into runs that each fit in a page, halving by size. Every leaf record
+        # takes at most a quarter of a page, so a single entry always fits.
+        total = sum(10 + len(record) for _, _, record in entries)
+        if total <= self._page_capacity() or len(entries) == 1:
+            return [entries]
+        middle = 0
+        size = 0
+        while middle < len(entries) - 1 and size + 10 + len(entries[middle][2]) <= total // 2:
+            size += 10 + len(entries[middle][2])
+            middle += 1
+        middle = max(middle, 1)
+        return self._split(entries[:middle]) + self._split(entries[middle:])
+
+    @staticmethod
+    def _record_available(record):
+        # The flags follow the 8-byte book_id
+        return 1 if record[8] & MAPPED_AVAILABLE else 0
+
+    def _store_leaf(self, i, entries, catalog):
+        # Write leaf i again from its [book_id, book, record] entries, with record None for
+        # a book that changed, to a fresh page; split it if it no longer fits, and drop it
+        # if it is empty
+        for entry in entries:
+            if entry[2] is None:
+                entry[2] = self._leaf_record(self._packed(entry[1]))
+        runs = self._split(entries) if entries else []
+        self._release(self.leaf_pages[i])
+        self.offsets = None
+        if not entries:
+            del self.leaf_keys[i], self.leaf_pages[i], self.leaf_counts[i], self.leaf_available[i]
+            return
+
+        for n, run in enumerate(runs):
+            page_number = self._allocate()
+            keys = [key for key, _, _ in run]
+            records = [record for _, _, record in run]
+            data = self._pack_page(keys, records)
+            self.dirty[page_number] = data
+            self._cache(page_number, MappedPage(data, catalog, self, [book for _, book, _ in run]))
+            available = sum(map(self._record_available, records))
+            if n == 0:
+                self.leaf_keys[i] = keys[0]
+                self.leaf_pages[i] = page_number
+                self.leaf_counts[i] = len(keys)
+                self.leaf_available[i] = available
             else:
-                self._get_books_in_range(node.left, low, high, book_list)
+                self.leaf_keys.insert(i + n, keys[0])
+                self.leaf_pages.insert(i + n, page_number)
+                self.leaf_counts.insert(i + n, len(keys))
+                self.leaf_available.insert(i + n, available)
+
+    def search(self, key):
+        if not self.leaf_keys:
+            return self.NIL
+        page = self._page(self._leaf(key))
+        j = bisect_left(page.keys, key)
+        if j < len(page.keys) and page.keys[j] == key:
+            return page.book(j)
+        return self.NIL
+
+    def insert(self, z):
+        key = z.book_id
+        if not self.leaf_keys:
+            entries = [[key, z, self._leaf_record(self._packed(z))]]
+            self.leaf_keys.append(key)
+            self.leaf_pages.append(self._allocate())
+            self.leaf_counts.append(0)
+            self.leaf_available.append(0)
+            self._store_leaf(0, entries, z.catalog)
+        else:
+            i = self._leaf(key)
+            page = self._page(i)
+            entries = page.entries()
+            entries.insert(bisect_left(page.keys, key), [key, z, None])
+            self._store_leaf(i, entries, page.catalog)
+        self.book_count += 1
+
+    def insert_record(self, book_id, book_name, author_name, availability_status, borrowed_by,
+                      reservation_heap=None):
+        """
+        Insert a new book into the catalog of the page it belongs to. Returns False, and
+        changes nothing, if the id is already taken.
+        """
+        if self.search(book_id) is not self.NIL:
+            return False
+        catalog = self._page(self._leaf(book_id)).catalog if self.leaf_keys else BookCatalog()
+        self.insert(catalog.new_book(book_id, book_name, author_name, availability_status, borrowed_by,
+                                     reservation_heap))
+        return True
+
+    def delete(self, z):
+        i = self._leaf(z.book_id)
+        page = self._page(i)
+        entries = page.entries()
+        self._release_record(entries.pop(bisect_left(page.keys, z.book_id))[2])
+        self._store_leaf(i, entries, page.catalog)
+        self.book_count -= 1
+
+    def write_back(self, book):
+        """
+        Write a book's page again after the book itself changed.
+        """
+        i = self._leaf(book.book_id)
+        page = self._page(i)
+        j = bisect_left(page.keys, book.book_id)
+        if j < len(page.keys) and page.keys[j] == book.book_id:
+            # The page may have been evicted and read again since book was found
+            entries = page.entries()
+            self._release_record(entries[j][2])
+            entries[j][1:] = book, None
+            self._store_leaf(i, entries, page.catalog)
+
+    def adjust_available(self, book, delta):
+        # The leaf's count is recomputed when the book is written back
+        self.leaf_available[self._leaf(book.book_id)] += delta
+        self.offsets = None
+
+    def bulk_insert(self, records, presorted=False):
+        """
+        Insert (book_id, book_name, author_name, availability_status) records, skipping ids
+        already in the catalog and repeated ids. An empty catalog is written straight into
+        full pages, committing every dirty_page_limit pages. Returns the number of books added.
+        """
+        if not presorted:
+            records = sorted(records, key=itemgetter(0))
+        if self.leaf_keys:
+            return sum(self.insert_record(*record, None) for record in records)
+
+        capacity = self._page_capacity()
+        keys = []
+        run = []
+        run_size = 0
+        run_available = 0
+        last_id = None
+        added = 0
+        for book_id, book_name, author_name, availability_status in records:
+            if book_id == last_id:
+                continue
+            record = self._leaf_record(self._pack_book(book_id, book_name, author_name, availability_status, None, ()))
+            if run_size + 10 + len(record) > capacity:
+                self._append_leaf(keys, run, run_available)
+                keys = []
+                run = []
+                run_size = 0
+                run_available = 0
+            keys.append(book_id)
+            run.append(record)
+            run_size += 10 + len(record)
+            run_available += availability_status == AVAILABLE
+            last_id = book_id
+            added += 1
+        if run:
+            self._append_leaf(keys, run, run_available)
+        self.offsets = None
+        return added
+
+    def _append_leaf(self, keys, records, available):
+        # Add a full leaf after the last one
+        page_number = self._allocate()
+        self.dirty[page_number] = self._pack_page(keys, records)
+        self.leaf_keys.append(keys[0])
+        self.leaf_pages.append(page_number)
+        self.leaf_counts.append(len(records))
+        self.leaf_available.append(available)
+        self.book_count += len(records)
+        if len(self.dirty) >= self.dirty_page_limit:
+            self.commit()
+
+    def iter_books(self):
+        for i in range(len(self.leaf_keys)):
+            page = self._page(i)
+            for j in range(len(page.keys)):
+                yield page.book(j)
+
+    def iter_books_in_range(self, low, high):
+        """
+        Yield the books with low <= book_id <= high in book_id order, reading only the
+        leaves in the range.
+        """
+        i, j = self._position(low)
+        while i < len(self.leaf_keys):
+            page = self._page(i)
+            keys = page.keys
+            for j in range(j, len(keys)):
+                if keys[j] > high:
+                    return
+                yield page.book(j)
+            i += 1
+            j = 0
+
+    def get_all_books(self):
+        return list(self.iter_books())
+
+    def get_books_in_range(self, low, high):
+        return list(self.iter_books_in_range(low, high))
+
+    def count_below(self, key, inclusive=False):
+        """
+        Return (books, available books) with book_id < key, or <= key if inclusive, from
+        the directory and at most one leaf.
+        """
+        if not self.leaf_keys:
+            return 0, 0
+        i = self._leaf(key)
+        page = self._page(i)
+        j = (bisect_right if inclusive else bisect_left)(page.keys, key)
+        book_offsets, available_offsets = self._offsets()
+        data = page.data
+        offsets = page.offsets
+        available = sum(self._record_available(data[offsets[n]:offsets[n + 1]]) for n in range(j))
+        return book_offsets[i] + j, available_offsets[i] + available
+
+    count_in_range = BlockedBookIndex.count_in_range
+
+    def rank(self, key):
+        """
+        Return the 1-based position of the book with this id in book_id order, or None if
+        there is no such book.
+        """
+        if self.search(key) is self.NIL:
+            return None
+        return self.count_below(key)[0] + 1
+
+    def select(self, k):
+        """
+        Return the book with the k-th smallest book_id (1-based), or None if k is out of range.
+        """
+        if not 1 <= k <= self.book_count:
+            return None
+        book_offsets = self._offsets()[0]
+        i = bisect_right(book_offsets, k - 1) - 1
+        return self._page(i).book(k - 1 - book_offsets[i])
 
+    def record_at(self, rank):
+        """
+        Return the whole record of the book with the given 0-based rank, without decoding it.
+        """
+        book_offsets = self._offsets()[0]
+        i = bisect_right(book_offsets, rank) - 1
+        return self._page(i).record(rank - book_offsets[i])
+
+    def _offsets(self):
+        if self.offsets is None:
+            self.offsets = (list(accumulate(self.leaf_counts, initial=0)),
+                            list(accumulate(self.leaf_available, initial=0)))
+        return self.offsets
+
+    # The same walks as BlockedBookIndex, over (leaf, offset) positions
+    successor = BlockedBookIndex.successor
+    predecessor = BlockedBookIndex.predecessor
+    search_sorted = BlockedBookIndex.search_sorted
+    nearest = BlockedBookIndex.nearest
+    _closer = BlockedBookIndex._closer
+    nearest_sorted = BlockedBookIndex.nearest_sorted
+
+    def _position(self, key, find=bisect_left):
+        # (leaf, offset) of the first book with book_id >= key (> key for bisect_right),
+        # or one past the last book
+        if not self.leaf_keys:
+            return 0, 0
+        i = self._leaf(key)
+        j = find(self._page(i).keys, key)
+        if j == self.leaf_counts[i]:
+            return i + 1, 0
+        return i, j
+
+    def _step_up(self, i, j):
+        if i < len(self.leaf_keys) and j + 1 < self.leaf_counts[i]:
+            return i, j + 1
+        return i + 1, 0
+
+    def _step_down(self, i, j):
+        if j > 0:
+            return i, j - 1
+        if i > 0:
+            return i - 1, self.leaf_counts[i - 1] - 1
+        return -1, 0
+
+    def _book_at(self, i, j):
+        if 0 <= i < len(self.leaf_keys):
+            return self._page(i).book(j)
+        return self.NIL
 
 
 class GatorLibrary:
-    def __init__(self):
-        self.red_black_tree = RedBlackTree()
+    # Commands this kind of library answers with a one-line "not supported" result
+    unsupported_commands = frozenset()
+
+    def __init__(self, details_cache_size=DETAILS_CACHE_SIZE, engine="redblack", book_index=None):
+        # Books ordered by book_id, in one of the BOOK_INDEX_ENGINES unless book_index is given
+        self.engine = engine
+        self.book_index = BOOK_INDEX_ENGINES[engine]() if book_index is None else book_index
+        # Title, author, availability and borrower of every book, by column
+        self.catalog = BookCatalog()
+        # Rendered details of recently printed books
+        self.details_cache = BookDetailsCache(details_cache_size)
+        # Secondary indexes: (title, book_id, book) entries in title order, and author name
+        # to (book_id, book) entries in book_id order. Names are indexed without their quotes.
+        self.title_index = SortedIndex()
+        self.author_index = {}
+        # Patron indexes: patron_id to {book_id: book} for the books they hold or have reserved
+        self.patron_loans = {}
+        self.patron_reservations = {}
+        # Generation of the write-ahead log whose records are already part of this state
+        self.log_generation = 0
+        # Monotonic counter used as the time of each new reservation
+        self.reservation_sequence = 0
+        # Guards what BorrowBook and ReturnBook change beyond their own book: the subtree
+        # availability counts, the patron indexes and reservation_sequence
+        self.index_lock = threading.Lock()
+
+    @property
+    def red_black_tree(self):
+        # Older name of book_index, from before the engine could be chosen
+        return self.book_index
 
     def print_book(self, book_id):
-        book = self.red_black_tree.search(book_id)
-        if book != self.red_black_tree.NIL:
-            return book.print_book_details()
+        return self.print_found_book(self.book_index.search(book_id), book_id)
+
+    def print_found_book(self, book, book_id):
+        if book is not self.book_index.NIL:
+            return self.details_cache.details(book)
         else:
             return f"Book {book_id} not found in the Library"
 
-    def print_books(self, book_id1, book_id2):
-        books = self.red_black_tree.get_books_in_range(int(book_id1), int(book_id2))
-        return books
+    def print_books(self, book_id1, book_id2, limit=None, after_id=None):
+        """
+        Return a lazy iterator over the books with book_id1 <= book_id <= book_id2, in book_id
+        order. For pagination, after_id skips every book up to and including that id, and
+        limit caps the number of books returned.
+        """
+        low = int(book_id1)
+        if after_id is not None:
+            low = max(low, int(after_id) + 1)
+        books = self.book_index.iter_books_in_range(low, int(book_id2))
+        return books if limit is None else islice(books, limit)
+
+    def write_books(self, output_file, book_id1, book_id2, limit=None, after_id=None):
+        """
+        Write the details of each book in the range to output_file as it is reached, so a
+        scan of any size needs only constant memory. Returns the id of the last book written,
+        which is the after_id for the next page, or None if no book was written.
+        """
+        last_book_id = None
+        write = output_file.write
+        details = self.details_cache.scan_details
+        for book in self.print_books(book_id1, book_id2, limit, after_id):
+            write(details(book))
+            write("\n")
+            last_book_id = book.book_id
+        return last_book_id
     
     def insert_book(self, book_id, book_name, author_name, availability_status, borrowed_by, reservation_heap=None):
-        book = self.red_black_tree.search(book_id)
+        book = self.book_index.search(book_id)
 
-        if book == self.red_black_tree.NIL:
+        if book is self.book_index.NIL:
             # Book not found, create and insert a new book
-            new_book = RBNode(book_id, book_name, author_name, availability_status, borrowed_by, reservation_heap)
-            self.red_black_tree.insert(new_book)
+            new_book = self.catalog.new_book(book_id, book_name, author_name, availability_status, borrowed_by,
+                                             reservation_heap)
+            self.book_index.insert(new_book)
+            self.add_to_indexes(new_book)
             # No print statement here
     
+    def bulk_insert(self, records, presorted=False):
+        """
+        Insert many books at once from (book_id, book_name, author_name, availability_status)
+        records and rebuild the tree in O(n), instead of one search and insert per book.
+        As with insert_book, ids already in the library are ignored, and so are repeated ids
+        after their first record. Pass presorted=True if the records are already in
+        increasing book_id order to skip the sort. Returns the number of books added.
+        """
+        if not presorted:
+            records = sorted(records, key=lambda record: record[0])
+
+        tree = self.book_index
+        new_book = self.catalog.new_book
+        existing = tree.iter_books()
+        current = next(existing, None)
+        nodes = []
+        new_books = []
+
+        # Merge the new records into the existing books, both in book_id order
+        for book_id, book_name, author_name, availability_status in records:
+            while current is not None and current.book_id < book_id:
+                nodes.append(current)
+                current = next(existing, None)
+            if current is not None and current.book_id == book_id:
+                continue
+            if nodes and nodes[-1].book_id == book_id:
+                continue
+            book = new_book(book_id, book_name, author_name, availability_status, None)
+            nodes.append(book)
+            new_books.append(book)
+        while current is not None:
+            nodes.append(current)
+            current = next(existing, None)
+
+        tree.build_from_sorted(nodes)
+        if len(new_books) * 8 > len(nodes):
+            self.rebuild_indexes()
+        else:
+            for new_book in new_books:
+                self.add_to_indexes(new_book)
+        return len(new_books)
+
+    def add_to_indexes(self, book):
+        self.title_index.add((book.title, book.book_id, book))
+        insort(self.author_index.setdefault(unquote(book.author_name), []), (book.book_id, book))
+        self.track_patrons_of(book)
+
+    def remove_from_indexes(self, book):
+        self.title_index.remove((book.title, book.book_id, book))
+        author = unquote(book.author_name)
+        author_books = self.author_index[author]
+        del author_books[bisect_left(author_books, (book.book_id, book))]
+        if not author_books:
+            del self.author_index[author]
+        self.untrack_patrons_of(book)
+
+    def rebuild_indexes(self):
+        """
+        Rebuild the title, author and patron indexes from every book in the tree.
+        """
+        books = list(self.book_index.iter_books())
+        catalog = self.catalog
+        titles = catalog.titles
+        author_codes = catalog.author_codes
+        self.title_index = SortedIndex(sorted((titles[book.row], book.book_id, book) for book in books))
+        self.patron_loans = {}
+        self.patron_reservations = {}
+        # One list per author code, so each author name is unquoted once
+        author_books = [[] for _ in range(len(catalog.authors))]
+        # Books come in book_id order, so each author's list is built already sorted
+        for book in books:
+            author_books[author_codes[book.row]].append((book.book_id, book))
+            if book.borrowed_by is not None or book.reservation_heap is not None:
+                self.track_patrons_of(book)
+        self.author_index = {unquote(author): entries
+                             for author, entries in zip(catalog.authors.strings, author_books) if entries}
+
+    def track_patrons_of(self, book):
+        if book.borrowed_by is not None:
+            self.track_patron_book(self.patron_loans, book.borrowed_by, book)
+        for reservation in book.reservations():
+            self.track_patron_book(self.patron_reservations, reservation.patron_id, book)
+
+    def untrack_patrons_of(self, book):
+        # The book's holder and every patron with a reservation on it lose it
+        if book.borrowed_by is not None:
+            self.untrack_patron_book(self.patron_loans, book.borrowed_by, book.book_id)
+        for reservation in book.reservations():
+            self.untrack_patron_book(self.patron_reservations, reservation.patron_id, book.book_id)
+
+    def set_book_state(self, book, availability_status, borrowed_by, reservations):
+        """
+        Overwrite a book's availability, holder and reservations, given as (patron_id,
+        priority_number, time_of_reservation) in heap order, keeping the counts and patron
+        indexes up to date.
+        """
+        self.untrack_patrons_of(book)
+        delta = (availability_status == AVAILABLE) - (book.availability_status == AVAILABLE)
+        if delta:
+            self.book_index.adjust_available(book, delta)
+        book.availability_status = availability_status
+        book.borrowed_by = borrowed_by
+        book.version += 1
+        book.reservation_heap = None
+        if reservations:
+            book.reservation_heap = BinaryMinHeap()
+            book.reservation_heap.restore([HeapNode(book.book_id, *reservation) for reservation in reservations])
+        self.track_patrons_of(book)
+
+    @staticmethod
+    def track_patron_book(patron_index, patron_id, book):
+        patron_index.setdefault(patron_id, {})[book.book_id] = book
+
+    @staticmethod
+    def untrack_patron_book(patron_index, patron_id, book_id):
+        books = patron_index.get(patron_id)
+        if books is not None:
+            books.pop(book_id, None)
+            if not books:
+                del patron_index[patron_id]
+
+    def patron_loans_of(self, patron_id):
+        books = self.patron_loans.get(patron_id, {})
+        return f"Patron {patron_id} Borrowed Books = [{', '.join(map(str, sorted(books)))}]"
+
+    def patron_reservations_of(self, patron_id):
+        books = self.patron_reservations.get(patron_id, {})
+        return f"Patron {patron_id} Reserved Books = [{', '.join(map(str, sorted(books)))}]"
+
+    def cancel_all_reservations(self, patron_id):
+        """
+        Cancel every reservation the patron holds, in O(k log n) for k reservations.
+        """
+        books = self.patron_reservations.pop(patron_id, None)
+        if not books:
+            return cancelled_reservations_message(patron_id, ())
+        book_ids = sorted(books)
+        for book_id in book_ids:
+            books[book_id].cancel_reservation(patron_id)
+        return cancelled_reservations_message(patron_id, book_ids)
+
+    def find_by_author(self, author_name):
+        """
+        Return the books by this author in book_id order, in O(1 + k).
+        """
+        return [book for _, book in self.author_index.get(unquote(author_name), ())]
+
+    def find_by_title_prefix(self, prefix):
+        """
+        Yield the books whose title starts with prefix, in title order, in O(log n + k).
+        """
+        prefix = unquote(prefix)
+        for title, _, book in self.title_index.iter_from((prefix,)):
+            if not title.startswith(prefix):
+                return
+            yield book
+
     def borrow_book(self, patron_id, book_id, patron_priority):
-        book = self.red_black_tree.search(book_id)
+        return self.borrow_found_book(self.book_index.search(book_id), patron_id, book_id, patron_priority)
 
-        if book != self.red_black_tree.NIL:
-            if book.availability_status == '"Yes"':
+    def borrow_found_book(self, book, patron_id, book_id, patron_priority):
+        # borrow_book for a book already looked up (NIL if it is not in the library)
+        if book is not self.book_index.NIL:
+            if book.availability_status == AVAILABLE:
                 # Book is available, allow borrowing
                 book.availability_status = '"No"'
                 book.borrowed_by = patron_id
+                book.version += 1
+                with self.index_lock:
+                    self.book_index.adjust_available(book, -1)
+                    self.track_patron_book(self.patron_loans, patron_id, book)
                 return f"Book {book_id} Borrowed by Patron {patron_id}"
             else:
                 # Book is not available, check if there's an existing reservation
-                existing_reservation = book.reservation_heap.find_existing_reservation(patron_id)
+                existing_reservation = book.find_reservation(patron_id)
 
                 if existing_reservation:
-                    # Update the existing reservation priority
-                    existing_reservation.priority_number = patron_priority
+                    # Update the existing reservation priority and move it to its new place in the heap
+                    book.update_reservation_priority(patron_id, patron_priority)
                 else:
-                    # Add a new reservation
-                    reservation_node = HeapNode(book_id, patron_id, patron_priority, datetime.now())
-                    book.reservation_heap.insert(reservation_node)
+                    # Add a new reservation, stamped with the next reservation sequence number
+                    with self.index_lock:
+                        self.reservation_sequence += 1
+                        time_of_reservation = self.reservation_sequence
+                        self.track_patron_book(self.patron_reservations, patron_id, book)
+                    book.insert_reservation(patron_id, patron_priority, time_of_reservation)
 
                 return f"Book {book_id} Reserved by Patron {patron_id}"
         else:
             return f"Book {book_id} not found in the Library"
 
     def return_book(self, patron_id, book_id):
-        book = self.red_black_tree.search(book_id)
+        return self.return_found_book(self.book_index.search(book_id), patron_id, book_id)
 
-        if book != self.red_black_tree.NIL:
+    def return_found_book(self, book, patron_id, book_id):
+        # return_book for a book already looked up (NIL if it is not in the library)
+        if book is not self.book_index.NIL:
             if book.borrowed_by == patron_id:
                 # Book is returned by the patron
+                with self.index_lock:
+                    self.untrack_patron_book(self.patron_loans, patron_id, book_id)
 
                 # Check if there are reservations
-                if not book.reservation_heap.is_empty():
+                if book.has_reservations():
                     # There are reservations, assign the book to the next patron in line
-                    top_reservation = book.reservation_heap.extract_min()
+                    top_reservation = book.extract_min_reservation()
                     book.borrowed_by = top_reservation.patron_id
                     book.availability_status = '"No"'
+                    book.version += 1
+                    with self.index_lock:
+                        self.untrack_patron_book(self.patron_reservations, top_reservation.patron_id, book_id)
+                        self.track_patron_book(self.patron_loans, top_reservation.patron_id, book)
                     return f"Book {book_id} Returned by Patron {patron_id}\nBook {book_id} Allotted to Patron {top_reservation.patron_id}"
                 else:
                     # No reservations, set the availability status to 'Yes'
-                    book.availability_status = '"Yes"'
+                    if book.availability_status != AVAILABLE:
+                        with self.index_lock:
+                            self.book_index.adjust_available(book, 1)
+                    book.availability_status = AVAILABLE
                     book.borrowed_by = None
+                    book.version += 1
                     return f"Book {book_id} Returned by Patron {patron_id}"
             else:
                 return f"Book {book_id} not borrowed by Patron {patron_id}"
@@ -561,143 +2621,2055 @@ class GatorLibrary:
             return f"Book {book_id} not found in the Library"
 
     def delete_book(self, book_id):
-        book = self.red_black_tree.search(book_id)
-        if book != self.red_black_tree.NIL:
-            if not book.reservation_heap.is_empty():
-                reservations = [reservation.patron_id for reservation in book.reservation_heap.heap if reservation is not None]
+        book = self.book_index.search(book_id)
+        if book is not self.book_index.NIL:
+            self.remove_from_indexes(book)
+            self.details_cache.invalidate(book_id)
+            self.book_index.delete(book)
+            book.catalog.remove(book)
+            if book.has_reservations():
+                reservations = [reservation.patron_id for reservation in book.reservations()]
                 if len(reservations) > 1:
-                    self.red_black_tree.delete(book)
                     return f"Book {book_id} is no longer available. Reservations made by Patrons {', '.join(map(str, reservations))} have been cancelled!"
                 elif len(reservations) == 1:
-                    self.red_black_tree.delete(book)
                     return f"Book {book_id} is no longer available. Reservation made by Patron {reservations[0]} has been cancelled!"
                 else:
-                    self.red_black_tree.delete(book)
                     return f"Book {book_id} is no longer available."
             else:
-                self.red_black_tree.delete(book)
                 return f"Book {book_id} is no longer available."
         else:
             return f"Book {book_id} not found in the Library"
 
+    def apply_batch(self, lines):
+        """
+        Run a batch of command lines and return, for each line in order, the text that
+        process_commands would write for it. Results match running the lines one by one.
+
+        The batch is cut into segments at commands that change the tree's shape (InsertBook,
+        BulkInsert, DeleteBook). Within a segment the books named by BorrowBook, ReturnBook
+        and PrintBook are looked up together in a single sorted sweep, and so are the
+        nearest books for FindClosestBook and FindClosestBooks. Then every command runs in
+        its original order against the books already found.
+        """
+        results = []
+        segment = []
+        for line in lines:
+            match = COMMAND_PATTERN.match(line)
+            if match is None:
+                results.append("")
+                continue
+            command, arg_text = match.groups()
+            if command == "Quit":
+                self._apply_segment(segment, results)
+                segment = []
+                results.append("Program Terminated!!\n")
+                break
+            if command in STRUCTURAL_COMMANDS:
+                self._apply_segment(segment, results)
+                segment = []
+                results.append(self.run_command(command, arg_text))
+            else:
+                segment.append((command, arg_text))
+        self._apply_segment(segment, results)
+        return results
+
+    def _apply_segment(self, segment, results):
+        if not segment:
+            return
+
+        parsed = []
+        book_ids = set()
+        closest_targets = {}
+        for command, arg_text in segment:
+            position = POINT_COMMANDS.get(command)
+            if position is not None:
+                args = tuple(map(int, arg_text.split(",")))
+                book_ids.add(args[position])
+                parsed.append((command, args))
+            elif command in ("FindClosestBook", "FindClosestBooks"):
+                # (target_id, k), with FindClosestBook being k = 1
+                args = tuple(map(int, arg_text.split(","))) + (1,)
+                closest_targets.setdefault(args[1], set()).add(args[0])
+                parsed.append(("FindClosestBooks", args[:2]))
+            else:
+                parsed.append((command, arg_text))
+
+        tree = self.book_index
+        sorted_ids = sorted(book_ids)
+        books = dict(zip(sorted_ids, tree.search_sorted(sorted_ids)))
+        closest = {}
+        for k, targets in closest_targets.items():
+            targets = sorted(targets)
+            closest.update(zip(((target_id, k) for target_id in targets), tree.nearest_sorted(targets, k)))
+        append = results.append
+
+        for command, args in parsed:
+            if command == "BorrowBook":
+                patron_id, book_id, priority = args
+                append(self.borrow_found_book(books[book_id], patron_id, book_id, priority) + "\n")
+            elif command == "ReturnBook":
+                patron_id, book_id = args
+                append(self.return_found_book(books[book_id], patron_id, book_id) + "\n")
+            elif command == "PrintBook":
+                book_id = args[0]
+                append(self.print_found_book(books[book_id], book_id) + "\n")
+            elif command == "FindClosestBooks":
+                append(self.format_closest_books(closest[args]) + "\n")
+            else:
+                append(self.run_command(command, args))
+
+    def run_command(self, command, arg_text, line=None, write_ahead_log=None):
+        """
+        Run one command through its line handler and return the text it would write. With a
+        write_ahead_log, a mutating command's line is logged once it has run.
+        """
+        handler = COMMAND_HANDLERS.get(command)
+        if handler is None:
+            return ""
+        output_file = io.StringIO()
+        output_line = run_logged_command(self, handler, command, arg_text, line, output_file, write_ahead_log)
+        if output_line is not None:
+            print(output_line, file=output_file)
+        return output_file.getvalue()
+
+    def count_books(self, book_id1, book_id2):
+        books, _ = self.book_index.count_in_range(book_id1, book_id2)
+        return f"Book Count: {books}"
+
+    def count_available_books(self, book_id1, book_id2):
+        _, available = self.book_index.count_in_range(book_id1, book_id2)
+        return f"Available Book Count: {available}"
+
+    def rank_of(self, book_id):
+        rank = self.book_index.rank(book_id)
+        if rank is None:
+            return f"Book {book_id} not found in the Library"
+        return f"Book {book_id} Rank: {rank}"
+
+    def select_kth(self, k):
+        book = self.book_index.select(k)
+        if book is None:
+            return f"No book with rank {k} in the Library"
+        return self.details_cache.details(book)
+
     def find_closest_book(self, target_id):
-        closest_books = self.red_black_tree.find_closest_book(target_id)
+        books = self.book_index.nearest(target_id, 1)
+        if len(books) == 1:
+            return self.details_cache.details(books[0])
+        return self.format_closest_books(books)
 
-        if isinstance(closest_books, tuple):
-            return "\n".join(book.print_book_details() for book in closest_books)
-        elif closest_books != self.red_black_tree.NIL:
-            return closest_books.print_book_details()
-        else:
+    def find_closest_books(self, target_id, k):
+        return self.format_closest_books(self.book_index.nearest(target_id, k))
+
+    def find_closest_books_batch(self, targets, k=1):
+        """
+        Answer FindClosestBooks(target, k) for every target at once, returning the results
+        in the order of targets. The targets are sorted so the tree is swept only once.
+        """
+        order = sorted(range(len(targets)), key=targets.__getitem__)
+        nearest = self.book_index.nearest_sorted([targets[i] for i in order], k)
+        results = [None] * len(targets)
+        for i, books in zip(order, nearest):
+            results[i] = self.format_closest_books(books)
+        return results
+
+    def format_closest_books(self, books):
+        if not books:
             return "No closest book found"
+        details = self.details_cache.details
+        return "\n".join(details(book) for book in books)
         
+    def save_snapshot(self, filename):
+        """
+        Save all books, borrowers, reservation heaps, the color flip count, the log
+        generation and the reservation counter to a compact binary file. The file is written next to its destination and
+        renamed into place, so an interrupted save never leaves a partial snapshot behind.
+        """
+        tree = self.book_index
+        nil = tree.NIL
+        catalog = self.catalog
+        author_codes = catalog.author_codes
+        status_codes = catalog.status_codes
+        borrowers = catalog.borrowers
+        # Each distinct author and status is encoded once
+        authors = [author.encode("utf-8") for author in catalog.authors.strings]
+        statuses = [status.encode("utf-8") for status in catalog.statuses.strings]
+        pack_book = SNAPSHOT_BOOK.pack
+        pack_reservation = SNAPSHOT_RESERVATION.pack
+        book_count = len(tree)
+        temp_filename = f"{filename}.tmp"
+
+        with open(temp_filename, "wb", buffering=OUTPUT_BUFFER_SIZE) as snapshot_file:
+            write = snapshot_file.write
+            write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, tree.color_flips, self.log_generation,
+                                       self.reservation_sequence, book_count))
+
+            for book in tree.iter_preorder():
+                row = book.row
+                flags = SNAPSHOT_RED if book.color == RED else 0
+                if book.left is not nil:
+                    flags |= SNAPSHOT_HAS_LEFT
+                if book.right is not nil:
+                    flags |= SNAPSHOT_HAS_RIGHT
+                borrowed_by = borrowers[row]
+                if borrowed_by != NO_BORROWER:
+                    flags |= SNAPSHOT_BORROWED
+                else:
+                    borrowed_by = 0
+                title = book.book_name.encode("utf-8")
+                author = authors[author_codes[row]]
+                availability = statuses[status_codes[row]]
+                reservations = book.reservations()
+                write(pack_book(book.book_id, flags, borrowed_by,
+                                len(title), len(author), len(availability), len(reservations)))
+                write(title + author + availability)
+                for reservation in reservations:
+                    write(pack_reservation(reservation.patron_id, reservation.priority_number, reservation.time_of_reservation))
+
+        os.replace(temp_filename, filename)
+
+    @classmethod
+    def load_snapshot(cls, filename, engine="redblack"):
+        """
+        Return a new library restored from a file written by save_snapshot. The file is
+        memory-mapped and the tree is relinked in a single pass, with the same shape and
+        colors it had when it was saved. Snapshots do not depend on the engine, so one saved
+        by either engine can be loaded into the other.
+        """
+        library = cls(engine=engine)
+        tree = library.book_index
+
+        with open(filename, "rb") as snapshot_file, \
+                mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, version, color_flips, log_generation, reservation_sequence, book_count = SNAPSHOT_HEADER.unpack_from(data, 0)
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                raise ValueError(f"{filename} is not a GatorLibrary snapshot")
+            tree.build_from_preorder(cls._read_snapshot_books(library.catalog, data, SNAPSHOT_HEADER.size, book_count))
+            tree.color_flips = color_flips
+            library.log_generation = log_generation
+            library.reservation_sequence = reservation_sequence
+        library.rebuild_indexes()
+
+        return library
+
+    @staticmethod
+    def _read_snapshot_books(catalog, data, offset, book_count):
+        new_book = catalog.new_book
+        unpack_book = SNAPSHOT_BOOK.unpack_from
+        unpack_reservation = SNAPSHOT_RESERVATION.unpack_from
+        book_size = SNAPSHOT_BOOK.size
+        reservation_size = SNAPSHOT_RESERVATION.size
+
+        for _ in range(book_count):
+            book_id, flags, borrowed_by, title_length, author_length, availability_length, reservation_count = unpack_book(data, offset)
+            offset += book_size
+            title_end = offset + title_length
+            author_end = title_end + author_length
+            availability_end = author_end + availability_length
+            book = new_book(book_id,
+                            data[offset:title_end].decode("utf-8"),
+                            data[title_end:author_end].decode("utf-8"),
+                            data[author_end:availability_end].decode("utf-8"),
+                            borrowed_by if flags & SNAPSHOT_BORROWED else None,
+                            color=RED if flags & SNAPSHOT_RED else BLACK)
+            offset = availability_end
+
+            if reservation_count:
+                # Reservations are stored in heap order, so the heap array is copied as is
+                reservations = []
+                for _ in range(reservation_count):
+                    patron_id, priority_number, time_of_reservation = unpack_reservation(data, offset)
+                    offset += reservation_size
+                    reservations.append(HeapNode(book_id, patron_id, priority_number, time_of_reservation))
+                book.reservation_heap = BinaryMinHeap()
+                book.reservation_heap.restore(reservations)
+
+            yield book, bool(flags & SNAPSHOT_HAS_LEFT), bool(flags & SNAPSHOT_HAS_RIGHT)
+
     def quit_program(self):
         print("Program Terminated!!")
 
     def color_flip_count(self):
-        print(f"Colour Flip Count: {self.red_black_tree.color_flips}")
+        print(f"Colour Flip Count: {self.book_index.color_flips}")
 
     def get_all_books(self):
-        books = self.red_black_tree.get_all_books()
-        for book in books:
+        for book in self.book_index.iter_books():
             print(book.print_book_details())
 
+    def unsupported(self, command):
+        return f"{command} is not supported in {self.engine} mode"
+
+
+class MappedGatorLibrary(GatorLibrary):
+    """
+    A GatorLibrary whose books stay in a MappedBookIndex file instead of memory, for
+    collections larger than RAM. PrintBook, PrintBooks, FindClosestBook(s), CountBooks,
+    CountAvailableBooks, RankOf and SelectKth read only the pages they need. InsertBook,
+    BulkInsert, BorrowBook, ReturnBook and DeleteBook write back the pages they change, which
+    are committed every DIRTY_PAGE_LIMIT pages and by commit() or close().
+
+    The author, title and patron indexes would have to hold every book in memory, so they
+    are not kept, and FindByAuthor, FindByTitlePrefix, PatronLoans, PatronReservations and
+    CancelAllReservations answer with a one-line "not supported" result.
+    """
+    unsupported_commands = frozenset({"FindByAuthor", "FindByTitlePrefix", "PatronLoans", "PatronReservations",
+                                      "CancelAllReservations"})
+
+    def __init__(self, filename, page_cache_size=PAGE_CACHE_SIZE, details_cache_size=DETAILS_CACHE_SIZE):
+        super().__init__(details_cache_size, "mapped", MappedBookIndex(filename, page_cache_size))
+        self.reservation_sequence = self.book_index.reservation_sequence
+
+    def commit(self):
+        self.book_index.reservation_sequence = self.reservation_sequence
+        self.book_index.commit()
+
+    def close(self):
+        self.book_index.reservation_sequence = self.reservation_sequence
+        self.book_index.close()
+
+    def changed(self, book_id):
+        # After a book's pages are written back: its details are stale, since a page
+        # decoded again starts its books at version 0, and enough changed pages are committed
+        self.details_cache.invalidate(book_id)
+        if len(self.book_index.dirty) >= self.book_index.dirty_page_limit:
+            self.commit()
+
+    def insert_book(self, book_id, book_name, author_name, availability_status, borrowed_by, reservation_heap=None):
+        if self.book_index.insert_record(book_id, book_name, author_name, availability_status, borrowed_by,
+                                         reservation_heap):
+            self.changed(book_id)
+
+    def bulk_insert(self, records, presorted=False):
+        self.book_index.reservation_sequence = self.reservation_sequence
+        return self.book_index.bulk_insert(records, presorted)
+
+    def borrow_found_book(self, book, patron_id, book_id, patron_priority):
+        result = super().borrow_found_book(book, patron_id, book_id, patron_priority)
+        if book is not self.book_index.NIL:
+            self.book_index.write_back(book)
+            self.changed(book_id)
+        return result
+
+    def return_found_book(self, book, patron_id, book_id):
+        result = super().return_found_book(book, patron_id, book_id)
+        if book is not self.book_index.NIL:
+            self.book_index.write_back(book)
+            self.changed(book_id)
+        return result
+
+    def delete_book(self, book_id):
+        result = super().delete_book(book_id)
+        self.changed(book_id)
+        return result
+
+    def add_to_indexes(self, book):
+        pass
+
+    def remove_from_indexes(self, book):
+        pass
+
+    def rebuild_indexes(self):
+        pass
 
+    @staticmethod
+    def track_patron_book(patron_index, patron_id, book):
+        pass
 
+    @staticmethod
+    def untrack_patron_book(patron_index, patron_id, book_id):
+        pass
+
+    def patron_loans_of(self, patron_id):
+        return self.unsupported("PatronLoans")
+
+    def patron_reservations_of(self, patron_id):
+        return self.unsupported("PatronReservations")
+
+    def cancel_all_reservations(self, patron_id):
+        return self.unsupported("CancelAllReservations")
+
+    def save_snapshot(self, filename):
+        """
+        Save the catalog as a snapshot that GatorLibrary.load_snapshot reads, in the layout
+        of a balanced red-black tree as BlockedBookIndex saves it. Records are copied from
+        their pages without being decoded, so the books are never all in memory at once.
+        """
+        index = self.book_index
+        book_count = len(index)
+        red_depth = book_count.bit_length() - 1
+        temp_filename = f"{filename}.tmp"
+        with open(temp_filename, "wb", buffering=OUTPUT_BUFFER_SIZE) as snapshot_file:
+            write = snapshot_file.write
+            write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, index.color_flips, self.log_generation,
+                                       self.reservation_sequence, book_count))
+            # Ranks low..high form the subtree rooted at their middle book, as in build_from_sorted
+            stack = [(0, book_count - 1, 0)] if book_count else []
+            while stack:
+                low, high, depth = stack.pop()
+                middle = (low + high) // 2
+                record = index.record_at(middle)
+                flags = record[8] & SNAPSHOT_BORROWED
+                if depth == red_depth and depth > 0:
+                    flags |= SNAPSHOT_RED
+                if middle > low:
+                    flags |= SNAPSHOT_HAS_LEFT
+                if middle < high:
+                    flags |= SNAPSHOT_HAS_RIGHT
+                write(record[:8])
+                write(bytes((flags,)))
+                write(record[9:])
+                if middle < high:
+                    stack.append((middle + 1, high, depth + 1))
+                if middle > low:
+                    stack.append((low, middle - 1, depth + 1))
+        os.replace(temp_filename, filename)
+
+
+
+
+
+# A command line is "Name(arguments)" with an optional trailing semicolon. The argument list is
+# captured greedily so parentheses inside quoted titles are kept.
+COMMAND_PATTERN = re.compile(r'\s*(\w+)\s*\((.*)\)\s*;?\s*$')
+# An argument is either a double-quoted string (which may contain commas) or a run of non-commas
+ARGUMENT_PATTERN = re.compile(r'"[^"]*"|[^,\s][^,]*')
+
+
+def unquote(text):
+    if len(text) >= 2 and text[0] == '"' and text[-1] == '"':
+        return text[1:-1]
+    return text
+
+
+def cancelled_reservations_message(patron_id, book_ids):
+    if not book_ids:
+        return f"Patron {patron_id} has no reservations"
+    if len(book_ids) > 1:
+        return f"Reservations made by Patron {patron_id} on Books {', '.join(map(str, book_ids))} have been cancelled!"
+    return f"Reservation made by Patron {patron_id} on Book {book_ids[0]} has been cancelled!"
+
+
+def split_arguments(arg_text):
+    return [arg.strip() for arg in ARGUMENT_PATTERN.findall(arg_text)]
 
 
 def parse_command(line):
-    parts = line.strip().split("(")
-    if len(parts) < 2:
-        # Handle cases where there are not enough parts
+    match = COMMAND_PATTERN.match(line)
+    if match is None:
+        # Handle cases where the line is not a command
         return None, None
-    command = parts[0]
-    args = "".join(parts[1:])  # Concatenate all parts after the command
-    args = args.rstrip(";")  # Remove semicolon, if present
-    args = args.rstrip(")")  # Remove the closing parenthesis
-    args_list = [arg.strip() for arg in args.split(",")]
-    return command, args_list
-
-
-def main(input_filename):
-    library = GatorLibrary()
-    quit_flag=0
-
-    # Read input from the file
-    with open(input_filename, "r") as file:
-        lines = file.readlines()
-        output_lines = []
-        
-        for line in lines:
-            command, args = parse_command(line)
-            # print(line)
-            output_line = None
-            if(quit_flag==0):
-                if command == "Quit":
-                    library.quit_program()
-                    output_line = "Program Terminated!!"
-                    quit_flag=1
-
-                elif command == "InsertBook":
-                    book_id, title, author, availability = map(str.strip, args[:4])
-                    library.insert_book(int(book_id), title, author, availability, None, BinaryMinHeap())
-                    output_line = "" 
-                    # No output for InsertBook command
-
-                elif command == "PrintBook":
-                    book_id = args[0]
-                    book_details = library.print_book(int(book_id))
-                    output_line = book_details if book_details is not None else f"Book {book_id} not found in the Library"
-
-                elif command == "PrintBooks":
-                    book_id1, book_id2 = map(int, args)
-                    books = library.print_books(book_id1, book_id2)
-                    output_line=""
-                    output_lines.extend([f"{book.print_book_details()}" for book in books])
-
-
-                elif command == "BorrowBook":
-                    patron_id, book_id, priority = map(int, args)
-                    output_line = library.borrow_book(patron_id, book_id, priority)
-
-                elif command == "ReturnBook":
-                    patron_id, book_id = map(int, args)
-                    output_line = library.return_book(patron_id, book_id)
-
-                elif command == "DeleteBook":
-                    book_id = int(args[0])
-                    output_line = library.delete_book(book_id)
-
-                elif command == "FindClosestBook":
-                    target_id = int(args[0])
-                    output_line = library.find_closest_book(target_id)
-
-                elif command == "ColorFlipCount":
-                    output_line = f"Colour Flip Count: {library.red_black_tree.color_flips}"
-            if(output_line!=None):
-                output_lines.append(output_line)
-
-    # Write output to a text file
-    output_filename = f"{input_filename.split('.')[0]}_output_file.txt"
-    with open(output_filename, "w") as output_file:
-        for output_line in output_lines:
-            print(output_line, file=output_file)
+    command, arg_text = match.groups()
+    return command, split_arguments(arg_text)
 
 
-if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python your_script.py input_filename")
-        sys.exit(1)
+def read_catalog(filename):
+    """
+    Yield (book_id, book_name, author_name, availability_status) records from a file of
+    InsertBook commands. Lines that are not InsertBook commands are skipped.
+    """
+    with open(filename, "r") as catalog_file:
+        yield from catalog_records(catalog_file)
+
+
+def catalog_records(lines):
+    # The records of the InsertBook commands among lines
+    for line in lines:
+        match = COMMAND_PATTERN.match(line)
+        if match is not None and match.group(1) == "InsertBook":
+            book_id, title, author, availability = split_arguments(match.group(2))[:4]
+            yield int(book_id), title, author, availability
+
+
+def run_logged_command(library, handler, command, arg_text, line, output_file, write_ahead_log):
+    """
+    Run a command's handler and return its output line. A mutating command is appended to
+    write_ahead_log (if there is one) only once the handler has succeeded, so a command that
+    fails is never logged. A BulkInsert is logged with the records it loaded, so replaying it
+    does not depend on its catalog file.
+    """
+    if write_ahead_log is None or command not in MUTATING_COMMANDS:
+        return handler(library, arg_text, output_file)
+    if command == "BulkInsert":
+        filename = split_arguments(arg_text)[0].strip('"')
+        records = list(read_catalog(filename))
+        added = library.bulk_insert(records)
+        write_ahead_log.append_bulk_insert(records)
+        return bulk_inserted_message(added, filename)
+    output_line = handler(library, arg_text, output_file)
+    write_ahead_log.append(line)
+    return output_line
+
+
+def bulk_inserted_message(added, filename):
+    return f"Bulk inserted {added} books from {filename}"
+
+
+# Command handlers take the library, the raw argument text and the output stream, and return the
+# line to print (None prints nothing). Each handler parses only the arguments it needs.
+
+def _insert_book_command(library, arg_text, output_file):
+    book_id, title, author, availability = split_arguments(arg_text)[:4]
+    library.insert_book(int(book_id), title, author, availability, None)
+    # No output for InsertBook command, just an empty line
+    return ""
+
+
+def _bulk_insert_command(library, arg_text, output_file):
+    filename = split_arguments(arg_text)[0].strip('"')
+    added = library.bulk_insert(read_catalog(filename))
+    return bulk_inserted_message(added, filename)
+
+
+def _print_book_command(library, arg_text, output_file):
+    return library.print_book(int(arg_text))
+
+
+def _print_books_command(library, arg_text, output_file):
+    # PrintBooks(book_id1, book_id2[, limit[, after_id]])
+    args = [int(arg) for arg in arg_text.split(",")]
+    limit = args[2] if len(args) > 2 else None
+    after_id = args[3] if len(args) > 3 else None
+    library.write_books(output_file, args[0], args[1], limit, after_id)
+    return ""
+
+
+def _borrow_book_command(library, arg_text, output_file):
+    patron_id, book_id, priority = map(int, arg_text.split(","))
+    return library.borrow_book(patron_id, book_id, priority)
+
+
+def _return_book_command(library, arg_text, output_file):
+    patron_id, book_id = map(int, arg_text.split(","))
+    return library.return_book(patron_id, book_id)
 
-    input_filename = sys.argv[1]
-    main(input_filename)
 
+def _delete_book_command(library, arg_text, output_file):
+    return library.delete_book(int(arg_text))
 
 
+def _find_closest_book_command(library, arg_text, output_file):
+    return library.find_closest_book(int(arg_text))
 
 
+def _find_closest_books_command(library, arg_text, output_file):
+    target_id, k = map(int, arg_text.split(","))
+    return library.find_closest_books(target_id, k)
 
 
+def _count_books_command(library, arg_text, output_file):
+    book_id1, book_id2 = map(int, arg_text.split(","))
+    return library.count_books(book_id1, book_id2)
 
 
+def _count_available_books_command(library, arg_text, output_file):
+    book_id1, book_id2 = map(int, arg_text.split(","))
+    return library.count_available_books(book_id1, book_id2)
 
 
+def _rank_of_command(library, arg_text, output_file):
+    return library.rank_of(int(arg_text))
+
+
+def _select_kth_command(library, arg_text, output_file):
+    return library.select_kth(int(arg_text))
+
+
+def _find_by_author_command(library, arg_text, output_file):
+    if "FindByAuthor" in library.unsupported_commands:
+        return library.unsupported("FindByAuthor")
+    author = split_arguments(arg_text)[0]
+    books = library.find_by_author(author)
+    if not books:
+        return f"No books by {author} found in the Library"
+    for book in books:
+        print(library.details_cache.details(book), file=output_file)
+    return ""
+
+
+def _find_by_title_prefix_command(library, arg_text, output_file):
+    if "FindByTitlePrefix" in library.unsupported_commands:
+        return library.unsupported("FindByTitlePrefix")
+    prefix = split_arguments(arg_text)[0]
+    found = False
+    for book in library.find_by_title_prefix(prefix):
+        print(library.details_cache.details(book), file=output_file)
+        found = True
+    if not found:
+        return f"No books with title prefix {prefix} found in the Library"
+    return ""
+
+
+def _patron_loans_command(library, arg_text, output_file):
+    return library.patron_loans_of(int(arg_text))
+
+
+def _patron_reservations_command(library, arg_text, output_file):
+    return library.patron_reservations_of(int(arg_text))
+
+
+def _cancel_all_reservations_command(library, arg_text, output_file):
+    return library.cancel_all_reservations(int(arg_text))
+
+
+def _color_flip_count_command(library, arg_text, output_file):
+    return f"Colour Flip Count: {library.book_index.color_flips}"
+
+
+COMMAND_HANDLERS = {
+    "InsertBook": _insert_book_command,
+    "BulkInsert": _bulk_insert_command,
+    "PrintBook": _print_book_command,
+    "PrintBooks": _print_books_command,
+    "BorrowBook": _borrow_book_command,
+    "ReturnBook": _return_book_command,
+    "DeleteBook": _delete_book_command,
+    "FindClosestBook": _find_closest_book_command,
+    "FindClosestBooks": _find_closest_books_command,
+    "ColorFlipCount": _color_flip_count_command,
+    "CountBooks": _count_books_command,
+    "CountAvailableBooks": _count_available_books_command,
+    "RankOf": _rank_of_command,
+    "SelectKth": _select_kth_command,
+    "FindByAuthor": _find_by_author_command,
+    "FindByTitlePrefix": _find_by_title_prefix_command,
+    "PatronLoans": _patron_loans_command,
+    "PatronReservations": _patron_reservations_command,
+    "CancelAllReservations": _cancel_all_reservations_command,
+}
+
+# Commands that change the shape of the tree, which apply_batch treats as barriers
+STRUCTURAL_COMMANDS = frozenset(("InsertBook", "BulkInsert", "DeleteBook"))
+# Single-book commands that apply_batch looks up together, with the position of their book_id
+POINT_COMMANDS = {"BorrowBook": 1, "ReturnBook": 1, "PrintBook": 0}
+# Commands that change the library and are recorded in the write-ahead log
+MUTATING_COMMANDS = frozenset(("InsertBook", "BulkInsert", "BorrowBook", "ReturnBook", "DeleteBook",
+                               "CancelAllReservations"))
+
+
+class Metrics:
+    """
+    Opt-in instrumentation for one GatorLibrary. process_commands and LibraryServer time
+    the commands they dispatch when given a Metrics, and attach() gives it the library to
+    read tree, heap, cache and index sizes from. attach(library, lookups=True) also wraps
+    the tree search and the author and title lookups to count search depth and hit rates;
+    that wrapper runs on every search, so it is a separate choice. None of this code runs
+    unless a Metrics is given.
+
+    To keep the overhead down, only every latency_sample-th command is timed and only every
+    search_sample-th search is measured; pass 1 to measure everything. Latencies go into
+    per-command histograms with power-of-two buckets: a command taking d seconds is counted
+    in the bucket with upper bound 2 ** frexp(d)[1]. Tree height and reservation heap sizes
+    are computed when the metrics are read.
+    """
+
+    def __init__(self, latency_sample=16, search_sample=16):
+        self.latency_sample = latency_sample
+        self.search_sample = search_sample
+        self.library = None
+        # command -> {bucket exponent: count}, and command -> total seconds
+        self.latency_buckets = {}
+        self.latency_sums = {}
+        self.searches = 0
+        self.sampled_searches = 0
+        self.search_hits = 0
+        self.search_depth_total = 0
+        self.search_depth_max = 0
+        self.index_lookups = 0
+        self.index_hits = 0
+        # Whether the lookups are counted, and how to read the number of searches so far
+        self.lookups = False
+        self.search_count = None
+
+    def attach(self, library, lookups=False):
+        """
+        Read library's sizes when the metrics are read, and with lookups, instrument its
+        tree search and secondary index lookups. The wrappers are instance attributes, so
+        the classes and every other library are left untouched.
+        """
+        self.library = library
+        if not lookups:
+            return self
+        self.lookups = True
+        metrics = self
+        tree = library.book_index
+        nil = tree.NIL
+        unsampled_search = tree.search
+        sample = self.search_sample
+        calls = 0
+        # Search depth is measured on the red-black tree only; other engines count hits
+        measure_depth = isinstance(tree, RedBlackTree)
+
+        def search(key):
+            nonlocal calls
+            calls += 1
+            if calls % sample:
+                return unsampled_search(key)
+            if not measure_depth:
+                x = unsampled_search(key)
+                depth = 0
+            else:
+                x = tree.root
+                depth = 0
+                while x is not nil:
+                    depth += 1
+                    book_id = x.book_id
+                    if key == book_id:
+                        break
+                    x = x.left if key < book_id else x.right
+            metrics.sampled_searches += 1
+            metrics.search_depth_total += depth
+            if depth > metrics.search_depth_max:
+                metrics.search_depth_max = depth
+            if x is not nil:
+                metrics.search_hits += 1
+            return x
+
+        find_by_author = library.find_by_author
+        find_by_title_prefix = library.find_by_title_prefix
+
+        def find_by_author_counted(author_name):
+            books = find_by_author(author_name)
+            metrics.index_lookups += 1
+            if books:
+                metrics.index_hits += 1
+            return books
+
+        def find_by_title_prefix_counted(prefix):
+            metrics.index_lookups += 1
+            found = False
+            for book in find_by_title_prefix(prefix):
+                if not found:
+                    metrics.index_hits += 1
+                    found = True
+                yield book
+
+        def search_count():
+            return calls
+
+        self.search_count = search_count
+        tree.search = search
+        library.find_by_author = find_by_author_counted
+        library.find_by_title_prefix = find_by_title_prefix_counted
+        return self
+
+    def observe(self, command, seconds):
+        buckets = self.latency_buckets.get(command)
+        if buckets is None:
+            buckets = self.latency_buckets[command] = {}
+            self.latency_sums[command] = 0.0
+        exponent = math.frexp(seconds)[1]
+        buckets[exponent] = buckets.get(exponent, 0) + 1
+        self.latency_sums[command] += seconds
+
+    def tree_shape(self):
+        # Height and black height of the tree, walked iteratively; 0, 0 for other engines
+        tree = self.library.book_index
+        if not isinstance(tree, RedBlackTree):
+            return 0, 0
+        nil = tree.NIL
+        height = 0
+        stack = [(tree.root, 1)] if tree.root is not nil else []
+        while stack:
+            node, depth = stack.pop()
+            height = max(height, depth)
+            if node.left is not nil:
+                stack.append((node.left, depth + 1))
+            if node.right is not nil:
+                stack.append((node.right, depth + 1))
+        black_height = 0
+        node = tree.root
+        while node is not nil:
+            black_height += node.color == BLACK
+            node = node.left
+        return height, black_height
+
+    def snapshot(self):
+        """
+        Return every metric as a dict of plain values.
+        """
+        library = self.library
+        values = {"timestamp": time.time(), "latency_sample": self.latency_sample}
+        values["commands"] = {
+            command: {
+                "count": sum(buckets.values()),
+                "sum_seconds": self.latency_sums[command],
+                "buckets": {f"{2.0 ** exponent:g}": count for exponent, count in sorted(buckets.items())},
+            }
+            for command, buckets in sorted(self.latency_buckets.items())
+        }
+        if library is None:
+            return values
+
+        tree = library.book_index
+        height, black_height = self.tree_shape()
+        heap_sizes = [len(book.reservations()) for book in tree.iter_books() if book.reservation_heap is not None]
+        values["tree"] = {
+            "books": len(tree),
+            "available_books": tree.available_books(),
+            "height": height,
+            "black_height": black_height,
+            "rotations": tree.rotations,
+            "recolorings": tree.recolorings,
+            "color_flips": tree.color_flips,
+        }
+        if self.lookups:
+            self.searches = self.search_count()
+            sampled = self.sampled_searches
+            values["search"] = {
+                "count": self.searches,
+                "sampled": sampled,
+                "hit_rate": self.search_hits / sampled if sampled else 0.0,
+                "depth_mean": self.search_depth_total / sampled if sampled else 0.0,
+                "depth_max": self.search_depth_max,
+            }
+        values["reservations"] = {
+            "total": sum(heap_sizes),
+            "books_with_reservations": sum(1 for size in heap_sizes if size),
+            "max_heap_size": max(heap_sizes, default=0),
+        }
+        values["details_cache"] = library.details_cache.stats()
+        if isinstance(tree, MappedBookIndex):
+            values["page_cache"] = tree.page_cache_stats()
+        values["index"] = {
+            "authors": len(library.author_index),
+            "titles": len(library.title_index),
+        }
+        if self.lookups:
+            values["index"].update(lookups=self.index_lookups, hits=self.index_hits)
+        return values
+
+    def to_json(self):
+        """
+        Return the metrics as one line of JSON.
+        """
+        return json.dumps(self.snapshot(), sort_keys=True)
+
+    def to_prometheus(self):
+        """
+        Return the metrics in the Prometheus text exposition format.
+        """
+        values = self.snapshot()
+        lines = [f"gatorlibrary_latency_sample {values['latency_sample']}",
+                 "# TYPE gatorlibrary_command_seconds histogram"]
+        for command, histogram in values["commands"].items():
+            cumulative = 0
+            for bound, count in histogram["buckets"].items():
+                cumulative += count
+                lines.append(f'gatorlibrary_command_seconds_bucket{{command="{command}",le="{bound}"}} {cumulative}')
+            lines.append(f'gatorlibrary_command_seconds_bucket{{command="{command}",le="+Inf"}} {cumulative}')
+            lines.append(f'gatorlibrary_command_seconds_sum{{command="{command}"}} {histogram["sum_seconds"]}')
+            lines.append(f'gatorlibrary_command_seconds_count{{command="{command}"}} {histogram["count"]}')
+        for group in ("tree", "search", "reservations", "details_cache", "page_cache", "index"):
+            for name, value in values.get(group, {}).items():
+                lines.append(f"gatorlibrary_{group}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, filename):
+        """
+        Write the metrics to filename: Prometheus text for a .prom file, otherwise one JSON
+        line appended, so repeated dumps build up a JSON lines file.
+        """
+        if filename.endswith(".prom"):
+            with open(filename, "w") as metrics_file:
+                metrics_file.write(self.to_prometheus())
+        else:
+            with open(filename, "a") as metrics_file:
+                metrics_file.write(self.to_json() + "\n")
+
+
+def process_commands(library, lines, output_file, flush_every=None, write_ahead_log=None, metrics=None):
+    """
+    Run commands from an iterable of lines against the library, writing each result to
+    output_file as soon as it is produced. Lines are consumed lazily, so memory use does not
+    grow with the length of the input. If flush_every is set, output_file is flushed after
+    that many commands. If a write_ahead_log is given, mutating commands are appended to it
+    once they have run without error. If metrics is given, every command is timed into it.
+    """
+    commands_since_flush = 0
+    # Counts down to the next timed command. Without metrics it starts below zero and never
+    # reaches it, so untimed commands take the same path whether or not metrics are given
+    commands_until_timed = 1 if metrics is not None else -1
+    match_command = COMMAND_PATTERN.match
+    handlers = COMMAND_HANDLERS
+
+    for line in lines:
+        match = match_command(line)
+        if match is not None:
+            command, arg_text = match.groups()
+
+            if command == "Quit":
+                # quit_program() announces termination on stdout; avoid a duplicate line there
+                if output_file is not sys.stdout:
+                    library.quit_program()
+                print("Program Terminated!!", file=output_file)
+                break
+
+            handler = handlers.get(command)
+            if handler is not None:
+                commands_until_timed -= 1
+                if commands_until_timed:
+                    output_line = run_logged_command(library, handler, command, arg_text, line, output_file,
+                                                     write_ahead_log)
+                else:
+                    commands_until_timed = metrics.latency_sample
+                    start = perf_counter()
+                    output_line = run_logged_command(library, handler, command, arg_text, line, output_file,
+                                                     write_ahead_log)
+                    metrics.observe(command, perf_counter() - start)
+                if output_line is not None:
+                    print(output_line, file=output_file)
+
+        if flush_every:
+            commands_since_flush += 1
+            if commands_since_flush >= flush_every:
+                output_file.flush()
+                commands_since_flush = 0
+
+    output_file.flush()
+
+
+PARALLEL_REPLAY_MIN_COMMANDS = 1024
+
+
+def _book_state(book):
+    return (book.book_id, book.book_name, book.author_name, book.availability_status, book.borrowed_by,
+            [(reservation.patron_id, reservation.priority_number, reservation.time_of_reservation)
+             for reservation in book.reservations()])
+
+
+def _replay_chains(chains, first_stamp):
+    """
+    Process-pool task for replay_commands: run each (book_id, book_state, commands) chain on
+    a library that holds only that book. Returns, per chain, (outputs, stamps, final book
+    state), where stamps are the reservation stamps the chain handed out.
+    """
+    results = []
+    for book_id, state, commands in chains:
+        library = GatorLibrary()
+        if state is not None:
+            library.insert_book(*state[:5])
+            library.set_book_state(library.book_index.search(book_id), state[3], state[4], state[5])
+        outputs = []
+        stamps = []
+        for index, command, arg_text in commands:
+            # A new reservation is stamped with its position in the segment, after every earlier stamp
+            stamp = first_stamp + index
+            library.reservation_sequence = stamp - 1
+            outputs.append((index, library.run_command(command, arg_text)))
+            if library.reservation_sequence == stamp:
+                stamps.append(stamp)
+        book = library.book_index.search(book_id)
+        results.append((outputs, stamps, None if book is library.book_index.NIL else _book_state(book)))
+    return results
+
+
+def _replay_segment(library, segment, output_file, pool, max_workers):
+    """
+    Run a segment of BorrowBook/ReturnBook/PrintBook commands, one dependency chain per book
+    on the process pool, and write their outputs in the original order.
+    """
+    if len(segment) < PARALLEL_REPLAY_MIN_COMMANDS:
+        for command, arg_text in segment:
+            output_file.write(library.run_command(command, arg_text))
+        return
+
+    chains = {}
+    for index, (command, arg_text) in enumerate(segment):
+        book_id = int(arg_text.split(",")[POINT_COMMANDS[command]])
+        chains.setdefault(book_id, []).append((index, command, arg_text))
+
+    # Deal the chains, longest first, into one task per worker of about the same length
+    tree = library.book_index
+    tasks = [[] for _ in range(max_workers or os.cpu_count() or 1)]
+    for task_number, (book_id, commands) in enumerate(sorted(chains.items(), key=lambda chain: -len(chain[1]))):
+        book = tree.search(book_id)
+        state = None if book is tree.NIL else _book_state(book)
+        tasks[task_number % len(tasks)].append((book_id, state, commands))
+
+    first_stamp = library.reservation_sequence + 1
+    outputs = [None] * len(segment)
+    stamps = []
+    final_states = []
+    for task_results in pool.map(_replay_chains, tasks, [first_stamp] * len(tasks)):
+        for chain_outputs, chain_stamps, state in task_results:
+            for index, text in chain_outputs:
+                outputs[index] = text
+            stamps.extend(chain_stamps)
+            if state is not None:
+                final_states.append(state)
+
+    # Renumber the stamps densely in log order, as a sequential run would have numbered them
+    stamps.sort()
+    sequence_of = {stamp: library.reservation_sequence + position for position, stamp in enumerate(stamps, 1)}
+    library.reservation_sequence += len(stamps)
+    for book_id, _, _, availability_status, borrowed_by, reservations in final_states:
+        reservations = [(patron_id, priority_number, sequence_of.get(time_of_reservation, time_of_reservation))
+                        for patron_id, priority_number, time_of_reservation in reservations]
+        library.set_book_state(tree.search(book_id), availability_status, borrowed_by, reservations)
+
+    output_file.write("".join(outputs))
+
+
+def replay_commands(library, lines, output_file, max_workers=None, write_ahead_log=None, segment_size=1 << 16):
+    """
+    Run commands like process_commands, with the same output and final state, but run
+    BorrowBook, ReturnBook and PrintBook on different books in parallel on a process pool.
+
+    Those commands only touch their own book, so consecutive runs of them are split into
+    one dependency chain per book. Every other command is a barrier: it runs on its own,
+    after every command before it, because it changes the tree's shape or reads many books.
+    """
+    segment = []
+    # Mutating lines of the segment, logged once it has run
+    segment_log = []
+    match_command = COMMAND_PATTERN.match
+    handlers = COMMAND_HANDLERS
+
+    def run_segment():
+        _replay_segment(library, segment, output_file, pool, max_workers)
+        for line in segment_log:
+            write_ahead_log.append(line)
+        segment.clear()
+        segment_log.clear()
+
+    with ProcessPoolExecutor(max_workers) as pool:
+        for line in lines:
+            match = match_command(line)
+            if match is None:
+                continue
+            command, arg_text = match.groups()
+            if command not in handlers and command != "Quit":
+                continue
+
+            if command in POINT_COMMANDS:
+                segment.append((command, arg_text))
+                if write_ahead_log is not None and command in MUTATING_COMMANDS:
+                    segment_log.append(line)
+                if len(segment) >= segment_size:
+                    run_segment()
+                continue
+
+            run_segment()
+            if command == "Quit":
+                if output_file is not sys.stdout:
+                    library.quit_program()
+                print("Program Terminated!!", file=output_file)
+                break
+            output_line = run_logged_command(library, handlers[command], command, arg_text, line, output_file,
+                                             write_ahead_log)
+            if output_line is not None:
+                print(output_line, file=output_file)
+
+        run_segment()
+    output_file.flush()
+
+
+def verify_replay(library, lines, max_workers=None):
+    """
+    Replay lines both sequentially, on a copy of the library, and with replay_commands on
+    the library itself. Returns (output, mismatch): the replay's output text, and None if
+    the outputs and final snapshots are identical or a description of the first difference.
+    """
+    lines = list(lines)
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot_filename = os.path.join(directory, "library.bin")
+        library.save_snapshot(snapshot_filename)
+        reference = GatorLibrary.load_snapshot(snapshot_filename, library.engine)
+
+        expected_output = io.StringIO()
+        process_commands(reference, lines, expected_output)
+        output = io.StringIO()
+        replay_commands(library, lines, output, max_workers)
+        expected_text = expected_output.getvalue()
+        text = output.getvalue()
+
+        if text != expected_text:
+            expected_lines = expected_text.splitlines()
+            output_lines = text.splitlines()
+            for line_number, (expected_line, line) in enumerate(zip(expected_lines, output_lines), 1):
+                if expected_line != line:
+                    return text, f"output line {line_number}: expected {expected_line!r}, got {line!r}"
+            return text, f"output has {len(output_lines)} lines, expected {len(expected_lines)}"
+
+        reference.save_snapshot(snapshot_filename)
+        with open(snapshot_filename, "rb") as snapshot_file:
+            expected_state = snapshot_file.read()
+        library.save_snapshot(snapshot_filename)
+        with open(snapshot_filename, "rb") as snapshot_file:
+            if snapshot_file.read() != expected_state:
+                return text, "final library state differs from a sequential run"
+    return text, None
+
+
+class WriteAheadLog:
+    """
+    Append-only log of the mutating commands that ran without error, stored in the command
+    syntax so it replays through process_commands. A BulkInsert is stored as a
+    "# BulkInsert n" line followed by the InsertBook lines of its n records. Records go
+    through a write buffer and are made durable in groups: the log is flushed (and fsynced)
+    once group_size records are pending, or by a background thread once group_interval
+    seconds have passed since the oldest pending one, so a crash loses at most one group.
+
+    The first line of the log names its generation. A snapshot records the generation it
+    already includes, so after compaction the old records are never replayed twice.
+    """
+    HEADER = "# GatorLibrary write-ahead log, generation {}\n"
+    HEADER_PATTERN = re.compile(r"# GatorLibrary write-ahead log, generation (\d+)")
+    BULK_INSERT = "# BulkInsert {}\n"
+    BULK_INSERT_PATTERN = re.compile(r"# BulkInsert (\d+)")
+
+    def __init__(self, filename, group_size=64, group_interval=0.05, fsync=True):
+        self.filename = filename
+        self.group_size = group_size
+        self.group_interval = group_interval
+        self.fsync = fsync
+        self.generation = 0
+        self.log_file = None
+        self.pending = 0
+        self.oldest_pending = 0.0
+        # Records that failed on recovery, as (line number, line, error)
+        self.skipped_records = []
+        # Guards the log file and pending count, shared with the flusher thread
+        self.condition = threading.Condition()
+        self.closed = False
+        self.flusher = None
+        if group_interval > 0:
+            self.flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+            self.flusher.start()
+
+    def recover(self, library):
+        """
+        Replay any records the library does not include yet, then open the log for
+        appending. A record left half-written by a crash is discarded.
+        """
+        generation = None
+        if os.path.exists(self.filename):
+            self._truncate_torn_record()
+            with open(self.filename, "r") as log_file:
+                match = self.HEADER_PATTERN.match(log_file.readline())
+                if match is not None:
+                    generation = int(match.group(1))
+                    if generation > library.log_generation:
+                        self._replay(library, log_file)
+
+        if generation is None or generation <= library.log_generation:
+            self._start_generation(library.log_generation + 1)
+        else:
+            self.generation = generation
+            self.log_file = open(self.filename, "a", buffering=OUTPUT_BUFFER_SIZE)
+
+    def _replay(self, library, log_file):
+        # Apply the records after the header. A record that fails is skipped and reported
+        # on stderr, so one bad record cannot stop every later recovery.
+        handlers = COMMAND_HANDLERS
+        lines = enumerate(log_file, 2)
+        with open(os.devnull, "w") as discard:
+            for number, line in lines:
+                try:
+                    bulk_insert = self.BULK_INSERT_PATTERN.match(line)
+                    if bulk_insert is not None:
+                        count = int(bulk_insert.group(1))
+                        block = [record_line for _, record_line in islice(lines, count)]
+                        if len(block) < count:
+                            raise ValueError(f"only {len(block)} of its {count} records were written")
+                        library.bulk_insert(list(catalog_records(block)))
+                        continue
+                    match = COMMAND_PATTERN.match(line)
+                    if match is None:
+                        continue
+                    command, arg_text = match.groups()
+                    handler = handlers.get(command)
+                    if handler is not None:
+                        handler(library, arg_text, discard)
+                except Exception as error:
+                    self.skipped_records.append((number, line.rstrip("\n"), error))
+                    print(f"{self.filename}:{number}: skipped record {line.strip()!r}: {error}", file=sys.stderr)
+
+    def append(self, line):
+        with self.condition:
+            self._write(line if line.endswith("\n") else line + "\n")
+
+    def append_bulk_insert(self, records):
+        """
+        Append a BulkInsert as one record holding its (book_id, book_name, author_name,
+        availability_status) records.
+        """
+        parts = [self.BULK_INSERT.format(len(records))]
+        parts.extend(f"InsertBook({book_id}, {book_name}, {author_name}, {availability_status})\n"
+                     for book_id, book_name, author_name, availability_status in records)
+        with self.condition:
+            self._write("".join(parts))
+
+    def _write(self, text):
+        self.log_file.write(text)
+        if self.pending == 0:
+            self.oldest_pending = time.monotonic()
+            self.condition.notify()
+        self.pending += 1
+        if self.pending >= self.group_size or time.monotonic() - self.oldest_pending >= self.group_interval:
+            self._commit()
+
+    def commit(self):
+        """
+        Make every appended record durable.
+        """
+        with self.condition:
+            self._commit()
+
+    def _commit(self):
+        if self.pending:
+            self.log_file.flush()
+            if self.fsync:
+                os.fsync(self.log_file.fileno())
+            self.pending = 0
+
+    def _flush_periodically(self):
+        # Commit a group that has waited group_interval without an append to complete it
+        with self.condition:
+            while not self.closed:
+                if not self.pending:
+                    self.condition.wait()
+                    continue
+                delay = self.oldest_pending + self.group_interval - time.monotonic()
+                if delay > 0:
+                    self.condition.wait(delay)
+                else:
+                    self._commit()
+
+    def compact(self, library, snapshot_filename):
+        """
+        Fold the log into a snapshot of the library and start a new, empty generation.
+        """
+        self.commit()
+        library.log_generation = self.generation
+        library.save_snapshot(snapshot_filename)
+        self._start_generation(self.generation + 1)
+
+    def close(self):
+        with self.condition:
+            if self.log_file is not None:
+                self._commit()
+                self.log_file.close()
+                self.log_file = None
+            self.closed = True
+            self.condition.notify()
+        if self.flusher is not None:
+            self.flusher.join()
+
+    def _start_generation(self, generation):
+        with self.condition:
+            if self.log_file is not None:
+                self.log_file.close()
+            temp_filename = f"{self.filename}.tmp"
+            with open(temp_filename, "w") as log_file:
+                log_file.write(self.HEADER.format(generation))
+                log_file.flush()
+                if self.fsync:
+                    os.fsync(log_file.fileno())
+            os.replace(temp_filename, self.filename)
+            self.generation = generation
+            self.log_file = open(self.filename, "a", buffering=OUTPUT_BUFFER_SIZE)
+            self.pending = 0
+
+    def _truncate_torn_record(self):
+        # Cut the file back to the end of its last complete line
+        with open(self.filename, "rb+") as log_file:
+            end = log_file.seek(0, os.SEEK_END)
+            position = end
+            while position > 0:
+                start = max(0, position - OUTPUT_BUFFER_SIZE)
+                log_file.seek(start)
+                newline = log_file.read(position - start).rfind(b"\n")
+                if newline >= 0:
+                    position = start + newline + 1
+                    break
+                position = start
+            if position != end:
+                log_file.truncate(position)
+
+
+class ReadWriteLock:
+    """
+    Lock that many readers can hold at once, or a single writer. Waiting writers block new
+    readers, so a steady stream of reads cannot starve writes.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    def acquire_read(self):
+        with self._condition:
+            while self._writer or self._writers_waiting:
+                self._condition.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._condition:
+            self._readers -= 1
+            if self._readers == 0:
+                self._condition.notify_all()
+
+    def acquire_write(self):
+        with self._condition:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._condition.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+
+    def release_write(self):
+        with self._condition:
+            self._writer = False
+            self._condition.notify_all()
+
+    @contextmanager
+    def reading(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def writing(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class ConcurrentGatorLibrary:
+    """
+    Thread-safe front end to a GatorLibrary that runs command lines from many threads.
+
+    Locking, from coarsest to finest:
+      tree_lock     read-write lock on the tree's shape. InsertBook, BulkInsert, DeleteBook
+                    and CancelAllReservations take it for writing, everything else for reading.
+      state_lock    shared/exclusive lock that keeps commands that read many books apart
+                    from changes to single books. BorrowBook and ReturnBook hold it shared,
+                    so they run alongside each other; every command that is not a point
+                    command holds it exclusively, so it never sees a half-applied change.
+      book locks    striped per-book locks, keyed by book_id. BorrowBook, ReturnBook and
+                    PrintBook hold their book's lock, so PrintBook only waits for changes
+                    to its own book and runs alongside writes to other books.
+      index_lock    the library's plain lock around what BorrowBook and ReturnBook change
+                    beyond their book: subtree availability counts, the patron indexes and
+                    the reservation counter. It is held only for those few updates.
+
+    With record_history, every command appends (sequence, line, result) to history, where
+    sequence is taken while its locks are held. Replaying the lines in sequence order on a
+    plain GatorLibrary must then give the same results, which is how linearizability is
+    checked.
+    """
+    BOOK_LOCK_STRIPES = 256
+
+    def __init__(self, library=None, max_workers=None, record_history=False):
+        self.library = library if library is not None else GatorLibrary()
+        self.tree_lock = ReadWriteLock()
+        self.state_lock = ReadWriteLock()
+        self.book_locks = [threading.Lock() for _ in range(self.BOOK_LOCK_STRIPES)]
+        self.max_workers = max_workers
+        self.executor = None
+        self.history = [] if record_history else None
+        self.sequence = count()
+
+    def execute(self, line):
+        """
+        Run one command line and return the text process_commands would write for it.
+        """
+        match = COMMAND_PATTERN.match(line)
+        if match is None:
+            return ""
+        command, arg_text = match.groups()
+        if command == "Quit":
+            return "Program Terminated!!\n"
+
+        if command in STRUCTURAL_COMMANDS or command == "CancelAllReservations":
+            with self.tree_lock.writing():
+                return self._run(line, command, arg_text)
+
+        with self.tree_lock.reading():
+            position = POINT_COMMANDS.get(command)
+            if position is None:
+                with self.state_lock.writing():
+                    return self._run(line, command, arg_text)
+
+            book_id = int(arg_text.split(",")[position])
+            book_lock = self.book_locks[hash(book_id) % self.BOOK_LOCK_STRIPES]
+            if command == "PrintBook":
+                with book_lock:
+                    return self._run(line, command, arg_text)
+            with self.state_lock.reading(), book_lock:
+                return self._run(line, command, arg_text)
+
+    def _run(self, line, command, arg_text):
+        result = self.library.run_command(command, arg_text)
+        if self.history is not None:
+            self.history.append((next(self.sequence), line, result))
+        return result
+
+    def submit(self, line):
+        """
+        Queue a command line on the thread pool and return its Future.
+        """
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="gator-library")
+        return self.executor.submit(self.execute, line)
+
+    def execute_batch(self, lines):
+        """
+        Run the lines concurrently on the thread pool and return their results in input
+        order. Commands in one batch may run in any order that the locks allow.
+        """
+        return [future.result() for future in [self.submit(line) for line in lines]]
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _shard_closest(library, target_id, k):
+    # The shard's k nearest books as (distance, book_id, details)
+    details = library.details_cache.details
+    return [(abs(target_id - book.book_id), book.book_id, details(book))
+            for book in library.book_index.nearest(target_id, k)]
+
+
+def _shard_books(library, low, high, limit):
+    details = library.details_cache.scan_details
+    return [(book.book_id, details(book)) for book in library.print_books(low, high, limit)]
+
+
+def _shard_rank(library, book_id):
+    tree = library.book_index
+    return len(tree), tree.rank(book_id)
+
+
+def _shard_select(library, k):
+    book = library.book_index.select(k)
+    return None if book is None else library.details_cache.details(book)
+
+
+def _shard_by_author(library, author):
+    details = library.details_cache.details
+    return [(book.book_id, details(book)) for book in library.find_by_author(author)]
+
+
+def _shard_by_title_prefix(library, prefix):
+    return [(book.title, book.book_id, library.details_cache.details(book))
+            for book in library.find_by_title_prefix(prefix)]
+
+
+def _shard_cancel_reservations(library, patron_id):
+    book_ids = sorted(library.patron_reservations.get(patron_id, ()))
+    library.cancel_all_reservations(patron_id)
+    return book_ids
+
+
+SHARD_KEY_ARGUMENTS = dict(POINT_COMMANDS, InsertBook=0, DeleteBook=0)
+
+SHARD_OPERATIONS = {
+    "run": GatorLibrary.run_command,
+    "bulk": GatorLibrary.bulk_insert,
+    "closest": _shard_closest,
+    "books": _shard_books,
+    "count": lambda library, low, high: library.book_index.count_in_range(low, high),
+    "rank": _shard_rank,
+    "size": lambda library: len(library.book_index),
+    "select": _shard_select,
+    "flips": lambda library: library.book_index.color_flips,
+    "author": _shard_by_author,
+    "title": _shard_by_title_prefix,
+    "loans": lambda library, patron_id: sorted(library.patron_loans.get(patron_id, ())),
+    "reservations": lambda library, patron_id: sorted(library.patron_reservations.get(patron_id, ())),
+    "cancel": _shard_cancel_reservations,
+}
+
+
+def _shard_worker(connection, engine="redblack"):
+    """
+    Worker process loop: receive a batch of (operation, *args) requests, run them in order
+    against this shard's library and send back the list of results. None stops the worker.
+    """
+    library = GatorLibrary(engine=engine)
+    operations = SHARD_OPERATIONS
+    while True:
+        requests = connection.recv()
+        if requests is None:
+            break
+        connection.send([operations[request[0]](library, *request[1:]) for request in requests])
+    connection.close()
+
+
+class ShardedGatorLibrary:
+    """
+    A library split across worker processes by book_id range, so commands use more than
+    one core. boundaries are the sorted split points: shard i owns the ids from
+    boundaries[i - 1] up to but not including boundaries[i], and the first and last shards
+    take everything below and above.
+
+    Commands on one book go to the shard that owns it. Commands that span shards are sent to
+    every shard involved and their answers merged: counts are summed, ranks offset by the
+    sizes of the shards below, and lists of books merged in book_id (or title) order.
+    FindClosestBook goes to the owning shard and, on each side, only as many neighbouring
+    shards as it takes to be sure of holding k books, going by the sizes the shards reported
+    at the last flush less the deletes sent to them since.
+    Requests are sent to the workers in batches over pipes and each shard runs its batch in
+    order, so a merged command always sees every earlier command. Output matches a single
+    GatorLibrary except for ColorFlipCount, which is the sum of each shard's own tree.
+    """
+    BATCH_SIZE = 512
+    PAGE_SIZE = 1024
+
+    def __init__(self, boundaries, engine="redblack"):
+        self.boundaries = sorted(boundaries)
+        self.connections = []
+        self.workers = []
+        for _ in range(len(self.boundaries) + 1):
+            router_end, worker_end = multiprocessing.Pipe()
+            worker = multiprocessing.Process(target=_shard_worker, args=(worker_end, engine), daemon=True)
+            worker.start()
+            worker_end.close()
+            self.connections.append(router_end)
+            self.workers.append(worker)
+        self.outboxes = [[] for _ in self.connections]
+        # Commands waiting for their results: (combine, [(shard, request index), ...])
+        self.pending = []
+        # Books in each shard at the last flush, and DeleteBooks queued for it since
+        self.sizes = [0] * len(self.connections)
+        self.queued_deletes = [0] * len(self.connections)
+
+    @classmethod
+    def for_range(cls, num_shards, low, high, engine="redblack"):
+        """
+        Split low..high into num_shards equal book_id ranges.
+        """
+        step = (high - low + 1) / num_shards
+        return cls([low + round(step * i) for i in range(1, num_shards)], engine)
+
+    def shard_of(self, book_id):
+        return bisect_right(self.boundaries, book_id)
+
+    def shards_in_range(self, low, high):
+        return range(self.shard_of(low), self.shard_of(high) + 1)
+
+    def shards_near(self, target_id, k):
+        """
+        Return the range of shards that must hold the k books nearest target_id: its owner,
+        and on each side the nearest shards that are sure to hold at least k books between
+        them. Books in shards further out are farther away than all of those.
+        """
+        low = high = self.shard_of(target_id)
+        below = above = 0
+        while low > 0 and below < k:
+            low -= 1
+            below += self.sizes[low] - self.queued_deletes[low]
+        while high < len(self.connections) - 1 and above < k:
+            high += 1
+            above += self.sizes[high] - self.queued_deletes[high]
+        return range(low, high + 1)
+
+    def process(self, lines, output_file):
+        """
+        Run command lines like process_commands, writing the results to output_file.
+        """
+        for line in lines:
+            match = COMMAND_PATTERN.match(line)
+            if match is None:
+                continue
+            command, arg_text = match.groups()
+            if command == "Quit":
+                self.flush(output_file)
+                print("Program Terminated!!", file=output_file)
+                break
+            if command in COMMAND_HANDLERS:
+                self.route(command, arg_text, output_file)
+                if len(self.pending) >= self.BATCH_SIZE:
+                    self.flush(output_file)
+        self.flush(output_file)
+        output_file.flush()
+
+    def route(self, command, arg_text, output_file):
+        book_argument = SHARD_KEY_ARGUMENTS.get(command)
+        if book_argument is not None:
+            book_id = int(arg_text.split(",")[book_argument])
+            shard = self.shard_of(book_id)
+            if command == "DeleteBook":
+                self.queued_deletes[shard] += 1
+            self.request(itemgetter(0), [(shard, ("run", command, arg_text))])
+        elif command == "PrintBooks":
+            self.flush(output_file)
+            self.write_books(output_file, *[int(arg) for arg in arg_text.split(",")])
+        elif command == "SelectKth":
+            self.flush(output_file)
+            output_file.write(self.select_kth(int(arg_text)))
+        else:
+            self.route_merged(command, arg_text)
+
+    def route_merged(self, command, arg_text):
+        shards = range(len(self.connections))
+        if command == "BulkInsert":
+            filename = split_arguments(arg_text)[0].strip('"')
+            records = [[] for _ in shards]
+            for record in read_catalog(filename):
+                records[self.shard_of(record[0])].append(record)
+            self.request(lambda added: f"Bulk inserted {sum(added)} books from {filename}\n",
+                         [(shard, ("bulk", records[shard])) for shard in shards])
+        elif command in ("FindClosestBook", "FindClosestBooks"):
+            target_id, k = (tuple(map(int, arg_text.split(","))) + (1,))[:2]
+            self.request(lambda candidates: _merge_closest(candidates, k),
+                         [(shard, ("closest", target_id, k)) for shard in self.shards_near(target_id, k)])
+        elif command == "ColorFlipCount":
+            self.request(lambda flips: f"Colour Flip Count: {sum(flips)}\n", [(shard, ("flips",)) for shard in shards])
+        elif command in ("CountBooks", "CountAvailableBooks"):
+            low, high = map(int, arg_text.split(","))
+            column, label = (0, "Book Count") if command == "CountBooks" else (1, "Available Book Count")
+            self.request(lambda counts: f"{label}: {sum(shard_counts[column] for shard_counts in counts)}\n",
+                         [(shard, ("count", low, high)) for shard in self.shards_in_range(low, high)])
+        elif command == "RankOf":
+            book_id = int(arg_text)
+            owner = self.shard_of(book_id)
+            self.request(lambda ranks: _merge_rank(book_id, ranks), [(shard, ("rank", book_id)) for shard in range(owner + 1)])
+        elif command == "FindByAuthor":
+            author = split_arguments(arg_text)[0]
+            self.request(lambda found: _merge_books(heapq.merge(*found), f"No books by {author} found in the Library"),
+                         [(shard, ("author", author)) for shard in shards])
+        elif command == "FindByTitlePrefix":
+            prefix = split_arguments(arg_text)[0]
+            self.request(lambda found: _merge_books(heapq.merge(*found), f"No books with title prefix {prefix} found in the Library"),
+                         [(shard, ("title", prefix)) for shard in shards])
+        elif command in ("PatronLoans", "PatronReservations"):
+            patron_id = int(arg_text)
+            operation, label = ("loans", "Borrowed") if command == "PatronLoans" else ("reservations", "Reserved")
+            self.request(lambda found: f"Patron {patron_id} {label} Books = [{', '.join(map(str, heapq.merge(*found)))}]\n",
+                         [(shard, (operation, patron_id)) for shard in shards])
+        elif command == "CancelAllReservations":
+            patron_id = int(arg_text)
+            self.request(lambda found: cancelled_reservations_message(patron_id, list(heapq.merge(*found))) + "\n",
+                         [(shard, ("cancel", patron_id)) for shard in shards])
+
+    def request(self, combine, shard_requests):
+        """
+        Queue a command as requests to one or more shards; combine turns their results, in
+        the order given, into the command's output text.
+        """
+        slots = []
+        for shard, shard_request in shard_requests:
+            outbox = self.outboxes[shard]
+            slots.append((shard, len(outbox)))
+            outbox.append(shard_request)
+        self.pending.append((combine, slots))
+
+    def flush(self, output_file):
+        """
+        Send every queued request, then write the pending commands' outputs in order.
+        """
+        sent = [shard for shard, outbox in enumerate(self.outboxes) if outbox]
+        for shard in sent:
+            # Each batch ends by asking for the shard's size, for routing FindClosestBook
+            self.outboxes[shard].append(("size",))
+            self.connections[shard].send(self.outboxes[shard])
+            self.outboxes[shard] = []
+        results = {shard: self.connections[shard].recv() for shard in sent}
+        for shard in sent:
+            self.sizes[shard] = results[shard].pop()
+            self.queued_deletes[shard] = 0
+        write = output_file.write
+        for combine, slots in self.pending:
+            write(combine([results[shard][index] for shard, index in slots]))
+        self.pending = []
+
+    def call(self, shard, *request):
+        self.connections[shard].send([request])
+        return self.connections[shard].recv()[0]
+
+    def write_books(self, output_file, book_id1, book_id2, limit=None, after_id=None):
+        # The shards hold consecutive ranges, so their pages in shard order are already sorted
+        low = book_id1 if after_id is None else max(book_id1, after_id + 1)
+        write = output_file.write
+        for shard in self.shards_in_range(low, book_id2):
+            shard_low = low
+            while limit is None or limit > 0:
+                page_size = self.PAGE_SIZE if limit is None else min(limit, self.PAGE_SIZE)
+                page = self.call(shard, "books", shard_low, book_id2, page_size)
+                for _, details in page:
+                    write(details)
+                    write("\n")
+                if limit is not None:
+                    limit -= len(page)
+                if len(page) < page_size:
+                    break
+                shard_low = page[-1][0] + 1
+        write("\n")
+
+    def select_kth(self, k):
+        remaining = k
+        if remaining >= 1:
+            for shard in range(len(self.connections)):
+                size = self.call(shard, "size")
+                if remaining <= size:
+                    return self.call(shard, "select", remaining) + "\n"
+                remaining -= size
+        return f"No book with rank {k} in the Library\n"
+
+    def close(self):
+        for connection in self.connections:
+            connection.send(None)
+            connection.close()
+        for worker in self.workers:
+            worker.join()
+        self.connections = []
+        self.workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _merge_closest(candidates, k):
+    # Take the k nearest over all shards, plus the book tied with the k-th, as RedBlackTree.nearest does
+    candidates = sorted(candidate for shard_candidates in candidates for candidate in shard_candidates)
+    if not candidates:
+        return "No closest book found\n"
+    if len(candidates) > k and candidates[k][0] == candidates[k - 1][0]:
+        k += 1
+    return "".join(details + "\n" for _, _, details in candidates[:k])
+
+
+def _merge_rank(book_id, ranks):
+    *lower, (_, rank) = ranks
+    if rank is None:
+        return f"Book {book_id} not found in the Library\n"
+    return f"Book {book_id} Rank: {rank + sum(size for size, _ in lower)}\n"
+
+
+def _merge_books(found, not_found_message):
+    text = "".join(entry[-1] + "\n" for entry in found)
+    if not text:
+        return not_found_message + "\n"
+    return text + "\n"
+
+
+class LibraryServer:
+    """
+    Asyncio server that speaks the command-file syntax over TCP or a Unix socket. Each
+    request is one command line and its response is the text the command would write to the
+    output file, followed by a line holding a single "." so clients can pipeline requests
+    and still split the responses apart.
+
+    Every complete line that arrived in one read is run before anything is written, and all
+    of their responses go out in one write. The server then waits for the socket to drain
+    before reading again, so a client that stops reading its responses is also stopped from
+    sending more. Commands run on the event loop one at a time, so they need no locking. A
+    command that raises gets an "Error: ..." response, is not logged, and leaves the
+    connection open.
+    """
+    END_OF_RESPONSE = ".\n"
+    READ_SIZE = 1 << 16
+    MAX_LINE_LENGTH = 1 << 20
+
+    def __init__(self, library=None, write_ahead_log=None, write_buffer_limit=4 * OUTPUT_BUFFER_SIZE,
+                 metrics=None):
+        self.library = library if library is not None else GatorLibrary()
+        self.write_ahead_log = write_ahead_log
+        self.metrics = metrics
+        self.commands_seen = 0
+        self.write_buffer_limit = write_buffer_limit
+        self.server = None
+
+    async def start(self, address):
+        """
+        Listen on "unix:PATH" or "HOST:PORT" (port 0 picks a free port) and return the
+        address actually bound.
+        """
+        if address.startswith("unix:"):
+            path = address[len("unix:"):]
+            self.server = await asyncio.start_unix_server(self.handle_connection, path=path)
+            return address
+        host, _, port = address.rpartition(":")
+        self.server = await asyncio.start_server(self.handle_connection, host or None, int(port))
+        bound_host, bound_port = self.server.sockets[0].getsockname()[:2]
+        return f"{bound_host}:{bound_port}"
+
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+
+    async def handle_connection(self, reader, writer):
+        writer.transport.set_write_buffer_limits(high=self.write_buffer_limit)
+        pending = b""
+        try:
+            while True:
+                data = await reader.read(self.READ_SIZE)
+                if not data:
+                    break
+                pending += data
+                lines = pending.split(b"\n")
+                pending = lines.pop()
+                if len(pending) > self.MAX_LINE_LENGTH:
+                    break
+
+                responses, quit_requested = self.run_lines(lines)
+                if responses:
+                    writer.write("".join(responses).encode())
+                    await writer.drain()
+                if quit_requested:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def run_lines(self, lines):
+        """
+        Run a batch of request lines and return (responses, quit_requested). Mutating
+        commands are made durable in the write-ahead log before any response is returned. A
+        command that raises is answered with an error line instead of its output.
+        """
+        responses = []
+        quit_requested = False
+        library = self.library
+        write_ahead_log = self.write_ahead_log
+        metrics = self.metrics
+        end_of_response = self.END_OF_RESPONSE
+
+        for raw_line in lines:
+            line = raw_line.decode(errors="replace").rstrip("\r")
+            if not line.strip():
+                continue
+            match = COMMAND_PATTERN.match(line)
+            if match is None:
+                responses.append(end_of_response)
+                continue
+            command, arg_text = match.groups()
+            if command == "Quit":
+                responses.append("Program Terminated!!\n" + end_of_response)
+                quit_requested = True
+                break
+            self.commands_seen += 1
+            try:
+                if metrics is None or self.commands_seen % metrics.latency_sample:
+                    response = library.run_command(command, arg_text, line, write_ahead_log)
+                else:
+                    start = perf_counter()
+                    response = library.run_command(command, arg_text, line, write_ahead_log)
+                    metrics.observe(command, perf_counter() - start)
+            except Exception as error:
+                response = f"Error: {command}({arg_text}) failed: {error}\n"
+            responses.append(response + end_of_response)
+
+        if write_ahead_log is not None:
+            write_ahead_log.commit()
+        return responses, quit_requested
+
+
+def open_library(snapshot_filename=None, wal_filename=None, group_commit=64, fsync=True, engine="redblack",
+                 mapped_filename=None):
+    """
+    Return (library, write_ahead_log): the library restored from the snapshot if there is
+    one, with the log's missing records replayed on top. write_ahead_log is None without a
+    wal_filename. engine names the book index to use, one of BOOK_INDEX_ENGINES. With a
+    mapped_filename, the library is instead the MappedGatorLibrary kept in that file.
+    """
+    if mapped_filename is not None:
+        return MappedGatorLibrary(mapped_filename), None
+
+    # With a snapshot file, start from the saved state if there is one and save it again at the end
+    if snapshot_filename is not None and os.path.exists(snapshot_filename):
+        library = GatorLibrary.load_snapshot(snapshot_filename, engine)
+    else:
+        library = GatorLibrary(engine=engine)
+
+    # With a write-ahead log, first replay what the snapshot is missing, then log every change
+    write_ahead_log = None
+    if wal_filename is not None:
+        write_ahead_log = WriteAheadLog(wal_filename, group_commit, fsync=fsync)
+        write_ahead_log.recover(library)
+    return library, write_ahead_log
+
+
+def close_library(library, write_ahead_log, snapshot_filename=None):
+    """
+    Save the library's final state: fold the log into the snapshot, or just save the
+    snapshot when there is no log. A mapped library commits its file.
+    """
+    if isinstance(library, MappedGatorLibrary):
+        library.close()
+        return
+    if write_ahead_log is not None:
+        if snapshot_filename is not None:
+            write_ahead_log.compact(library, snapshot_filename)
+        write_ahead_log.close()
+    elif snapshot_filename is not None:
+        library.save_snapshot(snapshot_filename)
+
+
+def serve(address, snapshot_filename=None, wal_filename=None, group_commit=64, fsync=True,
+          metrics_filename=None, engine="redblack", mapped_filename=None, search_metrics=False):
+    """
+    Serve the library on address until interrupted, then save it like main() does.
+    """
+    library, write_ahead_log = open_library(snapshot_filename, wal_filename, group_commit, fsync, engine,
+                                            mapped_filename)
+    metrics = Metrics().attach(library, search_metrics) if metrics_filename is not None else None
+    server = LibraryServer(library, write_ahead_log, metrics=metrics)
+
+    async def run():
+        bound_address = await server.start(address)
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signal_number, server.close)
+        print(f"Serving on {bound_address}", file=sys.stderr, flush=True)
+        try:
+            await server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+
+    try:
+        asyncio.run(run())
+    finally:
+        if write_ahead_log is not None:
+            write_ahead_log.commit()
+    close_library(library, write_ahead_log, snapshot_filename)
+    if metrics is not None:
+        metrics.write(metrics_filename)
+
+
+def main(input_filename, output_filename=None, flush_every=None, buffer_size=OUTPUT_BUFFER_SIZE,
+         snapshot_filename=None, wal_filename=None, group_commit=64, fsync=True,
+         replay_workers=None, verify=False, metrics_filename=None, engine="redblack", mapped_filename=None,
+         shards=None, shard_range=(1, 100000), search_metrics=False):
+    if shards is not None:
+        library = ShardedGatorLibrary.for_range(shards, *shard_range, engine)
+        write_ahead_log = None
+    else:
+        library, write_ahead_log = open_library(snapshot_filename, wal_filename, group_commit, fsync, engine,
+                                                mapped_filename)
+    metrics = Metrics().attach(library, search_metrics) if metrics_filename is not None else None
+    mismatch = None
+
+    def run(input_file, output_file):
+        nonlocal mismatch
+        if verify:
+            # Check the parallel replay against a sequential one before writing its output
+            output, mismatch = verify_replay(library, input_file, replay_workers)
+            output_file.write(output)
+        elif shards is not None:
+            library.process(input_file, output_file)
+        elif replay_workers is not None:
+            replay_commands(library, input_file, output_file, replay_workers, write_ahead_log)
+        else:
+            process_commands(library, input_file, output_file, flush_every, write_ahead_log, metrics)
+
+    try:
+        # "-" reads commands from stdin and, unless an output file is given, writes results to stdout
+        if input_filename == "-" and output_filename is None:
+            run(sys.stdin, sys.stdout)
+        else:
+            input_file = sys.stdin if input_filename == "-" else open(input_filename, "r")
+            if output_filename is None:
+                output_filename = f"{input_filename.split('.')[0]}_output_file.txt"
+
+            with input_file, open(output_filename, "w", buffering=buffer_size) as output_file:
+                run(input_file, output_file)
+    finally:
+        if write_ahead_log is not None:
+            write_ahead_log.commit()
+        if shards is not None:
+            library.close()
+        elif mapped_filename is not None:
+            # Commit the pages changed before a failing command too, rather than lose the run
+            close_library(library, None)
+
+    if shards is None and mapped_filename is None:
+        close_library(library, write_ahead_log, snapshot_filename)
+    if metrics is not None:
+        metrics.write(metrics_filename)
+    if verify:
+        print(f"Replay verification failed: {mismatch}" if mismatch else "Replay verified", file=sys.stderr)
+        if mismatch:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="GatorLibrary command processor")
+    parser.add_argument("input_filename", nargs="?", default=None,
+                        help='command file to process, or "-" for stdin')
+    parser.add_argument("-o", "--output", dest="output_filename", default=None,
+                        help="output file (default: <input>_output_file.txt, or stdout for stdin)")
+    parser.add_argument("--flush-every", type=int, default=None, metavar="N",
+                        help="flush the output after every N commands")
+    parser.add_argument("--serve", dest="address", default=None, metavar="ADDRESS",
+                        help='serve commands over the network on "HOST:PORT" or "unix:PATH" instead')
+    parser.add_argument("--snapshot", dest="snapshot_filename", default=None, metavar="FILE",
+                        help="restore the library from FILE if it exists, and save it there on exit")
+    parser.add_argument("--wal", dest="wal_filename", default=None, metavar="FILE",
+                        help="write-ahead log of mutating commands, replayed on startup")
+    parser.add_argument("--group-commit", type=int, default=64, metavar="N",
+                        help="make the write-ahead log durable every N records (default: 64)")
+    parser.add_argument("--no-fsync", dest="fsync", action="store_false",
+                        help="flush the write-ahead log without fsync")
+    parser.add_argument("--replay-workers", type=int, default=None, metavar="N",
+                        help="replay commands on different books in parallel on N worker processes")
+    parser.add_argument("--verify-replay", dest="verify", action="store_true",
+                        help="also replay sequentially and check the output and final state are identical")
+    parser.add_argument("--metrics", dest="metrics_filename", default=None, metavar="FILE",
+                        help="record command latencies and tree, heap, cache and index metrics, and write "
+                             "them to FILE on exit (Prometheus text for .prom, else a JSON line)")
+    parser.add_argument("--search-metrics", action="store_true",
+                        help="with --metrics, also count search depth and hit rates and index lookups, "
+                             "at the cost of a wrapper around every search")
+    parser.add_argument("--engine", choices=sorted(BOOK_INDEX_ENGINES), default="redblack",
+                        help="ordered index that holds the books: the red-black tree (default) or "
+                             "blocked sorted lists")
+    parser.add_argument("--mapped", dest="mapped_filename", default=None, metavar="FILE",
+                        help="keep the books in the memory-mapped catalog FILE instead of memory, "
+                             "committing changes on exit; the author, title and patron commands are unavailable")
+    parser.add_argument("--shards", type=int, default=None, metavar="N",
+                        help="split the books by book_id range across N worker processes")
+    parser.add_argument("--shard-range", type=int, nargs=2, default=(1, 100000), metavar=("LOW", "HIGH"),
+                        help="book_id range that --shards splits evenly; ids outside it go to the first "
+                             "or last shard (default: 1 100000)")
+    cli_args = parser.parse_args()
+
+    if cli_args.search_metrics and cli_args.metrics_filename is None:
+        parser.error("--search-metrics requires --metrics")
+    if cli_args.mapped_filename is not None and (cli_args.snapshot_filename or cli_args.wal_filename or
+                                                 cli_args.replay_workers or cli_args.verify):
+        parser.error("--mapped cannot be combined with --snapshot, --wal, --replay-workers or --verify-replay")
+    if cli_args.shards is not None and (cli_args.shards < 1 or cli_args.address or cli_args.snapshot_filename or
+                                        cli_args.wal_filename or cli_args.replay_workers or cli_args.verify or
+                                        cli_args.metrics_filename or cli_args.mapped_filename):
+        parser.error("--shards must be at least 1, and cannot be combined with --serve, --snapshot, --wal, "
+                     "--replay-workers, --verify-replay, --metrics or --mapped")
+    if cli_args.address is not None:
+        serve(cli_args.address, cli_args.snapshot_filename, cli_args.wal_filename,
+              cli_args.group_commit, cli_args.fsync, cli_args.metrics_filename, cli_args.engine,
+              cli_args.mapped_filename, cli_args.search_metrics)
+    elif cli_args.input_filename is None:
+        parser.error("an input file or --serve is required")
+    else:
+        main(cli_args.input_filename, cli_args.output_filename, cli_args.flush_every,
+             snapshot_filename=cli_args.snapshot_filename, wal_filename=cli_args.wal_filename,
+             group_commit=cli_args.group_commit, fsync=cli_args.fsync,
+             replay_workers=cli_args.replay_workers, verify=cli_args.verify,
+             metrics_filename=cli_args.metrics_filename, engine=cli_args.engine,
+             mapped_filename=cli_args.mapped_filename, shards=cli_args.shards, shard_range=cli_args.shard_range,
+             search_metrics=cli_args.search_metrics)